@@ -0,0 +1,406 @@
+"""
+MIC YST Plate Reader - Batch Entry Point
+Runs the full pipeline over many plate images on a process pool.
+
+Usage:
+    python batch.py <directory|glob|manifest> [--output-dir <dir>] [--workers <n>]
+                    [--outputs annotated,heatmap,csv,debug | --only mic]
+                    [--trace-dir <dir>] [--memory [--mem-budget <MB>]]
+                    [--cache-dir <dir>] [--resume] [--rig <name>]
+
+Inputs:
+    directory  every image file directly inside the directory
+    glob       a quoted pattern such as "plates/*.jpg"
+    manifest   a .txt/.lst file with one image path per line
+               (relative paths are resolved against the manifest's folder,
+               blank lines and lines starting with '#' are ignored)
+
+--trace-dir saves a Chrome trace (<name>_trace.json) per image; the
+per-stage summary is also kept in each image's record.
+--memory measures memory per stage in every worker (see tracing.py) and
+reports each image's peak RSS, which is what a worker needs to be sized for.
+--cache-dir serves images seen before from the result cache (see main.py).
+--rig applies a fixed-rig profile to every image (see main.py).
+Outputs are named after the image file; images that share a file name get a
+short path digest appended (<name>_<digest>_annotated.png, ...).
+A worker that dies (segfault, OOM kill) fails only the images it was
+running; the pool is restarted and the batch carries on.
+
+Every finished image is recorded in a checkpoint manifest
+(<output-dir>/batch_manifest.json, rewritten atomically after each image)
+with its status, outputs, file signature and the pipeline parameter hash.
+--resume skips images whose entry is 'ok' for the same file, parameters and
+requested outputs (and whose output files still exist), so a batch that
+died halfway only reruns the failed and missing images. An image whose
+worker died is recorded with a crash count before the pool is restarted
+(images that were running next to it are first retried one at a time, so
+only the culprit is recorded); once the same file has crashed MAX_CRASHES
+times, --resume skips it instead of feeding it into the same crash again.
+"""
+
+import sys
+import os
+import io
+import glob
+import time
+import hashlib
+import contextlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import state_file
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+MANIFEST_EXTENSIONS = ('.txt', '.lst')
+CHECKPOINT_FILE_NAME = 'batch_manifest.json'
+MAX_CRASHES = 2  # --resume gives up on an image after it killed this many workers
+
+
+def collect_images(source: str) -> list:
+    """Resolve a directory, glob pattern or manifest file into image paths."""
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)]
+        paths = [p for p in paths
+                 if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS)]
+    elif os.path.isfile(source) and source.lower().endswith(MANIFEST_EXTENSIONS):
+        base_dir = os.path.dirname(os.path.abspath(source))
+        paths = []
+        with open(source, encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    elif os.path.isfile(source):
+        paths = [source]
+    else:
+        paths = [p for p in glob.glob(source)
+                 if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS)]
+
+    return sorted(paths)
+
+
+def output_names(image_paths: list) -> dict:
+    """
+    Map each image to the stem of its output files.
+    Images that share a file name (a/plate1.jpg, b/plate1.jpg) get a short
+    digest of their absolute path appended so their outputs don't overwrite
+    each other; the suffix is stable, so --resume finds the same files.
+    """
+    stems = {p: os.path.splitext(os.path.basename(p))[0] for p in image_paths}
+    counts = {}
+    for stem in stems.values():
+        counts[stem] = counts.get(stem, 0) + 1
+    names = {}
+    for path, stem in stems.items():
+        if counts[stem] > 1:
+            suffix = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]
+            stem = f"{stem}_{suffix}"
+        names[path] = stem
+    return names
+
+
+def _signature(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _is_complete(entry: dict, signature: list, params: str, outputs) -> bool:
+    """True if a checkpoint entry already covers this file, parameters and outputs."""
+    return (entry is not None
+            and entry['status'] == 'ok'
+            and entry['signature'] == signature
+            and entry['params_hash'] == params
+            and set(outputs) <= set(entry['requested'])
+            and all(os.path.exists(p) for p in entry['outputs']))
+
+
+def _is_crashing(entry: dict, signature: list, params: str) -> bool:
+    """True if this file has repeatedly killed its worker under these parameters."""
+    return (entry is not None
+            and entry.get('crashes', 0) >= MAX_CRASHES
+            and entry['signature'] == signature
+            and entry['params_hash'] == params)
+
+
+def _init_worker():
+    # One OpenCV thread per process: the pool already provides the parallelism
+    import cv2
+    cv2.setNumThreads(1)
+
+
+def process_image(image_path: str, output_dir: str, outputs=None, trace_dir: str = None,
+                  memory: bool = False, mem_budget: float = None,
+                  cache_dir: str = None, rig: str = None, base_name: str = None) -> dict:
+    """
+    Run the pipeline on one image inside a worker process.
+    Never raises: failures are reported in the returned dict so that one bad
+    image cannot take down the rest of the batch. base_name overrides the
+    output file stem (see output_names).
+    """
+    import tracing
+    from main import run_pipeline, DEFAULT_OUTPUTS
+    from rig_profile import load_profile
+
+    tracer = None
+    if trace_dir or memory:
+        tracer = tracing.start(os.path.basename(image_path), memory, mem_budget)
+    start = time.perf_counter()
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log), tracing.span('pipeline'):
+            results, *paths = run_pipeline(
+                image_path, output_dir, DEFAULT_OUTPUTS if outputs is None else outputs,
+                cache_dir, load_profile(rig) if rig else None, base_name=base_name)
+    except (Exception, SystemExit) as e:
+        if tracer:
+            tracing.stop()
+        # run_pipeline exits on unreadable images after printing the reason
+        if isinstance(e, SystemExit):
+            lines = log.getvalue().strip().splitlines()
+            error = lines[-1].strip() if lines else f"exit code {e.code}"
+        else:
+            error = f"{type(e).__name__}: {e}"
+        return {
+            'image': image_path,
+            'status': 'failed',
+            'error': error,
+            'traceback': traceback.format_exc(),
+            'seconds': time.perf_counter() - start,
+        }
+
+    record = {
+        'image': image_path,
+        'status': 'ok',
+        'results': results,
+        'outputs': [p for p in paths if p],
+        'seconds': time.perf_counter() - start,
+    }
+    if tracer:
+        tracing.stop()
+        if trace_dir:
+            base_name = base_name or os.path.splitext(os.path.basename(image_path))[0]
+            tracer.save(os.path.join(trace_dir, f"{base_name}_trace.json"))
+        record['trace_summary'] = tracer.summary()
+        if memory:
+            record['peak_rss_mb'] = record['trace_summary'][0].get('rss_peak_mb')
+            record['memory_warnings'] = [line for line in log.getvalue().splitlines()
+                                         if 'bellek bütçesini aştı' in line]
+    return record
+
+
+def crash_record(image_path: str, seconds: float) -> dict:
+    """Failure record for an image whose worker process died (segfault, OOM kill)."""
+    return {
+        'image': image_path,
+        'status': 'failed',
+        'error': 'İşçi süreç çöktü (segfault / bellek yetersiz)',
+        'seconds': seconds,
+        'crashed': True,
+    }
+
+
+def run_batch(image_paths: list, output_dir: str = '.', workers: int = None,
+              outputs=None, trace_dir: str = None, memory: bool = False,
+              mem_budget: float = None, cache_dir: str = None,
+              resume: bool = False, rig: str = None) -> list:
+    """Fan run_pipeline out over a process pool and report throughput."""
+    from main import DEFAULT_OUTPUTS
+    from result_cache import params_hash
+    from rig_profile import load_profile, profile_digest
+
+    outputs = DEFAULT_OUTPUTS if outputs is None else tuple(outputs)
+    params = params_hash()
+    if rig:
+        params = f"{params}:rig:{profile_digest(load_profile(rig))}"
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE_NAME)
+    checkpoint = state_file.load(checkpoint_path)
+    entries = checkpoint.setdefault('images', {})
+
+    signatures = {p: _signature(p) for p in image_paths}
+    if resume:
+        total = len(image_paths)
+        image_paths = [p for p in image_paths
+                       if not _is_complete(entries.get(os.path.abspath(p)), signatures[p],
+                                           params, outputs)]
+        print(f"[INFO] Devam: {total - len(image_paths)}/{total} görüntü zaten tamamlanmış")
+        crashing = [p for p in image_paths
+                    if _is_crashing(entries.get(os.path.abspath(p)), signatures[p], params)]
+        for path in crashing:
+            print(f"[WARN] Atlanıyor, işçi süreci {MAX_CRASHES} kez çökertti: {path}")
+        image_paths = [p for p in image_paths if p not in crashing]
+
+    workers = workers or os.cpu_count() or 1
+    workers = max(1, min(workers, len(image_paths) or 1))
+
+    print(f"[INFO] {len(image_paths)} görüntü, {workers} işçi süreç")
+    if trace_dir:
+        os.makedirs(trace_dir, exist_ok=True)
+
+    names = output_names(image_paths)
+    records = []
+    start = time.perf_counter()
+
+    def finish(record):
+        records.append(record)
+        key = os.path.abspath(record['image'])
+        previous = entries.get(key)
+        crashes = 0
+        if record.get('crashed'):
+            crashes = 1
+            if previous and previous['signature'] == signatures[record['image']]:
+                crashes += previous.get('crashes', 0)
+        entries[key] = {
+            'status': record['status'],
+            'outputs': [os.path.abspath(p) for p in record.get('outputs', [])],
+            'requested': list(outputs),
+            'error': record.get('error'),
+            'seconds': round(record['seconds'], 3),
+            'signature': signatures[record['image']],
+            'params_hash': params,
+            'crashes': crashes,
+            'finished_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        state_file.save(checkpoint, checkpoint_path)
+        done = len(records)
+        name = os.path.basename(record['image'])
+        if record['status'] == 'ok':
+            mem = f", {record['peak_rss_mb']:.0f} MB" if record.get('peak_rss_mb') else ''
+            print(f"[{done}/{len(image_paths)}] ✓ {name} ({record['seconds']:.2f} s{mem})")
+            for warning in record.get('memory_warnings', []):
+                print(f"       {warning}")
+        else:
+            print(f"[{done}/{len(image_paths)}] ✗ {name}: {record['error']}")
+
+    # At most `workers` images are in flight, so when a worker dies and
+    # breaks the pool only the images that were actually running are lost.
+    # Those are retried one at a time to find the one that kills its worker.
+    queue = list(image_paths)
+    suspects = set()
+    while queue:
+        in_flight = {}   # future -> (path, submit time)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            try:
+                while queue or in_flight:
+                    while queue and len(in_flight) < workers:
+                        if in_flight and (queue[0] in suspects or
+                                          any(p in suspects for p, _ in in_flight.values())):
+                            break
+                        path = queue.pop(0)
+                        future = pool.submit(process_image, path, output_dir, outputs,
+                                             trace_dir, memory, mem_budget, cache_dir, rig,
+                                             names[path])
+                        in_flight[future] = (path, time.perf_counter())
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()  # raises BrokenProcessPool before anything is recorded
+                    for future in done:
+                        in_flight.pop(future)
+                        finish(future.result())
+            except BrokenProcessPool:
+                crashed = [(path, submitted) for future, (path, submitted) in in_flight.items()
+                           if not future.done() or future.exception() is not None]
+                for future in in_flight:
+                    if future.done() and future.exception() is None:
+                        finish(future.result())
+                if len(crashed) > 1 and not all(p in suspects for p, _ in crashed):
+                    print(f"[WARN] Bir işçi süreç çöktü, {len(crashed)} görüntü tek tek "
+                          f"yeniden denenecek")
+                    suspects.update(p for p, _ in crashed)
+                    queue[:0] = [p for p, _ in crashed]
+                    continue
+                print("[WARN] Bir işçi süreç çöktü, havuz yeniden başlatılıyor")
+                # Checkpointed before the pool restarts, so --resume knows
+                for path, submitted in crashed:
+                    finish(crash_record(path, time.perf_counter() - submitted))
+
+    elapsed = time.perf_counter() - start
+    ok = sum(1 for r in records if r['status'] == 'ok')
+    rate = len(records) / elapsed if elapsed > 0 else 0.0
+
+    print()
+    print(f"[INFO] {ok}/{len(records)} başarılı, {len(records) - ok} hatalı")
+    print(f"[INFO] Toplam süre: {elapsed:.1f} s, {rate:.2f} görüntü/s")
+    peaks = [r['peak_rss_mb'] for r in records if r.get('peak_rss_mb')]
+    if peaks:
+        print(f"[INFO] İşçi başına tepe RSS: en fazla {max(peaks):.0f} MB "
+              f"(≈{max(peaks) * workers:.0f} MB toplam, {workers} işçi)")
+
+    return records
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Kullanım: python batch.py <klasör|glob|manifest> [--output-dir <klasör>] [--workers <n>] "
+              "[--outputs annotated,heatmap,csv,debug | --only mic] [--trace-dir <klasör>] "
+              "[--memory [--mem-budget <MB>]] [--cache-dir <klasör>] [--resume] [--rig <ad>]")
+        sys.exit(1)
+
+    source = sys.argv[1]
+    output_dir = '.'
+    workers = None
+    trace_dir = None
+    memory = '--memory' in sys.argv
+    resume = '--resume' in sys.argv
+    mem_budget = None
+    cache_dir = None
+    rig = None
+
+    if '--output-dir' in sys.argv:
+        idx = sys.argv.index('--output-dir')
+        if idx + 1 < len(sys.argv):
+            output_dir = sys.argv[idx + 1]
+
+    if '--workers' in sys.argv:
+        idx = sys.argv.index('--workers')
+        if idx + 1 < len(sys.argv):
+            workers = int(sys.argv[idx + 1])
+
+    if '--trace-dir' in sys.argv:
+        idx = sys.argv.index('--trace-dir')
+        if idx + 1 < len(sys.argv):
+            trace_dir = sys.argv[idx + 1]
+
+    if '--mem-budget' in sys.argv:
+        idx = sys.argv.index('--mem-budget')
+        if idx + 1 < len(sys.argv):
+            mem_budget = float(sys.argv[idx + 1])
+
+    if '--cache-dir' in sys.argv:
+        idx = sys.argv.index('--cache-dir')
+        if idx + 1 < len(sys.argv):
+            cache_dir = sys.argv[idx + 1]
+
+    if '--rig' in sys.argv:
+        idx = sys.argv.index('--rig')
+        if idx + 1 < len(sys.argv):
+            rig = sys.argv[idx + 1]
+            from rig_profile import load_profile
+            try:
+                load_profile(rig)
+            except ValueError as e:
+                print(f"[ERROR] {e}")
+                sys.exit(1)
+
+    from main import parse_outputs
+    try:
+        outputs = parse_outputs(sys.argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    image_paths = collect_images(source)
+    if not image_paths:
+        print(f"[ERROR] Görüntü bulunamadı: {source}")
+        sys.exit(1)
+
+    records = run_batch(image_paths, output_dir, workers, outputs, trace_dir, memory,
+                        mem_budget, cache_dir, resume, rig)
+    sys.exit(0 if all(r['status'] == 'ok' for r in records) else 2)
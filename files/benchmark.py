@@ -0,0 +1,255 @@
+"""
+MIC YST Plate Reader - Benchmark Suite
+Times every pipeline stage in isolation at several image sizes.
+
+Usage:
+    python benchmark.py run [--images <img> ...] [--sizes 0.5,1,2]
+                            [--synthetic 1,12,50] [--repeat <n>] [--warmup <n>]
+                            [--output <bench.json>]
+    python benchmark.py compare <baseline.json> <current.json>
+                            [--threshold 0.20] [--min-ms 1.0]
+
+run:
+    Each image is resized by every factor in --sizes. The stage inputs are
+    prepared once, then each stage runs --warmup untimed and --repeat timed
+    times. Median, p95, min and mean are written to JSON together with the
+    library versions and machine details.
+    Default image: ../test_images/*.jpeg
+    --synthetic adds one generated plate per listed megapixel count
+    (synthetic_plate.py, fixed seed) so sizes beyond the real photos can be
+    measured.
+
+compare:
+    Exits with status 1 when any stage's median is more than --threshold
+    (fraction) slower than in the baseline and the slowdown is larger than
+    --min-ms (filters timer noise on sub-millisecond stages).
+"""
+
+import sys
+import os
+import io
+import glob
+import json
+import time
+import platform
+import tempfile
+import contextlib
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from plate_detector import detect_plate
+from well_extractor import detect_circles, fit_grid_robust, sample_well_colors, _naive_grid
+from color_classifier import classify_wells
+from mic_calculator import calculate_mic
+from visualizer import create_annotated_image, create_score_heatmap, save_csv_report
+from main import analyze_image
+
+DEFAULT_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'test_images', '*.jpeg')
+DEFAULT_SIZES = (0.5, 1.0, 2.0)
+
+
+def _quiet(fn, *args):
+    """Call fn with stdout discarded (the stages print progress)."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return fn(*args)
+
+
+def time_stage(fn, args: tuple, repeat: int, warmup: int) -> dict:
+    """Run fn(*args) warmup + repeat times and summarize the timed runs in ms."""
+    for _ in range(warmup):
+        _quiet(fn, *args)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _quiet(fn, *args)
+        times.append((time.perf_counter() - start) * 1000)
+    times = np.array(times)
+    return {
+        'median_ms': float(np.median(times)),
+        'p95_ms': float(np.percentile(times, 95)),
+        'min_ms': float(times.min()),
+        'mean_ms': float(times.mean()),
+        'runs': int(len(times)),
+    }
+
+
+def benchmark_image(image: np.ndarray, repeat: int, warmup: int) -> dict:
+    """Time every stage on one (already resized) image."""
+    # Prepare each stage's input once, outside the timed region
+    plate = _quiet(detect_plate, image)
+    ph, pw = plate.shape[:2]
+    circles, med_r = _quiet(detect_circles, plate)
+    if len(circles) >= 20:
+        grid, _ = _quiet(fit_grid_robust, circles, pw, ph, med_r)
+    else:
+        grid, _ = _naive_grid(pw, ph, med_r)
+    wells = _quiet(sample_well_colors, plate, grid, med_r)
+    classified = _quiet(classify_wells, wells)
+    results = _quiet(calculate_mic, classified)
+    csv_path = os.path.join(tempfile.gettempdir(), f"mic_bench_{os.getpid()}.csv")
+
+    stages = [
+        ('detect_plate', detect_plate, (image,)),
+        ('detect_circles', detect_circles, (plate,)),
+        ('fit_grid_robust', fit_grid_robust, (circles, pw, ph, med_r)),
+        ('sample_well_colors', sample_well_colors, (plate, grid, med_r)),
+        ('classify_wells', classify_wells, (wells,)),
+        ('calculate_mic', calculate_mic, (classified,)),
+        ('create_annotated_image', create_annotated_image, (plate, classified, results)),
+        ('create_score_heatmap', create_score_heatmap, (classified,)),
+        ('save_csv_report', save_csv_report, (results, classified, csv_path)),
+        ('pipeline', analyze_image, (image,)),
+    ]
+    if len(circles) < 20:
+        stages = [s for s in stages if s[0] != 'fit_grid_robust']
+
+    timings = {}
+    for name, fn, args in stages:
+        timings[name] = time_stage(fn, args, repeat, warmup)
+        print(f"       {name:<24} median {timings[name]['median_ms']:>10.2f} ms   "
+              f"p95 {timings[name]['p95_ms']:>10.2f} ms")
+
+    if os.path.exists(csv_path):
+        os.remove(csv_path)
+
+    return {
+        'width': int(image.shape[1]),
+        'height': int(image.shape[0]),
+        'plate': [int(pw), int(ph)],
+        'circles': int(len(circles)),
+        'stages': timings,
+    }
+
+
+def run_benchmarks(image_paths: list, sizes, repeat: int = 5, warmup: int = 1,
+                   synthetic_mp=()) -> dict:
+    report = {
+        'meta': {
+            'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'opencv_threads': cv2.getNumThreads(),
+            'repeat': repeat,
+            'warmup': warmup,
+        },
+        'results': {},
+    }
+
+    for path in image_paths:
+        original = cv2.imread(path)
+        if original is None:
+            print(f"[WARN] Görüntü okunamadı, atlanıyor: {path}")
+            continue
+        name = os.path.splitext(os.path.basename(path))[0]
+        for scale in sizes:
+            interp = cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC
+            image = original if scale == 1 else cv2.resize(
+                original, None, fx=scale, fy=scale, interpolation=interp)
+            case = f"{name}@{scale:g}x"
+            print(f"[BENCH] {case} ({image.shape[1]}x{image.shape[0]} px)")
+            report['results'][case] = benchmark_image(image, repeat, warmup)
+
+    if synthetic_mp:
+        from synthetic_plate import generate
+        for mp in synthetic_mp:
+            image, _ = generate(megapixels=mp, rotation_deg=1.5, skew=0.01, blur_sigma=0.8,
+                                noise_sigma=2.0, jpeg_quality=85, highlight_prob=0.3, seed=0)
+            case = f"synthetic@{mp:g}MP"
+            print(f"[BENCH] {case} ({image.shape[1]}x{image.shape[0]} px)")
+            report['results'][case] = benchmark_image(image, repeat, warmup)
+
+    return report
+
+
+def compare_reports(baseline: dict, current: dict, threshold: float = 0.20,
+                    min_ms: float = 1.0) -> list:
+    """Print a stage-by-stage comparison and return the regressions found."""
+    regressions = []
+    print(f"{'Aşama':<28} {'Baz (ms)':>10} {'Şimdi (ms)':>11} {'Oran':>7}")
+    print("-" * 60)
+    for case, cur_case in current['results'].items():
+        base_case = baseline['results'].get(case)
+        if base_case is None:
+            print(f"{case}: bazda yok, atlandı")
+            continue
+        print(case)
+        for stage, cur in cur_case['stages'].items():
+            base = base_case['stages'].get(stage)
+            if base is None:
+                continue
+            b, c = base['median_ms'], cur['median_ms']
+            ratio = c / b if b > 0 else float('inf')
+            regressed = ratio > 1 + threshold and (c - b) > min_ms
+            flag = '  ✗ REGRESYON' if regressed else ''
+            print(f"  {stage:<26} {b:>10.2f} {c:>11.2f} {ratio:>6.2f}x{flag}")
+            if regressed:
+                regressions.append({'case': case, 'stage': stage,
+                                    'baseline_ms': b, 'current_ms': c, 'ratio': ratio})
+    return regressions
+
+
+def _flag_value(argv, flag, default=None):
+    if flag in argv:
+        idx = argv.index(flag)
+        if idx + 1 < len(argv):
+            return argv[idx + 1]
+    return default
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('run', 'compare'):
+        print("Kullanım: python benchmark.py run [--images <görüntü> ...] [--sizes 0.5,1,2] "
+              "[--synthetic 1,12,50] [--repeat <n>] [--warmup <n>] [--output <bench.json>]")
+        print("          python benchmark.py compare <baz.json> <şimdiki.json> "
+              "[--threshold 0.20] [--min-ms 1.0]")
+        sys.exit(1)
+
+    if sys.argv[1] == 'run':
+        image_paths = []
+        if '--images' in sys.argv:
+            idx = sys.argv.index('--images') + 1
+            while idx < len(sys.argv) and not sys.argv[idx].startswith('--'):
+                image_paths.extend(sorted(glob.glob(sys.argv[idx])))
+                idx += 1
+        else:
+            image_paths = sorted(glob.glob(DEFAULT_IMAGES))
+        synthetic_mp = [float(s) for s in _flag_value(sys.argv, '--synthetic', '').split(',') if s]
+        if not image_paths and not synthetic_mp:
+            print("[ERROR] Kıyaslama için görüntü bulunamadı")
+            sys.exit(1)
+
+        sizes = [float(s) for s in _flag_value(sys.argv, '--sizes', '').split(',') if s] or DEFAULT_SIZES
+        repeat = int(_flag_value(sys.argv, '--repeat', 5))
+        warmup = int(_flag_value(sys.argv, '--warmup', 1))
+        output = _flag_value(sys.argv, '--output', 'benchmark.json')
+
+        report = run_benchmarks(image_paths, sizes, repeat, warmup, synthetic_mp)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"[INFO] Sonuçlar kaydedildi: {output}")
+
+    else:
+        if len(sys.argv) < 4:
+            print("[ERROR] compare için iki JSON dosyası gerekli")
+            sys.exit(1)
+        with open(sys.argv[2], encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(sys.argv[3], encoding='utf-8') as f:
+            current = json.load(f)
+        threshold = float(_flag_value(sys.argv, '--threshold', 0.20))
+        min_ms = float(_flag_value(sys.argv, '--min-ms', 1.0))
+
+        regressions = compare_reports(baseline, current, threshold, min_ms)
+        print()
+        if regressions:
+            print(f"[FAIL] {len(regressions)} aşamada %{threshold * 100:.0f} üzeri yavaşlama")
+            sys.exit(1)
+        print("[OK] Regresyon yok")
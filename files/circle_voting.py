@@ -0,0 +1,212 @@
+"""
+Circle Voting - Hough gradient circle detection for several vote thresholds
+from one accumulator.
+
+cv2.HoughCircles recomputes Canny edges, Sobel gradients and the center
+accumulator on every call, although detect_circles only changes param2 (the
+vote threshold) between the passes of one blur level. Here the edges and
+gradients are computed once, every edge pixel votes along its gradient
+direction (both ways) for each radius of the band [min_r, max_r], and the
+centers for every threshold are read from that same accumulator.
+
+Every step follows OpenCV's HOUGH_GRADIENT (dp = 1) so that each threshold
+returns the circles cv2.HoughCircles returns:
+- votes step along the gradient in 10-bit fixed point, as OpenCV does;
+- a candidate center is an accumulator cell above the threshold that beats
+  its left/upper neighbours and is not below its right/lower ones;
+- a center's radius comes from 0.1-pixel bins of center-to-edge distances,
+  taken in 1-pixel windows from the outermost edge inwards (see
+  _scan_windows); the window with the most edge pixels per unit radius
+  wins, and that pixel count (the support) must exceed the threshold;
+- circles are ordered by support, then larger radius, then x and y, and
+  kept greedily when at least min_dist from the circles kept before them.
+Candidates and supports do not depend on the threshold, so the radius of
+every candidate is estimated once; only the filtering and the greedy pass
+run once per threshold.
+"""
+
+import cv2
+import numpy as np
+
+_SHIFT = 10             # fixed-point fraction bits of the vote stepping
+_BINS_PER_PX = 10       # radius histogram resolution
+
+
+def vote_circles(blurred: np.ndarray, min_r: int, max_r: int, min_dist: float,
+                 canny_threshold: float, thresholds) -> list:
+    """
+    Detect circles on a blurred grayscale image for every vote threshold.
+    Returns one float32 (n, 3) array of (x, y, r) per threshold, strongest
+    first, like cv2.HoughCircles(...)[0]; empty arrays when nothing is found.
+    """
+    h, w = blurred.shape[:2]
+    dx = cv2.Sobel(blurred, cv2.CV_16S, 1, 0, ksize=3, borderType=cv2.BORDER_REPLICATE)
+    dy = cv2.Sobel(blurred, cv2.CV_16S, 0, 1, ksize=3, borderType=cv2.BORDER_REPLICATE)
+    edges = cv2.Canny(dx, dy, max(1, int(canny_threshold) // 2), int(canny_threshold))
+
+    ys, xs = np.nonzero(edges)
+    vx, vy = dx[ys, xs].astype(np.float32), dy[ys, xs].astype(np.float32)
+    keep = (vx != 0) | (vy != 0)
+    xs, ys, vx, vy = xs[keep], ys[keep], vx[keep], vy[keep]
+    mag = np.sqrt(vx * vx + vy * vy)
+    sx = np.rint(vx * np.float32(1 << _SHIFT) / mag).astype(np.int32)
+    sy = np.rint(vy * np.float32(1 << _SHIFT) / mag).astype(np.int32)
+
+    # --- Center accumulator: one vote per radius, on both sides of the edge ---
+    radii = np.arange(min_r, max_r + 1, dtype=np.int32)
+    acc = np.zeros((h + 2) * (w + 2), dtype=np.int64)  # one cell of padding around
+    for sign in (1, -1):
+        cx = ((xs[:, None].astype(np.int32) << _SHIFT) + sign * sx[:, None] * radii) >> _SHIFT
+        cy = ((ys[:, None].astype(np.int32) << _SHIFT) + sign * sy[:, None] * radii) >> _SHIFT
+        inside = (cx >= 0) & (cx < w) & (cy >= 0) & (cy < h)
+        acc += np.bincount((cy[inside] + 1) * (w + 2) + cx[inside] + 1,
+                           minlength=(h + 2) * (w + 2))
+    acc = acc.reshape(h + 2, w + 2)
+
+    # --- Candidate centers (threshold-independent part of the peak test) ---
+    core = acc[1:-1, 1:-1]
+    peaks = ((core > min(thresholds)) &
+             (core > acc[1:-1, :-2]) & (core >= acc[1:-1, 2:]) &
+             (core > acc[:-2, 1:-1]) & (core >= acc[2:, 1:-1]))
+    py, px = np.nonzero(peaks)
+    votes = core[py, px]
+
+    # --- Radius and support of every candidate, once for all thresholds ---
+    edge_index = _EdgeIndex(xs, ys, max_r + 1)
+    centers_x = (px + np.float32(0.5)).astype(np.float32)
+    centers_y = (py + np.float32(0.5)).astype(np.float32)
+    radius, support = _estimate_radii(edge_index, centers_x, centers_y, min_r, max_r)
+
+    # Support first, then larger radius, smaller x, smaller y
+    order = np.lexsort((centers_y, centers_x, -radius, -support))
+
+    # --- Greedy acceptance per threshold ---
+    cell = max(1.0, float(min_dist))
+    min_dist_sq = np.float32(min_dist) * np.float32(min_dist)
+    results = []
+    for t in thresholds:
+        accepted = []
+        buckets = {}  # (bx, by) -> accepted centers, cell size min_dist
+        for i in order[(votes[order] > t) & (support[order] > t)]:
+            x, y = centers_x[i], centers_y[i]
+            bx, by = int(x // cell), int(y // cell)
+            if any((x - ax) * (x - ax) + (y - ay) * (y - ay) < min_dist_sq
+                   for nx in (bx - 1, bx, bx + 1) for ny in (by - 1, by, by + 1)
+                   for ax, ay in buckets.get((nx, ny), ())):
+                continue
+            accepted.append((x, y, radius[i]))
+            buckets.setdefault((bx, by), []).append((x, y))
+        results.append(np.array(accepted, dtype=np.float32).reshape(-1, 3))
+    return results
+
+
+class _EdgeIndex:
+    """Edge pixels bucketed on a square grid, for neighbourhood queries."""
+
+    def __init__(self, xs, ys, cell: int):
+        self.cell = cell
+        self.cols = int(xs.max()) // cell + 1 if len(xs) else 1
+        keys = (ys // cell) * self.cols + xs // cell
+        order = np.argsort(keys, kind='stable')
+        self.xs = xs[order].astype(np.float32)
+        self.ys = ys[order].astype(np.float32)
+        self.keys = keys[order]
+
+    def near(self, bx: int, by: int) -> tuple:
+        """Edge pixels in the 3x3 cells around cell (bx, by)."""
+        parts_x, parts_y = [], []
+        for row in range(by - 1, by + 2):
+            if row < 0:
+                continue
+            lo_col, hi_col = max(0, bx - 1), min(self.cols - 1, bx + 1)
+            if lo_col > hi_col:
+                continue
+            lo = np.searchsorted(self.keys, row * self.cols + lo_col, 'left')
+            hi = np.searchsorted(self.keys, row * self.cols + hi_col, 'right')
+            parts_x.append(self.xs[lo:hi])
+            parts_y.append(self.ys[lo:hi])
+        if not parts_x:
+            return np.empty(0, np.float32), np.empty(0, np.float32)
+        return np.concatenate(parts_x), np.concatenate(parts_y)
+
+
+_PAIRS_PER_CHUNK = 1 << 20   # center-edge distances computed at once
+
+
+def _estimate_radii(edge_index: _EdgeIndex, cx: np.ndarray, cy: np.ndarray,
+                    min_r: int, max_r: int) -> tuple:
+    """
+    Radius and support of every center, as OpenCV estimates them.
+    Centers sharing an edge-grid cell are handled together: their distances
+    to the edge pixels around that cell are binned with one bincount.
+    """
+    n_bins = (max_r - min_r) * _BINS_PER_PX
+    counts = np.zeros((len(cx), n_bins + 1), dtype=np.int32)
+    cell = edge_index.cell
+    keys = (cy.astype(np.int64) // cell) * edge_index.cols + cx.astype(np.int64) // cell
+    order = np.argsort(keys, kind='stable')
+    bounds = np.flatnonzero(np.diff(keys[order])) + 1
+    lo_sq, hi_sq = np.float32(min_r * min_r), np.float32(max_r * max_r)
+    for group in np.split(order, bounds):
+        if len(group) == 0:
+            continue
+        ex, ey = edge_index.near(int(cx[group[0]]) // cell, int(cy[group[0]]) // cell)
+        step = max(1, _PAIRS_PER_CHUNK // max(1, len(ex)))
+        for i in range(0, len(group), step):
+            idx = group[i:i + step]
+            dist_sq = cx[idx, None] - ex[None, :]
+            dist_sq *= dist_sq
+            ddy = cy[idx, None] - ey[None, :]
+            ddy *= ddy
+            dist_sq += ddy
+            # Distances outside [min_r, max_r] go to an extra, discarded bin
+            outside = (dist_sq < lo_sq) | (dist_sq > hi_sq)
+            bins = np.sqrt(dist_sq, out=ddy)
+            bins -= np.float32(min_r)
+            bins *= np.float32(_BINS_PER_PX)
+            np.rint(bins, out=bins)
+            np.clip(bins, 0, n_bins - 1, out=bins)
+            bins = bins.astype(np.int32)
+            bins[outside] = n_bins
+            bins += np.arange(len(idx), dtype=np.int32)[:, None] * (n_bins + 1)
+            counts[idx] = np.bincount(bins.ravel(), minlength=len(idx) * (n_bins + 1)
+                                      ).reshape(len(idx), n_bins + 1)
+    return _scan_windows(counts[:, :n_bins], min_r)
+
+
+def _scan_windows(counts: np.ndarray, min_r: int) -> tuple:
+    """
+    OpenCV's window scan over per-center radius histograms (0.1-pixel bins):
+    from the outermost non-empty bin inwards, each 1-pixel window (10 bins,
+    the next one starting below the bin after it) is scored by its pixel
+    count per unit radius, and the best window (inner one on ties) gives
+    (radius, pixel count). All centers are scanned in lockstep.
+    """
+    n, n_bins = counts.shape
+    rows = np.arange(n)
+    cum = np.zeros((n, n_bins + 1), dtype=np.int64)
+    np.cumsum(counts, axis=1, out=cum[:, 1:])
+    # Highest non-empty bin at or below each bin (-1: none)
+    filled = np.maximum.accumulate(np.where(counts > 0, np.arange(n_bins), -1), axis=1)
+
+    best_r = np.zeros(n, dtype=np.float32)
+    best_count = np.zeros(n, dtype=np.int64)
+    j = np.full(n, n_bins - 1, dtype=np.int64)
+    eps = np.finfo(np.float32).eps
+    while True:
+        active = j > 0
+        upbin = np.where(active, filled[rows, np.maximum(j, 0)], -1)
+        active &= upbin > 0
+        if not active.any():
+            break
+        low = np.maximum(upbin - _BINS_PER_PX, -1)
+        count = cum[rows, np.maximum(upbin, 0) + 1] - cum[rows, low + 1]
+        r = (((upbin + low) / 2).astype(np.float32) / np.float32(_BINS_PER_PX)
+             + np.float32(min_r))
+        better = ((count.astype(np.float32) * best_r >= best_count.astype(np.float32) * r) |
+                  ((best_r < eps) & (count >= best_count)))
+        better &= active
+        best_r = np.where(better, r, best_r)
+        best_count = np.where(better, count, best_count)
+        j = np.where(active, low - 1, 0)  # OpenCV also steps over the bin below each window
+    return best_r, best_count
@@ -92,3 +92,101 @@ PURPLE_HUE_RANGE = (100, 145)
 # How much to weight relative vs absolute classification
 RELATIVE_WEIGHT = 0.65
 ABSOLUTE_WEIGHT = 0.35
+
+# --- Instrumentation ---
+# Memory mode (--memory): warn when a single stage grows the process by more
+# than this many MB (tracemalloc peak or peak RSS growth)
+STAGE_MEMORY_BUDGET_MB = 512
+
+# --- Result cache (--cache-dir, see result_cache.py) ---
+# Least recently used entries are evicted beyond this size or age
+RESULT_CACHE_MAX_MB = 2048
+RESULT_CACHE_MAX_AGE_DAYS = 30
+
+# --- Image decoding (image_loader.py) ---
+# Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale as long as a well pitch
+# stays at least DECODE_TARGET_WELL_PX pixels. The pitch is estimated from the
+# image size assuming the plate spans DECODE_PLATE_FRACTION of the long side
+# and is DECODE_PLATE_PITCHES well pitches wide.
+DECODE_REDUCED = True
+DECODE_TARGET_WELL_PX = 110
+DECODE_PLATE_FRACTION = 0.8
+DECODE_PLATE_PITCHES = 13.2
+# Re-read the full-resolution image to measure well colors after the grid
+# was found on the reduced decode (slower, uses the original pixels)
+DECODE_FULL_RES_COLORS = False
+
+# --- Plate detection ---
+# Images whose long side exceeds 2 x PLATE_COARSE_MAX_PX are searched for the
+# plate on a copy downscaled to PLATE_COARSE_MAX_PX; the corners are then
+# refined in small full-resolution windows
+PLATE_COARSE_TO_FINE = True
+PLATE_COARSE_MAX_PX = 800
+
+# --- Well color sampling ---
+# 'plate':  measure colors on the warped plate image (HSV of the whole plate)
+# 'source': map each sampling disc back through the plate homography and
+#           measure the original pixels; only the disc patches are converted
+#           to HSV, and full-resolution colors (DECODE_FULL_RES_COLORS) need
+#           no full-resolution warp
+WELL_SAMPLING = 'plate'
+# Polygon vertices used to map a sampling disc into the source image
+SOURCE_DISC_VERTICES = 48
+
+# --- Rig profiles (--rig / --save-rig, see rig_profile.py) ---
+# Profile files live in this folder (relative paths: next to the program)
+RIG_PROFILE_DIR = 'rig_profiles'
+# Wells (row, col) looked up with a local Hough search before a saved
+# plate position and grid are trusted for a new image
+RIG_VERIFY_WELLS = ((0, 0), (0, 11), (7, 0), (7, 11), (2, 3), (2, 8), (5, 3), (5, 8))
+RIG_VERIFY_MIN_MATCHES = 6
+# Largest accepted offset of a found well from the saved grid (fraction of the pitch)
+RIG_VERIFY_TOLERANCE = 0.15
+
+# --- Multi-plate mode (main.py --multi-plate) ---
+# Plate-shaped quadrilaterals smaller than this fraction of the largest
+# contour in the image are not counted as plates
+MULTI_PLATE_MIN_AREA_FRACTION = 0.5
+
+# --- Circle detection (well_extractor.detect_circles) ---
+# Up to this many Hough passes run ahead on a thread pool; 0 follows
+# cv2.getNumThreads() (at most 3), so batch/server workers limited to one
+# OpenCV thread run the passes one by one. Does not change the result
+HOUGH_WORKERS = 0
+# After each pass (in HOUGH_PASSES order) the rest are skipped once the
+# merged circles sit on this fraction of the 96 wells of a grid fitted to
+# them, one circle per well, without outnumbering the wells (0: always run
+# every pass)
+HOUGH_EARLY_EXIT_COVERAGE = 0.95
+# 'opencv': one cv2.HoughCircles call per pass
+# 'voting': one shared accumulator per blur level for all its param2
+#           thresholds (circle_voting.py); same circles, checked pass by
+#           pass by test_circle_voting.py, and faster once a plate needs
+#           more than one pass
+CIRCLE_ENGINE = 'opencv'
+# Plates whose expected well radius is above CIRCLE_WORK_MAX_RATIO x
+# CIRCLE_WORK_RADIUS_PX are searched for circles on a copy shrunk to this
+# radius (0: always search the plate as it is); the Hough passes above are
+# tuned for radii around it
+CIRCLE_WORK_RADIUS_PX = 48
+CIRCLE_WORK_MAX_RATIO = 1.5
+
+# --- Grid fitting (well_extractor.extract_wells_with_grid) ---
+# 'robust': step from circle pair distances, origin by exhaustive search
+# 'fft':    period and phase of the well lattice from the plate's saturation
+#           spectrum (lattice_fft.py), refined on the circles; falls back to
+#           'robust' when the spectrum is ambiguous
+GRID_ENGINE = 'robust'
+# The lattice peak must be this many times stronger than any other
+# frequency within +-30% of the expected pitch
+GRID_FFT_MIN_PEAK_RATIO = 1.5
+# The chosen first column/row must beat the next best placement by this
+# fraction of a well column's/row's mean saturation contrast
+GRID_FFT_MIN_EDGE_CONTRAST = 0.5
+
+# --- Well color extraction (well_extractor.sample_well_colors) ---
+# 'loop':    one mask and one set of median/mean calls per well
+# 'batched': every sampling disc in one pass, statistics from bincount and
+#            per-well histograms (hist_stats.py); same results, checked
+#            field by field by test_color_engines.py
+COLOR_ENGINE = 'batched'
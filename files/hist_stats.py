@@ -0,0 +1,209 @@
+"""
+Hist Stats - Statistics of 8-bit channels from per-label histograms.
+
+Well colors are uint8 HSV/BGR values, so a median or a trimmed mean does not
+need to sort the pixels: one pass builds a histogram per well (label), and
+every statistic is then read from the cumulative counts in O(pixels + bins).
+Labels may number anything, e.g. plate * 96 + well to run a whole batch of
+plates through one call.
+
+    hist = label_histograms(labels, values, n)   # (n, 256) counts
+    medians(hist)                   same values as np.median per label
+    means(hist)                     exact (integer sums)
+    trimmed_means(hist, 0.1)        mean after cutting 10% at each end, per label
+    circular_hue_medians(hist)      median hue, across the red wrap-around
+    circular_hue_means(hist)        direction of the mean hue vector
+
+The circular hue mean sums per-hue sin/cos weighted by counts instead of
+per pixel, so it differs from the per-pixel formula by rounding (~1e-13
+degrees). On every path, results within HUE_WRAP_EPS of 180 are returned
+as 0, the same hue, so a sine sum that is zero up to rounding (hues spread
+evenly around red) cannot flip the result between ~0 and ~180. This is the
+one deliberate difference from the per-pixel formula, which can return
+179.99999999999997 there.
+
+The single-array helpers (median, circular_hue_median, circular_hue_mean)
+take the histogram path for integer values in [0, 256) and compute the
+same statistic directly on the values otherwise (float arrays, out of range
+values). Labels without pixels give NaN. The per-pixel and per-bin
+temporaries live in a per-thread Workspace that grows to the largest batch
+and is reused, so repeated calls only allocate their (n,)-sized results and
+the counts array of np.bincount.
+"""
+
+import threading
+
+import numpy as np
+
+BINS = 256
+HUE_BINS = 180  # OpenCV 8-bit hue: 0-179
+HUE_WRAP_EPS = 1e-9  # degrees of hue
+
+# sin/cos of every 8-bit hue, 2 hue units per degree
+_HUE_SIN = np.sin(np.arange(BINS, dtype=np.float64) * (2*np.pi/180))
+_HUE_COS = np.cos(np.arange(BINS, dtype=np.float64) * (2*np.pi/180))
+
+
+class Workspace:
+    """Scratch buffers by name, grown as needed and reused between calls."""
+
+    def __init__(self):
+        self._buffers = {}
+
+    def buffer(self, name: str, shape: tuple, dtype) -> np.ndarray:
+        size = int(np.prod(shape))
+        buf = self._buffers.get(name)
+        if buf is None or buf.dtype != dtype or buf.size < size:
+            buf = self._buffers[name] = np.empty(max(size, 1), dtype=dtype)
+        return buf[:size].reshape(shape)
+
+
+_local = threading.local()
+
+
+def workspace() -> Workspace:
+    """This thread's workspace."""
+    ws = getattr(_local, 'workspace', None)
+    if ws is None:
+        ws = _local.workspace = Workspace()
+    return ws
+
+
+def label_histograms(labels: np.ndarray, values: np.ndarray, n: int,
+                     bins: int = BINS) -> np.ndarray:
+    """(n, bins) counts of values (integers in [0, bins)) per label in [0, n)."""
+    keys = workspace().buffer('keys', (len(labels),), np.int64)
+    np.multiply(labels, bins, out=keys)
+    np.add(keys, values, out=keys)
+    return np.bincount(keys, minlength=n * bins).reshape(n, bins)
+
+
+def medians(hist: np.ndarray, counts: np.ndarray = None) -> np.ndarray:
+    """Median of each row's values: the mean of the two middle ones for even counts."""
+    if counts is None:
+        counts = hist.sum(axis=1)
+    cum = workspace().buffer('cum', hist.shape, np.int64)
+    np.cumsum(hist, axis=1, out=cum)
+    lower = _value_at_rank(cum, (counts - 1) // 2)
+    upper = _value_at_rank(cum, counts // 2)
+    result = (lower + upper) / 2
+    result[counts == 0] = np.nan
+    return result
+
+
+def means(hist: np.ndarray, counts: np.ndarray = None) -> np.ndarray:
+    """Mean of each row's values."""
+    if counts is None:
+        counts = hist.sum(axis=1)
+    sums = hist.dot(np.arange(hist.shape[1], dtype=np.int64))
+    return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def trimmed_means(hist: np.ndarray, proportion: float, counts: np.ndarray = None) -> np.ndarray:
+    """
+    Mean of each row's values after dropping int(proportion * count) of the
+    lowest and of the highest ones (as scipy.stats.trim_mean).
+    """
+    if counts is None:
+        counts = hist.sum(axis=1)
+    ws = workspace()
+    cut = (proportion * counts).astype(np.int64)
+    lo, hi = cut[:, None], (counts - cut)[:, None]
+
+    # Ranks [cum - hist, cum) of each bin, clipped to the kept ranks [lo, hi)
+    cum = ws.buffer('cum', hist.shape, np.int64)
+    np.cumsum(hist, axis=1, out=cum)
+    start = ws.buffer('start', hist.shape, np.int64)
+    np.subtract(cum, hist, out=start)
+    np.maximum(start, lo, out=start)
+    np.minimum(cum, hi, out=cum)
+    np.subtract(cum, start, out=cum)
+    np.maximum(cum, 0, out=cum)
+
+    sums = cum.dot(np.arange(hist.shape[1], dtype=np.int64))
+    kept = (hi - lo)[:, 0]
+    return np.where(kept > 0, sums / np.maximum(kept, 1), np.nan)
+
+
+def circular_hue_medians(hist: np.ndarray, counts: np.ndarray = None) -> np.ndarray:
+    """
+    Median hue per row. Rows with hues both below 30 and above 150 (both
+    sides of red) take the median of the hues shifted by 90 modulo 180,
+    shifted back. Values of 180 and above are counted like the per-pixel
+    version does: as they are, or shifted to (hue + 90) % 180.
+    """
+    if counts is None:
+        counts = hist.sum(axis=1)
+    width = hist.shape[1]
+    wraps = (hist[:, :30].sum(axis=1) > 0) & (hist[:, 151:].sum(axis=1) > 0)
+    shifted = workspace().buffer('shifted', (len(hist), HUE_BINS), np.int64)
+    shifted[:, 90:] = hist[:, :HUE_BINS - 90]
+    shifted[:, :90] = hist[:, HUE_BINS - 90:HUE_BINS]
+    # 180..255 land on 90..165
+    shifted[:, 90:90 + max(0, width - HUE_BINS)] += hist[:, HUE_BINS:]
+    return np.where(wraps, (medians(shifted, counts) - 90) % 180, medians(hist, counts))
+
+
+def circular_hue_means(hist: np.ndarray, counts: np.ndarray = None) -> np.ndarray:
+    """Hue of the summed unit vectors of each row's hues, in [0, 180)."""
+    if counts is None:
+        counts = hist.sum(axis=1)
+    weighted = workspace().buffer('weighted', hist.shape, np.float64)
+    np.multiply(hist, _HUE_SIN[:hist.shape[1]], out=weighted)
+    sines = weighted.sum(axis=1)
+    np.multiply(hist, _HUE_COS[:hist.shape[1]], out=weighted)
+    cosines = weighted.sum(axis=1)
+    result = np.arctan2(sines, cosines) * (180/(2*np.pi)) % 180
+    result[result > 180 - HUE_WRAP_EPS] = 0.0
+    result[counts == 0] = np.nan
+    return result
+
+
+# --- Single arrays ---
+
+def histogram(values: np.ndarray) -> np.ndarray:
+    """(1, 256) histogram of one array of 8-bit values."""
+    values = np.ravel(values)
+    if not fits_histogram(values):
+        raise ValueError("histogram() takes integer values in [0, 256)")
+    return np.bincount(values.astype(np.uint8, copy=False), minlength=BINS)[None, :BINS]
+
+
+def fits_histogram(values: np.ndarray) -> bool:
+    """True for integer values in [0, 256), which the histogram path counts exactly."""
+    values = np.asarray(values)
+    if values.dtype == np.uint8:
+        return True
+    if not np.issubdtype(values.dtype, np.integer):
+        return False
+    return values.size == 0 or (values.min() >= 0 and values.max() < BINS)
+
+
+def median(values: np.ndarray) -> float:
+    if not fits_histogram(values):
+        return float(np.median(values))
+    return float(medians(histogram(values))[0])
+
+
+def circular_hue_median(hues: np.ndarray) -> float:
+    if not fits_histogram(hues):
+        hues = np.asarray(hues)
+        if np.any(hues < 30) and np.any(hues > 150):
+            return float((np.median((hues.astype(np.int32) + 90) % 180) - 90) % 180)
+        return float(np.median(hues))
+    return float(circular_hue_medians(histogram(hues))[0])
+
+
+def circular_hue_mean(hues: np.ndarray) -> float:
+    if not fits_histogram(hues):
+        a = np.asarray(hues, dtype=np.float64) * (2*np.pi/180)
+        result = float(np.arctan2(np.mean(np.sin(a)), np.mean(np.cos(a))) * (180/(2*np.pi)) % 180)
+        return 0.0 if result > 180 - HUE_WRAP_EPS else result
+    return float(circular_hue_means(histogram(hues))[0])
+
+
+def _value_at_rank(cum: np.ndarray, rank: np.ndarray) -> np.ndarray:
+    """Per row of cumulative counts, the value of the rank-th smallest element (0-based)."""
+    above = workspace().buffer('above', cum.shape, np.bool_)
+    np.greater(cum, rank[:, None], out=above)
+    return np.argmax(above, axis=1)
@@ -0,0 +1,131 @@
+"""
+Image Loader - Decodes plate photos at the lowest resolution that still
+gives the pipeline enough pixels per well.
+
+Phone cameras deliver 12-50 MP JPEGs, but plate and circle detection only
+need the plate to be about DECODE_TARGET_WELL_PX per well pitch. For JPEG
+input the size is read from the SOF header (no decode), and libjpeg is asked
+for a 1/2, 1/4 or 1/8 scaled decode (cv2.IMREAD_REDUCED_COLOR_*), which
+scales in the DCT domain: both decode time and memory drop with the square
+of the factor. Other formats are decoded at full size.
+
+The decoded pixel (x, y) covers full-resolution pixels starting at
+(x * f, y * f); see to_full_resolution() for the exact mapping.
+"""
+
+import io
+import struct
+
+import cv2
+import numpy as np
+
+from config import (
+    DECODE_REDUCED, DECODE_TARGET_WELL_PX, DECODE_PLATE_FRACTION, DECODE_PLATE_PITCHES
+)
+
+_REDUCED_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+# SOF markers carrying the frame size (excludes DHT 0xC4, JPG 0xC8, DAC 0xCC)
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_size(stream) -> tuple:
+    """
+    Read (width, height) from a JPEG stream's SOF segment without decoding.
+    Returns None if the stream is not a JPEG or the header is damaged.
+    """
+    if stream.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        byte = stream.read(1)
+        while byte and byte != b'\xff':
+            byte = stream.read(1)  # skip to the next marker
+        while byte == b'\xff':
+            byte = stream.read(1)  # fill bytes
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # standalone markers, no length
+        if marker == 0xD9 or marker == 0xDA:
+            return None  # end of image / scan data before any SOF
+        length_bytes = stream.read(2)
+        if len(length_bytes) < 2:
+            return None
+        length = struct.unpack('>H', length_bytes)[0]
+        if marker in _SOF_MARKERS:
+            segment = stream.read(5)
+            if len(segment) < 5:
+                return None
+            height, width = struct.unpack('>HH', segment[1:5])
+            return (width, height) if width and height else None
+        stream.seek(length - 2, io.SEEK_CUR)
+
+
+def choose_reduction(width: int, height: int) -> int:
+    """Largest JPEG scale factor (1, 2, 4 or 8) that keeps wells >= DECODE_TARGET_WELL_PX."""
+    pitch = max(width, height) * DECODE_PLATE_FRACTION / DECODE_PLATE_PITCHES
+    for factor in (8, 4, 2):
+        if pitch / factor >= DECODE_TARGET_WELL_PX:
+            return factor
+    return 1
+
+
+def load_image(path: str, reduce: bool = None) -> tuple:
+    """
+    Decode an image file for the pipeline (reduce defaults to DECODE_REDUCED).
+    Returns (image, factor, full_size): image is None if unreadable, factor
+    is the reduction applied and full_size the full (width, height).
+    """
+    factor, full_size = 1, None
+    if DECODE_REDUCED if reduce is None else reduce:
+        try:
+            with open(path, 'rb') as f:
+                full_size = jpeg_size(f)
+        except OSError:
+            full_size = None
+        if full_size:
+            factor = choose_reduction(*full_size)
+
+    image = cv2.imread(path, _REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    return image, factor, _oriented_size(image, full_size)
+
+
+def decode_bytes(data: bytes, reduce: bool = None) -> tuple:
+    """load_image() for an encoded image held in memory."""
+    factor, full_size = 1, None
+    if DECODE_REDUCED if reduce is None else reduce:
+        full_size = jpeg_size(io.BytesIO(data))
+        if full_size:
+            factor = choose_reduction(*full_size)
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+    image = cv2.imdecode(buf, _REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+    return image, factor, _oriented_size(image, full_size)
+
+
+def _oriented_size(image, header_size):
+    """Full (width, height) matching the decoded image's orientation."""
+    if image is None:
+        return None
+    if header_size is None:
+        return (image.shape[1], image.shape[0])
+    w, h = header_size
+    # EXIF rotation is applied by the decoder but not reflected in the SOF size
+    if (image.shape[1] > image.shape[0]) != (w > h):
+        w, h = h, w
+    return (w, h)
+
+
+def to_full_resolution(factor: int) -> np.ndarray:
+    """
+    3x3 matrix mapping reduced-decode pixel coordinates to full-resolution
+    ones: reduced pixel x is the mean of full pixels f*x ... f*x + f-1.
+    """
+    offset = (factor - 1) / 2
+    return np.array([[factor, 0, offset], [0, factor, offset], [0, 0, 1]], dtype=np.float64)
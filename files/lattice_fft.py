@@ -0,0 +1,90 @@
+"""
+Lattice FFT - Well grid period and phase from the spectrum of the plate.
+
+The 96 wells are a strongly periodic pattern: along x the plate's
+saturation rises at every well column, along y at every row. By the
+projection-slice theorem the v = 0 row of the plate's 2D spectrum is the
+1D spectrum of the column-wise mean of the image, so each axis only needs
+an O(N) projection and one zero-padded FFT:
+
+    period  the strongest frequency within +-30% of the expected pitch,
+            refined by parabolic interpolation between bins
+    phase   the DFT phase at that frequency gives the well positions
+            modulo the period
+    origin  of the lattice positions inside the plate, the window of
+            COLS (ROWS) consecutive ones with the highest saturation
+
+fit_lattice_fft returns None when the spectrum is ambiguous: a secondary
+peak close to the main one, or no clear choice of the first column/row.
+"""
+
+import cv2
+import numpy as np
+
+from config import ROWS, COLS, GRID_FFT_MIN_PEAK_RATIO, GRID_FFT_MIN_EDGE_CONTRAST
+
+# Zero padding of the profiles (finer frequency bins for the peak search)
+_PAD_FACTOR = 16
+
+
+def fit_lattice_fft(plate_image: np.ndarray) -> tuple:
+    """(ox, oy, sx, sy) of the well lattice on the upright plate, or None."""
+    h, w = plate_image.shape[:2]
+    saturation = cv2.cvtColor(plate_image, cv2.COLOR_BGR2HSV)[:, :, 1]
+
+    x_axis = _axis_lattice(saturation.mean(axis=0), w / COLS, COLS)
+    if x_axis is None:
+        return None
+    y_axis = _axis_lattice(saturation.mean(axis=1), h / ROWS, ROWS)
+    if y_axis is None:
+        return None
+    (ox, sx), (oy, sy) = x_axis, y_axis
+    return ox, oy, sx, sy
+
+
+def _axis_lattice(profile: np.ndarray, expected_step: float, count: int) -> tuple:
+    """(origin, step) of count evenly spaced maxima along profile, or None."""
+    n = len(profile)
+    signal = (profile - profile.mean()) * np.hanning(n)
+    size = _PAD_FACTOR * n
+    spectrum = np.abs(np.fft.rfft(signal, size))
+
+    # Frequencies (cycles per pixel) of steps within +-30% of the expected one
+    lo = int(np.ceil(size / (expected_step * 1.3)))
+    hi = int(np.floor(size / (expected_step * 0.7)))
+    if hi <= lo + 2 or hi >= len(spectrum) - 1:
+        return None
+    band = spectrum[lo:hi + 1]
+    k = lo + int(np.argmax(band))
+
+    # Ambiguous: another peak outside the main lobe (2 unpadded bins wide)
+    lobe = 2 * _PAD_FACTOR
+    others = np.concatenate([spectrum[lo:max(lo, k - lobe)], spectrum[k + lobe + 1:hi + 1]])
+    if len(others) and spectrum[k] < GRID_FFT_MIN_PEAK_RATIO * others.max():
+        return None
+
+    # Parabolic interpolation between the neighbouring bins
+    a, b, c = spectrum[k - 1], spectrum[k], spectrum[k + 1]
+    denom = a - 2 * b + c
+    offset = 0.5 * (a - c) / denom if denom else 0.0
+    freq = (k + offset) / size
+    step = 1.0 / freq
+
+    # Phase at the refined frequency: maxima at x = -phase / (2 pi f) mod step
+    phase = np.angle(np.sum(signal * np.exp(-2j * np.pi * freq * np.arange(n))))
+    first = (-phase / (2 * np.pi * freq)) % step
+
+    # Lattice positions inside the profile; pick the window of `count` with
+    # the most signal
+    positions = first + step * np.arange(int((n - 1 - first) // step) + 1)
+    if len(positions) < count:
+        return None
+    strength = np.interp(positions, np.arange(n), profile - profile.mean())
+    sums = np.convolve(strength, np.ones(count), mode='valid')
+    order = np.argsort(sums)[::-1]
+    best = int(order[0])
+    if len(order) > 1:
+        contrast = strength[best:best + count].mean()
+        if contrast <= 0 or sums[best] - sums[order[1]] < GRID_FFT_MIN_EDGE_CONTRAST * contrast:
+            return None
+    return float(positions[best]), float(step)
@@ -4,53 +4,184 @@ Reads a 96-well microplate image and determines MIC values for antifungal agents
 
 Usage:
     python main.py <image_path> [--output-dir <dir>]
+                   [--outputs annotated,heatmap,csv,debug | --only mic]
+                   [--trace <trace.json>] [--profile <out.prof>]
+                   [--memory [--mem-budget <MB>]] [--cache-dir <dir>]
+                   [--rig <name> | --save-rig <name>]
+                   [--multi-plate [--workers <n>]]
+
+Outputs (default: annotated,heatmap,csv):
+    annotated  <name>_annotated.png  plate with classification markers
+    heatmap    <name>_heatmap.png    growth score heatmap
+    csv        <name>_report.csv     MIC table and per-well scores
+    debug      <name>_debug_grid.png fitted grid drawn on the plate
+--only mic skips every artifact (and the visualizer import) and only
+prints the MIC table.
+
+--trace writes wall/CPU time of every stage and sub-step as a Chrome
+trace (open in chrome://tracing or ui.perfetto.dev) and prints a summary.
+--profile additionally saves a cProfile capture (view with pstats/snakeviz).
+--memory adds tracemalloc and peak-RSS figures per stage to the summary
+(and trace) and warns about stages above --mem-budget
+(default: config.STAGE_MEMORY_BUDGET_MB).
+
+Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale when the wells stay big
+enough for detection (image_loader.py, DECODE_* in config.py).
+
+--cache-dir looks the image up in a content-addressed result cache
+(result_cache.py) first: an identical image analysed with the same
+config.py and pipeline code returns the stored MIC table and artifacts
+without running the stages.
+
+--save-rig stores the detected plate position and grid as a rig profile
+for a fixed camera mount; --rig reuses it, verifying a few wells instead of
+running plate and circle detection (rig_profile.py). If the verification
+fails the image is analysed in full.
+
+--multi-plate analyses every plate in a photo of plates side by side
+(numbered in reading order, artifacts named <name>_plate<n>_*), running
+the plates in parallel on --workers processes (default: CPU count). The
+cache and rig options do not apply in this mode.
 """
 
 import sys
 import os
-import cv2
-import numpy as np
 
 # Add current dir to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from plate_detector import detect_plate
-from well_extractor import extract_wells
-from color_classifier import classify_wells
-from mic_calculator import calculate_mic, print_results
-from visualizer import (
-    create_annotated_image, create_score_heatmap,
-    save_csv_report
-)
+if __name__ == '__main__':
+    # Hand the call to a running zygote server before anything else is
+    # imported; without one (exit code None) the call runs below
+    from zygote import forward_to_zygote
+    _zygote_exit = forward_to_zygote(sys.argv[1:])
+    if _zygote_exit is not None:
+        sys.exit(_zygote_exit)
 
+# cv2, numpy and the pipeline stages are imported inside the functions that
+# use them, so a local run only loads what its options need.
+from tracing import span
 
-def run_pipeline(image_path: str, output_dir: str = '.'):
-    """Execute the full MIC plate reading pipeline."""
-    
-    print("=" * 60)
-    print("  MIC YST Plate Reader v1.0")
-    print("  EUCAST Uyumlu Mikrodilüsyon MIC Tayini")
-    print("=" * 60)
-    print()
-    
-    # --- Step 1: Load image ---
-    print("[1/6] Görüntü yükleniyor...")
-    image = cv2.imread(image_path)
-    if image is None:
-        print(f"[ERROR] Görüntü okunamadı: {image_path}")
-        sys.exit(1)
-    print(f"       Boyut: {image.shape[1]}x{image.shape[0]} px")
+OUTPUT_TYPES = ('annotated', 'heatmap', 'csv', 'debug')
+DEFAULT_OUTPUTS = ('annotated', 'heatmap', 'csv')
+
+
+def analyze_image(image, debug_path: str = None) -> tuple:
+    """Run steps 2-5 (plate, wells, classification, MIC) on a loaded BGR image."""
+    plate, _, wells, _ = locate_wells(image, debug_path=debug_path)
+    classified, results = score_wells(wells)
+    return plate, classified, results
+
+
+def locate_wells(image, debug_path: str = None) -> tuple:
+    """
+    Run steps 2-3 on a loaded BGR image.
+    Returns (plate, transform, wells, geometry): the upright plate image, its
+    homography from the source image, the per-well colors and the fitted grid.
+    """
+    import numpy as np
+    from config import WELL_SAMPLING
+    from plate_detector import detect_plate_with_transform
+    from well_extractor import extract_wells_with_grid
     
     # --- Step 2: Detect plate ---
     print("[2/6] Plak bölgesi tespit ediliyor...")
-    plate = detect_plate(image)
+    with span('detect_plate'):
+        plate, transform = detect_plate_with_transform(image)
     print(f"       Plak boyutu: {plate.shape[1]}x{plate.shape[0]} px")
     
     # --- Step 3: Extract wells ---
     print("[3/6] Kuyucuklar çıkarılıyor (8×12 grid)...")
-    wells = extract_wells(plate)
+    source = (image, np.linalg.inv(transform)) if WELL_SAMPLING == 'source' else None
+    with span('extract_wells'):
+        wells, geometry = extract_wells_with_grid(plate, debug_path=debug_path, source=source)
     print(f"       {len(wells)} kuyucuk çıkarıldı")
     
+    return plate, transform, wells, geometry
+
+
+def locate_wells_with_rig(image, profile: dict, debug_path: str = None) -> tuple:
+    """
+    Steps 2-3 from a rig profile: warp with the saved homography and keep the
+    saved grid once the verification wells are found where it expects them.
+    Returns locate_wells()'s tuple, or None when the verification fails.
+    """
+    import numpy as np
+    from config import WELL_SAMPLING
+    from rig_profile import warp_plate, verify_grid
+    from well_extractor import (
+        lattice_grid, sample_well_colors, sample_well_colors_source, save_debug_grid
+    )
+    
+    print(f"[2/6] Plak konumu rig profilinden alınıyor ({profile['name']})...")
+    with span('rig_plate'):
+        plate, transform = warp_plate(image, profile)
+    grid_params, med_radius = profile['grid_params'], profile['med_radius']
+    with span('rig_verify'):
+        matched, checked, ok = verify_grid(plate, grid_params, med_radius)
+    print(f"       Doğrulama: {matched}/{checked} kuyucuk beklenen yerde bulundu")
+    if not ok:
+        return None
+    
+    print("[3/6] Kuyucuklar rig gridinden örnekleniyor...")
+    grid = lattice_grid(grid_params, med_radius, detected=True)
+    if debug_path:
+        with span('debug_image'):
+            save_debug_grid(plate, grid, med_radius, debug_path)
+    with span('color_extraction'):
+        if WELL_SAMPLING == 'source':
+            wells = sample_well_colors_source(image, np.linalg.inv(transform), grid,
+                                              med_radius, plate.shape)
+        else:
+            wells = sample_well_colors(plate, grid, med_radius)
+    print(f"       {len(wells)} kuyucuk çıkarıldı")
+    
+    geometry = {'grid': grid, 'grid_params': grid_params, 'med_radius': med_radius}
+    return plate, transform, wells, geometry
+
+
+def full_resolution_colors(full_image, factor: int, transform, plate_shape,
+                           geometry: dict, wells: dict) -> dict:
+    """
+    Re-measure well colors on full-resolution pixels after the grid was
+    fitted on a 1/factor decode. Only the color fields are replaced; centers
+    and radii stay in the (reduced) plate coordinates used for drawing.
+    """
+    import cv2
+    import numpy as np
+    from config import WELL_SAMPLING
+    from image_loader import to_full_resolution
+    from well_extractor import sample_well_colors, sample_well_colors_source
+    
+    up = to_full_resolution(factor)
+    color_fields = ('hsv_median', 'hsv_mean', 'rgb_mean', 'pixel_count')
+    if WELL_SAMPLING == 'source':
+        # Reduced plate -> reduced source -> full source; nothing is warped
+        full_wells = sample_well_colors_source(full_image, up @ np.linalg.inv(transform),
+                                               geometry['grid'], geometry['med_radius'],
+                                               plate_shape)
+        return {key: {**w, **{f: full_wells[key][f] for f in color_fields}}
+                for key, w in wells.items()}
+    
+    full_transform = up @ transform @ np.linalg.inv(up)
+    size = (plate_shape[1] * factor, plate_shape[0] * factor)
+    full_plate = cv2.warpPerspective(full_image, full_transform, size)
+    
+    offset = (factor - 1) / 2
+    grid = {key: {**g, 'cx': g['cx'] * factor + offset, 'cy': g['cy'] * factor + offset,
+                  'radius': g.get('radius', geometry['med_radius']) * factor}
+            for key, g in geometry['grid'].items()}
+    full_wells = sample_well_colors(full_plate, grid, geometry['med_radius'] * factor)
+    
+    return {key: {**w, **{f: full_wells[key][f] for f in color_fields}}
+            for key, w in wells.items()}
+
+
+def score_wells(wells: dict) -> tuple:
+    """Run steps 4-5 (classification, MIC) on extracted wells; returns (classified, results)."""
+    from color_classifier import classify_wells
+    from mic_calculator import calculate_mic, print_results
+    
     # Debug: print sample well HSV values
     from config import ROW_LABELS, ANTIFUNGALS
     print("\n       Örnek HSV değerleri (medyan):")
@@ -66,7 +197,8 @@ def run_pipeline(image_path: str, output_dir: str = '.'):
     
     # --- Step 4: Classify wells ---
     print("[4/6] Renk sınıflandırması yapılıyor (hibrit: relatif + absolut)...")
-    classified = classify_wells(wells)
+    with span('classify_wells'):
+        classified = classify_wells(wells)
     
     # Count classifications
     counts = {'growth': 0, 'inhibition': 0, 'partial': 0}
@@ -77,49 +209,466 @@ def run_pipeline(image_path: str, output_dir: str = '.'):
     
     # --- Step 5: Calculate MIC ---
     print("[5/6] MIC değerleri hesaplanıyor...")
-    results = calculate_mic(classified)
+    with span('calculate_mic'):
+        results = calculate_mic(classified)
     print_results(results)
     
+    return classified, results
+
+
+def run_pipeline(image_path: str, output_dir: str = '.', outputs=DEFAULT_OUTPUTS,
+                 cache_dir: str = None, rig: dict = None, save_rig: str = None,
+                 base_name: str = None):
+    """
+    Execute the full MIC plate reading pipeline.
+    Only the artifacts named in `outputs` are produced; the paths of the
+    skipped ones are returned as None. With cache_dir, results and artifacts
+    are served from / saved to the result cache, and on a result miss the
+    cached plate/grid/well geometry lets steps 2-3 be skipped.
+    rig is a loaded rig profile (rig_profile.load_profile) to try before
+    full detection; save_rig names a profile to write from this image.
+    base_name overrides the output file stem (default: the image's name).
+    """
+    import cv2
+    from image_loader import load_image
+    from config import DECODE_FULL_RES_COLORS
+    
+    print("=" * 60)
+    print("  MIC YST Plate Reader v1.0")
+    print("  EUCAST Uyumlu Mikrodilüsyon MIC Tayini")
+    print("=" * 60)
+    print()
+    
+    base_name = base_name or os.path.splitext(os.path.basename(image_path))[0]
+    
+    digest = geometry = None
+    if cache_dir:
+        import result_cache
+        with span('cache_lookup'):
+            try:
+                digest = result_cache.file_digest(image_path)
+            except OSError:
+                digest = None  # reported by the image load below
+            if digest and rig:
+                # Rig runs keep their own entries: their grid is the profile's
+                import hashlib
+                from rig_profile import profile_digest
+                digest = hashlib.sha256(f"{digest}:rig:{profile_digest(rig)}".encode()).hexdigest()
+            hit = digest and not save_rig and result_cache.lookup(
+                cache_dir, result_cache.result_key(digest), outputs)
+            if digest and not hit and not save_rig:
+                geometry = result_cache.lookup_geometry(
+                    cache_dir, result_cache.geometry_key(digest))
+        if hit:
+            return _serve_cached(hit, output_dir, base_name)
+    
+    if outputs:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    debug_path = None
+    if 'debug' in outputs:
+        debug_path = os.path.join(output_dir, f"{base_name}_debug_grid.png")
+    
+    if geometry:
+        plate = _plate_from_geometry(image_path, geometry, outputs, debug_path)
+        classified, results = score_wells(geometry['wells'])
+    else:
+        # --- Step 1: Load image ---
+        print("[1/6] Görüntü yükleniyor...")
+        with span('load_image'):
+            image, factor, full_size = load_image(image_path)
+        if image is None:
+            print(f"[ERROR] Görüntü okunamadı: {image_path}")
+            sys.exit(1)
+        print(f"       Boyut: {full_size[0]}x{full_size[1]} px")
+        if factor > 1:
+            print(f"       1/{factor} çözünürlükte okundu: {image.shape[1]}x{image.shape[0]} px")
+        
+        located = None
+        if rig:
+            from rig_profile import applies_to
+            if not applies_to(rig, factor, full_size):
+                print(f"[WARN] Rig profili bu görüntü boyutu için değil "
+                      f"({rig['image_size'][0]}x{rig['image_size'][1]} px), tam tespit yapılıyor")
+            else:
+                located = locate_wells_with_rig(image, rig, debug_path=debug_path)
+                if located is None:
+                    print("[WARN] Rig profili doğrulanamadı, tam tespit yapılıyor")
+        if located is None:
+            located = locate_wells(image, debug_path=debug_path)
+            if save_rig:
+                from rig_profile import save_profile
+                path = save_profile(save_rig, located[1], located[0].shape[1::-1],
+                                    located[3], factor, full_size)
+                print(f"[INFO] Rig profili kaydedildi: {path}")
+        plate, transform, wells, fitted = located
+        if factor > 1 and DECODE_FULL_RES_COLORS:
+            with span('full_res_colors'):
+                wells = full_resolution_colors(cv2.imread(image_path), factor, transform,
+                                               plate.shape, fitted, wells)
+        classified, results = score_wells(wells)
+        if digest:
+            with span('cache_store'):
+                result_cache.store_geometry(cache_dir, result_cache.geometry_key(digest),
+                                            transform, plate.shape[1::-1], fitted, wells)
+    
     # --- Step 6: Generate outputs ---
-    print("[6/6] Çıktılar oluşturuluyor...")
+    annotated_path, heatmap_path, csv_path = write_outputs(
+        plate, classified, results, output_dir, base_name, outputs)
     
-    os.makedirs(output_dir, exist_ok=True)
-    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    if digest:
+        with span('cache_store'):
+            result_cache.store(cache_dir, result_cache.result_key(digest), results, {
+                'annotated': annotated_path, 'heatmap': heatmap_path,
+                'csv': csv_path, 'debug': debug_path,
+            })
+    
+    print()
+    print("✓ İşlem tamamlandı!")
+    print()
+    
+    return results, annotated_path, heatmap_path, csv_path
+
+
+def write_outputs(plate, classified: dict, results: list, output_dir: str,
+                  base_name: str, outputs) -> tuple:
+    """Step 6: write the requested artifacts; returns (annotated, heatmap, csv) paths or None."""
+    import cv2
+    
+    annotated_path = heatmap_path = csv_path = None
+    if not outputs:
+        print("[6/6] Çıktı üretimi atlandı")
+    elif any(o in outputs for o in ('annotated', 'heatmap', 'csv')):
+        print("[6/6] Çıktılar oluşturuluyor...")
+        from visualizer import (
+            create_annotated_image, create_score_heatmap,
+            save_csv_report
+        )
     
     # Annotated image
-    annotated = create_annotated_image(plate, classified, results)
-    annotated_path = os.path.join(output_dir, f"{base_name}_annotated.png")
-    cv2.imwrite(annotated_path, annotated)
-    print(f"       Annotated görsel: {annotated_path}")
+    if 'annotated' in outputs:
+        annotated_path = os.path.join(output_dir, f"{base_name}_annotated.png")
+        with span('annotated_image'):
+            annotated = create_annotated_image(plate, classified, results)
+            cv2.imwrite(annotated_path, annotated)
+        print(f"       Annotated görsel: {annotated_path}")
     
     # Heatmap
-    heatmap = create_score_heatmap(classified)
-    heatmap_path = os.path.join(output_dir, f"{base_name}_heatmap.png")
-    cv2.imwrite(heatmap_path, heatmap)
-    print(f"       Isı haritası: {heatmap_path}")
+    if 'heatmap' in outputs:
+        heatmap_path = os.path.join(output_dir, f"{base_name}_heatmap.png")
+        with span('heatmap'):
+            heatmap = create_score_heatmap(classified)
+            cv2.imwrite(heatmap_path, heatmap)
+        print(f"       Isı haritası: {heatmap_path}")
     
     # CSV report
-    csv_path = os.path.join(output_dir, f"{base_name}_report.csv")
-    save_csv_report(results, classified, csv_path)
+    if 'csv' in outputs:
+        csv_path = os.path.join(output_dir, f"{base_name}_report.csv")
+        with span('csv_report'):
+            save_csv_report(results, classified, csv_path)
+    
+    return annotated_path, heatmap_path, csv_path
+
+
+def run_multi_plate(image_path: str, output_dir: str = '.', outputs=DEFAULT_OUTPUTS,
+                    workers: int = None) -> list:
+    """
+    Analyse every plate in a photo of several plates (plate_detector.detect_plates).
+    Steps 3-5 run for the plates in parallel on a process pool; artifacts are
+    named <name>_plate<n>_*. Under an active tracer, each worker's spans are
+    merged into it. Returns one dict per plate in reading order:
+    {'index', 'center', 'corners' (full-resolution image pixels), 'results',
+     'annotated', 'heatmap', 'csv'}.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import cv2
+    import numpy as np
+    import tracing
+    from batch import _init_worker
+    from image_loader import load_image, to_full_resolution
+    from plate_detector import detect_plates
+    
+    print("=" * 60)
+    print("  MIC YST Plate Reader v1.0 - Çoklu plak")
+    print("=" * 60)
+    print()
+    
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    if outputs:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    print("[1/6] Görüntü yükleniyor...")
+    with span('load_image'):
+        image, factor, full_size = load_image(image_path)
+    if image is None:
+        print(f"[ERROR] Görüntü okunamadı: {image_path}")
+        sys.exit(1)
+    print(f"       Boyut: {full_size[0]}x{full_size[1]} px")
+    
+    print("[2/6] Plaklar tespit ediliyor...")
+    with span('detect_plates'):
+        plates = detect_plates(image)
+    up = to_full_resolution(factor)
+    positions = []
+    for i, (plate, _, corners) in enumerate(plates):
+        full_corners = cv2.perspectiveTransform(
+            corners.reshape(-1, 1, 2).astype(np.float64), up).reshape(4, 2)
+        cx, cy = full_corners.mean(axis=0)
+        positions.append(((float(cx), float(cy)), full_corners.round(1).tolist()))
+        print(f"       Plak {i + 1}: {plate.shape[1]}x{plate.shape[0]} px, "
+              f"merkez=({cx:.0f}, {cy:.0f})")
+    
+    debug_paths = [os.path.join(output_dir, f"{base_name}_plate{i + 1}_debug_grid.png")
+                   if 'debug' in outputs else None for i in range(len(plates))]
+    workers = max(1, min(len(plates), workers or os.cpu_count() or 1))
+    print(f"[3-5/6] {len(plates)} plak analiz ediliyor ({workers} işçi süreç)...")
+    with span('analyze_plates', plates=len(plates)):
+        if workers > 1:
+            parent = tracing.active()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                jobs = [pool.submit(_analyze_plate_job, plate, debug_path,
+                                    (f"{base_name}_plate{i + 1}", parent.memory,
+                                     parent.memory_budget_mb) if parent else None)
+                        for i, ((plate, _, _), debug_path) in enumerate(zip(plates, debug_paths))]
+                analysed = [job.result() for job in jobs]
+            for *_, spans in analysed:
+                if spans:
+                    parent.merge(spans)
+        else:
+            analysed = [_analyze_plate_job(plate, debug_path)
+                        for (plate, _, _), debug_path in zip(plates, debug_paths)]
+    
+    records = []
+    for i, ((plate, _, _), (log, classified, results, _), (center, corners)) in enumerate(
+            zip(plates, analysed, positions)):
+        print()
+        print(f"----- Plak {i + 1}/{len(plates)} -----")
+        print(log, end='')
+        paths = write_outputs(plate, classified, results, output_dir,
+                              f"{base_name}_plate{i + 1}", outputs)
+        records.append({'index': i, 'center': center, 'corners': corners,
+                        'results': results, 'annotated': paths[0],
+                        'heatmap': paths[1], 'csv': paths[2]})
     
     print()
     print("✓ İşlem tamamlandı!")
     print()
+    return records
+
+
+def _analyze_plate_job(plate, debug_path: str = None, trace: tuple = None) -> tuple:
+    """
+    Steps 3-5 on one upright plate; returns (printed log, classified, results,
+    spans). In a worker process, trace = (name, memory, memory budget) records
+    the spans on a tracer of its own; spans is then its export(), else None.
+    """
+    import io
+    import contextlib
+    import tracing
+    from well_extractor import extract_wells_with_grid
     
-    return results, annotated_path, heatmap_path, csv_path
+    tracer = tracing.start(*trace) if trace else None
+    log = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            print("[3/6] Kuyucuklar çıkarılıyor (8×12 grid)...")
+            with span('extract_wells'):
+                wells, _ = extract_wells_with_grid(plate, debug_path=debug_path)
+            print(f"       {len(wells)} kuyucuk çıkarıldı")
+            classified, results = score_wells(wells)
+    finally:
+        if tracer:
+            tracing.stop()
+    return log.getvalue(), classified, results, tracer.export() if tracer else None
 
 
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Kullanım: python main.py <görüntü_yolu> [--output-dir <klasör>]")
+def _plate_from_geometry(image_path: str, geometry: dict, outputs, debug_path: str):
+    """
+    Stand-in for steps 1-3 on a geometry cache hit. The plate image is only
+    rebuilt (read + one warp) when an artifact needs it; returns it or None.
+    """
+    import cv2
+    
+    from image_loader import load_image
+    
+    print("[1-3/6] Plak ve kuyucuk geometrisi önbellekten alındı")
+    ox, oy, sx, sy = geometry['grid_params']
+    print(f"       Grid: başlangıç=({ox:.1f}, {oy:.1f}), adım=({sx:.1f}, {sy:.1f})")
+    if 'annotated' not in outputs and 'debug' not in outputs:
+        return None
+    
+    # Same decode as the run that produced the transform
+    with span('load_image'):
+        image, _, _ = load_image(image_path)
+    if image is None:
+        print(f"[ERROR] Görüntü okunamadı: {image_path}")
         sys.exit(1)
+    with span('plate_warp'):
+        plate = cv2.warpPerspective(image, geometry['transform'], geometry['plate_size'])
+    if debug_path:
+        from well_extractor import save_debug_grid
+        with span('debug_image'):
+            save_debug_grid(plate, geometry['grid'], geometry['med_radius'], debug_path)
+    return plate
+
+
+def _serve_cached(hit: dict, output_dir: str, base_name: str):
+    """Copy a cache hit's artifacts into output_dir and print its MIC table."""
+    import shutil
+    from mic_calculator import print_results
+    from result_cache import ARTIFACT_FILES
+    
+    print("[1/6] Önbellekte bulundu, analiz atlandı")
+    paths = {}
+    if hit['artifacts']:
+        os.makedirs(output_dir, exist_ok=True)
+    for kind, cached_path in hit['artifacts'].items():
+        paths[kind] = os.path.join(output_dir, f"{base_name}_{ARTIFACT_FILES[kind]}")
+        shutil.copyfile(cached_path, paths[kind])
+        print(f"       {paths[kind]}")
+    
+    print_results(hit['results'])
+    print("✓ İşlem tamamlandı!")
+    print()
+    
+    return hit['results'], paths.get('annotated'), paths.get('heatmap'), paths.get('csv')
+
+
+def warm_up():
+    """Run the OpenCV kernels used by the pipeline once on a tiny image."""
+    import cv2
+    import numpy as np
+    
+    dummy = np.zeros((64, 96, 3), dtype=np.uint8)
+    gray = cv2.cvtColor(dummy, cv2.COLOR_BGR2GRAY)
+    cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 30, 100)
+    cv2.HoughCircles(cv2.GaussianBlur(gray, (7, 7), 2), cv2.HOUGH_GRADIENT,
+                     dp=1.0, minDist=5, param1=50, param2=22, minRadius=2, maxRadius=6)
+    cv2.cvtColor(dummy, cv2.COLOR_BGR2HSV)
+    cv2.imencode('.png', dummy)
+
+
+def parse_outputs(argv: list) -> tuple:
+    """Read --only / --outputs from the command line (ValueError if invalid)."""
+    if '--only' in argv:
+        idx = argv.index('--only')
+        if idx + 1 < len(argv) and argv[idx + 1] == 'mic':
+            return ()
+        raise ValueError("--only yalnızca 'mic' değerini alır")
+    
+    if '--outputs' in argv:
+        idx = argv.index('--outputs')
+        if idx + 1 >= len(argv):
+            raise ValueError("--outputs için liste gerekli (ör. csv,annotated)")
+        outputs = tuple(o.strip() for o in argv[idx + 1].split(',') if o.strip())
+        unknown = [o for o in outputs if o not in OUTPUT_TYPES]
+        if unknown:
+            raise ValueError(f"Bilinmeyen çıktı türü: {', '.join(unknown)} "
+                             f"(geçerli: {', '.join(OUTPUT_TYPES)})")
+        return outputs
     
-    image_path = sys.argv[1]
+    return DEFAULT_OUTPUTS
+
+
+def main(argv: list) -> int:
+    """Command line entry point; argv excludes the program name."""
+    if len(argv) < 1:
+        print("Kullanım: python main.py <görüntü_yolu> [--output-dir <klasör>] "
+              "[--outputs annotated,heatmap,csv,debug | --only mic]")
+        return 1
+    
+    image_path = argv[0]
     output_dir = '.'
     
-    if '--output-dir' in sys.argv:
-        idx = sys.argv.index('--output-dir')
-        if idx + 1 < len(sys.argv):
-            output_dir = sys.argv[idx + 1]
+    if '--output-dir' in argv:
+        idx = argv.index('--output-dir')
+        if idx + 1 < len(argv):
+            output_dir = argv[idx + 1]
+    
+    trace_path = None
+    if '--trace' in argv:
+        idx = argv.index('--trace')
+        if idx + 1 < len(argv):
+            trace_path = argv[idx + 1]
+    
+    profile_path = None
+    if '--profile' in argv:
+        idx = argv.index('--profile')
+        if idx + 1 < len(argv):
+            profile_path = argv[idx + 1]
+    
+    cache_dir = None
+    if '--cache-dir' in argv:
+        idx = argv.index('--cache-dir')
+        if idx + 1 < len(argv):
+            cache_dir = argv[idx + 1]
+    
+    rig = save_rig = None
+    if '--rig' in argv:
+        idx = argv.index('--rig')
+        if idx + 1 < len(argv):
+            from rig_profile import load_profile
+            try:
+                rig = load_profile(argv[idx + 1])
+            except ValueError as e:
+                print(f"[ERROR] {e}")
+                return 1
+    if '--save-rig' in argv:
+        idx = argv.index('--save-rig')
+        if idx + 1 < len(argv):
+            save_rig = argv[idx + 1]
     
-    run_pipeline(image_path, output_dir)
+    multi_plate = '--multi-plate' in argv
+    workers = None
+    if '--workers' in argv:
+        idx = argv.index('--workers')
+        if idx + 1 < len(argv):
+            workers = int(argv[idx + 1])
+    if multi_plate and (cache_dir or rig or save_rig):
+        print("[WARN] --multi-plate ile --cache-dir, --rig ve --save-rig kullanılmaz")
+    
+    memory = '--memory' in argv
+    mem_budget = None
+    if '--mem-budget' in argv:
+        idx = argv.index('--mem-budget')
+        if idx + 1 < len(argv):
+            mem_budget = float(argv[idx + 1])
+    
+    try:
+        outputs = parse_outputs(argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    
+    tracer = None
+    if trace_path or memory:
+        import tracing
+        tracer = tracing.start(os.path.basename(image_path), memory, mem_budget)
+    profiler = None
+    if profile_path:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    
+    try:
+        with span('pipeline'):
+            if multi_plate:
+                run_multi_plate(image_path, output_dir, outputs, workers)
+            else:
+                run_pipeline(image_path, output_dir, outputs, cache_dir, rig, save_rig)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_path)
+            print(f"[INFO] cProfile kaydı: {profile_path}")
+        if tracer:
+            tracing.stop()
+            tracer.print_summary()
+            if trace_path:
+                tracer.save(trace_path)
+                print(f"[INFO] Zaman izi (Chrome trace): {trace_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -5,6 +5,11 @@ For top-down shots, performs light alignment and cropping.
 
 import cv2
 import numpy as np
+from config import PLATE_COARSE_TO_FINE, PLATE_COARSE_MAX_PX, MULTI_PLATE_MIN_AREA_FRACTION
+from tracing import span
+
+# Accepted width/height of a plate outline (96-well plate: 127.76mm x 85.48mm)
+PLATE_ASPECT_RANGE = (1.2, 1.8)
 
 
 def detect_plate(image: np.ndarray) -> np.ndarray:
@@ -17,40 +22,42 @@ def detect_plate(image: np.ndarray) -> np.ndarray:
     3. Apply perspective transform if needed
     4. Return cropped plate image
     """
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    plate, _ = detect_plate_with_transform(image)
+    return plate
+
+
+def detect_plate_with_transform(image: np.ndarray) -> tuple:
+    """
+    Same as detect_plate, but returns (plate_image, M) where M is the 3x3
+    homography from image to plate coordinates, so the plate can be rebuilt
+    with cv2.warpPerspective(image, M, (plate_w, plate_h)).
+    """
+    if PLATE_COARSE_TO_FINE and max(image.shape[:2]) > 2 * PLATE_COARSE_MAX_PX:
+        with span('plate_coarse_to_fine'):
+            pts = _coarse_to_fine_corners(image)
+        if pts is not None:
+            return _warp_plate(image, pts)
     
-    # Adaptive thresholding to find plate edges
-    edges = cv2.Canny(blurred, 30, 100)
+    with span('plate_edges'):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        edges = _plate_edges(gray)
     
-    # Dilate to connect edge fragments
-    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
-    edges = cv2.dilate(edges, kernel, iterations=2)
-    
-    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    with span('plate_contours'):
+        contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     
     if not contours:
         print("[WARN] No contours found, using full image as plate region")
-        return image.copy()
+        return image.copy(), np.eye(3)
     
     # Sort by area, pick the largest
     contours = sorted(contours, key=cv2.contourArea, reverse=True)
     
-    plate_contour = None
-    for cnt in contours[:5]:
-        # Approximate to polygon
-        peri = cv2.arcLength(cnt, True)
-        approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
-        
-        if len(approx) == 4:
-            plate_contour = approx
-            break
+    plate_contour = _find_quadrilateral(contours)
     
     if plate_contour is not None:
         # Order points: top-left, top-right, bottom-right, bottom-left
         pts = order_points(plate_contour.reshape(4, 2))
-        warped = four_point_transform(image, pts)
-        return warped
+        return _warp_plate(image, pts)
     else:
         # Fallback: use bounding rect of largest contour
         x, y, w, h = cv2.boundingRect(contours[0])
@@ -63,11 +70,191 @@ def detect_plate(image: np.ndarray) -> np.ndarray:
         
         aspect = w / h
         # 96-well plate aspect ratio is ~1.5 (127.76mm x 85.48mm)
-        if 1.2 < aspect < 1.8:
-            return image[y:y+h, x:x+w].copy()
+        if PLATE_ASPECT_RANGE[0] < aspect < PLATE_ASPECT_RANGE[1]:
+            return image[y:y+h, x:x+w].copy(), _translation(-x, -y)
         else:
             print("[WARN] Could not find plate rectangle, using full image")
-            return image.copy()
+            return image.copy(), np.eye(3)
+
+
+def detect_plates(image: np.ndarray) -> list:
+    """
+    Multi-plate variant of detect_plate_with_transform for photos with several
+    plates side by side. Every convex quadrilateral contour with a plate-like
+    aspect ratio and at least MULTI_PLATE_MIN_AREA_FRACTION of the largest
+    contour's area is a plate. Returns [(plate_image, M, corners)] in reading
+    order (rows top to bottom, left to right); when no quadrilateral is found
+    the single-plate result (with its fallbacks) is the only entry.
+    """
+    h, w = image.shape[:2]
+    corner_sets = None
+    if PLATE_COARSE_TO_FINE and max(h, w) > 2 * PLATE_COARSE_MAX_PX:
+        with span('plate_coarse_to_fine'):
+            edges, scale = _coarse_edges(image)
+            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            corner_sets = []
+            for quad in _find_plate_quadrilaterals(contours):
+                pts = _refine_corners(image, order_points(quad.reshape(4, 2)) * scale, scale)
+                if pts is None:
+                    corner_sets = None  # search everything at full resolution instead
+                    break
+                corner_sets.append(pts)
+    
+    if not corner_sets:
+        with span('plate_edges'):
+            edges = _plate_edges(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+        with span('plate_contours'):
+            contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        corner_sets = [order_points(quad.reshape(4, 2))
+                       for quad in _find_plate_quadrilaterals(contours)]
+    
+    if not corner_sets:
+        plate, M = detect_plate_with_transform(image)
+        ph, pw = plate.shape[:2]
+        corners = np.array([[0, 0], [pw - 1, 0], [pw - 1, ph - 1], [0, ph - 1]],
+                           dtype=np.float64).reshape(-1, 1, 2)
+        corners = cv2.perspectiveTransform(corners, np.linalg.inv(M)).reshape(4, 2)
+        return [(plate, M, corners.astype(np.float32))]
+    
+    plates = []
+    for pts in _reading_order(corner_sets):
+        plate, M = _warp_plate(image, pts)
+        plates.append((plate, M, pts))
+    return plates
+
+
+def _find_plate_quadrilaterals(contours) -> list:
+    """Plate-shaped 4-vertex contours, largest first (see detect_plates)."""
+    quads = []
+    contours = sorted(contours, key=cv2.contourArea, reverse=True)[:20]
+    # Measured against the largest contour of any shape, so that small
+    # quadrilaterals never stand in for a plate that is not one
+    min_area = cv2.contourArea(contours[0]) * MULTI_PLATE_MIN_AREA_FRACTION if contours else 0
+    for cnt in contours:
+        if cv2.contourArea(cnt) < min_area:
+            break
+        peri = cv2.arcLength(cnt, True)
+        approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
+        if len(approx) != 4 or not cv2.isContourConvex(approx):
+            continue
+        _, (pw, ph) = plate_homography(order_points(approx.reshape(4, 2)))
+        if ph == 0 or not PLATE_ASPECT_RANGE[0] < pw / ph < PLATE_ASPECT_RANGE[1]:
+            continue
+        quads.append(approx)
+    return quads
+
+
+def _reading_order(corner_sets: list) -> list:
+    """Group plates into rows (center inside the row's vertical extent), then left to right."""
+    rows = []  # [bottom, plates]
+    for pts in sorted(corner_sets, key=lambda p: p[:, 1].mean()):
+        if rows and pts[:, 1].mean() < rows[-1][0]:
+            rows[-1][1].append(pts)
+        else:
+            rows.append([pts[:, 1].max(), [pts]])
+    return [pts for _, row in rows for pts in sorted(row, key=lambda p: p[:, 0].mean())]
+
+
+def _plate_edges(gray: np.ndarray) -> np.ndarray:
+    blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+    
+    # Adaptive thresholding to find plate edges
+    edges = cv2.Canny(blurred, 30, 100)
+    
+    # Dilate to connect edge fragments
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (5, 5))
+    return cv2.dilate(edges, kernel, iterations=2)
+
+
+def _find_quadrilateral(contours):
+    """First of the 5 largest contours that simplifies to 4 vertices, or None."""
+    for cnt in contours[:5]:
+        # Approximate to polygon
+        peri = cv2.arcLength(cnt, True)
+        approx = cv2.approxPolyDP(cnt, 0.02 * peri, True)
+        
+        if len(approx) == 4:
+            return approx
+    return None
+
+
+def _warp_plate(image: np.ndarray, pts: np.ndarray) -> tuple:
+    M, size = plate_homography(pts)
+    with span('plate_warp'):
+        warped = cv2.warpPerspective(image, M, size)
+    return warped, M
+
+
+def _coarse_to_fine_corners(image: np.ndarray):
+    """
+    Find the plate quadrilateral on a copy downscaled to PLATE_COARSE_MAX_PX,
+    then move every corner to the outermost full-resolution edge pixel (in
+    that corner's direction) within a few coarse pixels of it. Returns the
+    ordered corners, or None when the coarse pass finds no quadrilateral or a
+    corner window has no edges (the caller then runs the full-resolution
+    search and its fallbacks).
+    """
+    edges, scale = _coarse_edges(image)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    quad = _find_quadrilateral(sorted(contours, key=cv2.contourArea, reverse=True))
+    if quad is None:
+        return None
+    return _refine_corners(image, order_points(quad.reshape(4, 2)) * scale, scale)
+
+
+def _coarse_edges(image: np.ndarray) -> tuple:
+    """Plate edges of a copy downscaled to PLATE_COARSE_MAX_PX; returns (edges, scale)."""
+    h, w = image.shape[:2]
+    scale = max(h, w) / PLATE_COARSE_MAX_PX
+    # Pixel striding first: INTER_AREA over the full frame costs as much as
+    # the full-resolution search this replaces; plate edges survive it
+    stride = max(1, int(scale // 2))
+    small = cv2.resize(image[::stride, ::stride], (round(w / scale), round(h / scale)),
+                       interpolation=cv2.INTER_AREA)
+    return _plate_edges(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)), scale
+
+
+def _refine_corners(image: np.ndarray, corners: np.ndarray, scale: float):
+    """
+    Move ordered coarse corners (in full-resolution pixels) to the outermost
+    full-resolution edge pixel near each; None if a window has no edges.
+    Only edges in a band around the two coarse plate sides through a corner
+    count, so wells or background clutter inside the window are ignored, and
+    a corner that would move further than the coarse contour can be off
+    keeps its coarse position.
+    """
+    h, w = image.shape[:2]
+    # The coarse contour sits up to ~4 coarse pixels outside the edge (two
+    # 5x5 dilations), plus the same dilation reach at full resolution
+    reach = int(np.ceil(scale * 4)) + 4
+    r = 2 * reach  # window half-size
+    pad = 8  # context so blur/Canny/dilate see the same pixels as on the full image
+    refined = []
+    # Outward directions in order_points order: TL, TR, BR, BL
+    for i, ((x, y), (dx, dy)) in enumerate(zip(corners, ((-1, -1), (1, -1), (1, 1), (-1, 1)))):
+        x0, y0 = max(0, int(x) - r), max(0, int(y) - r)
+        x1, y1 = min(w, int(x) + r + 1), min(h, int(y) + r + 1)
+        px0, py0 = max(0, x0 - pad), max(0, y0 - pad)
+        px1, py1 = min(w, x1 + pad), min(h, y1 + pad)
+
+        window = cv2.cvtColor(image[py0:py1, px0:px1], cv2.COLOR_BGR2GRAY)
+        window_edges = _plate_edges(window)[y0 - py0:y1 - py0, x0 - px0:x1 - px0]
+
+        # Band of +-reach around the coarse sides to the neighbouring corners
+        band = np.zeros_like(window_edges)
+        corner = (int(round(x)) - x0, int(round(y)) - y0)
+        for nx, ny in (corners[i - 1], corners[(i + 1) % 4]):
+            cv2.line(band, corner, (int(round(nx)) - x0, int(round(ny)) - y0), 255, 2 * reach + 1)
+        ys, xs = np.nonzero(window_edges & band)
+        if len(xs) == 0:
+            return None
+        best = np.argmax(dx * xs + dy * ys)
+        fx, fy = xs[best] + x0, ys[best] + y0
+        if np.hypot(fx - x, fy - y) > reach * np.sqrt(2):
+            fx, fy = x, y  # farther than both sides can be off: keep the coarse corner
+        refined.append((fx, fy))
+
+    return np.array(refined, dtype=np.float32)
 
 
 def order_points(pts: np.ndarray) -> np.ndarray:
@@ -87,6 +274,15 @@ def order_points(pts: np.ndarray) -> np.ndarray:
 
 def four_point_transform(image: np.ndarray, pts: np.ndarray) -> np.ndarray:
     """Apply perspective transform using 4 ordered corner points."""
+    M, size = plate_homography(pts)
+    with span('plate_warp'):
+        warped = cv2.warpPerspective(image, M, size)
+    
+    return warped
+
+
+def plate_homography(pts: np.ndarray) -> tuple:
+    """Homography and (width, height) of the upright plate for 4 ordered corners."""
     (tl, tr, br, bl) = pts
     
     # Compute new width
@@ -107,6 +303,8 @@ def four_point_transform(image: np.ndarray, pts: np.ndarray) -> np.ndarray:
     ], dtype=np.float32)
     
     M = cv2.getPerspectiveTransform(pts, dst)
-    warped = cv2.warpPerspective(image, M, (max_w, max_h))
-    
-    return warped
+    return M, (max_w, max_h)
+
+
+def _translation(dx: float, dy: float) -> np.ndarray:
+    return np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]], dtype=np.float64)
@@ -0,0 +1,322 @@
+"""
+Result Cache - Persistent on-disk cache of pipeline results, keyed by content.
+
+The same plate photo often arrives several times (forwards, re-uploads). The
+cache key is the SHA-256 of the image bytes combined with a fingerprint of
+the pipeline: every constant in config.py plus the source of the stage
+modules and of main.py, which strings them together. Changing a threshold or the code therefore invalidates old entries
+automatically; they are never hit again and age out through eviction.
+
+Layout:
+    <cache_dir>/<key[:2]>/<key>/results.json    MIC results + metadata
+    <cache_dir>/<key[:2]>/<key>/annotated.png   artifacts, whichever were made
+    <cache_dir>/<key[:2]>/<key>/heatmap.png
+    <cache_dir>/<key[:2]>/<key>/report.csv
+    <cache_dir>/<key[:2]>/<key>/debug_grid.png
+
+Geometry entries hold the intermediate products of steps 2-3 for an image:
+the plate homography, the fitted grid and the per-well color features
+(without the well crops). Their key only covers the parameters and modules
+those steps depend on, so after a change to the classifier or MIC settings
+the results miss but the geometry hits, and only classify_wells and
+calculate_mic run again.
+
+    <cache_dir>/<key[:2]>/<key>/geometry.json
+
+Eviction is least-recently-used: a hit touches the entry's JSON file, and
+a scan of the cache removes entries unused for RESULT_CACHE_MAX_AGE_DAYS,
+then the oldest ones until the cache fits in RESULT_CACHE_MAX_MB. Entries
+without either JSON file (a store that died half way) are removed once
+they are _INCOMPLETE_GRACE_S old. Stores do not scan every time: each
+process adds what it wrote to the size found by its last scan and scans
+again once that exceeds the limit, or after EVICT_INTERVAL_S (which also
+catches what other processes wrote).
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+
+CACHE_VERSION = 1
+
+# Output type -> file name inside an entry
+ARTIFACT_FILES = {
+    'annotated': 'annotated.png',
+    'heatmap': 'heatmap.png',
+    'csv': 'report.csv',
+    'debug': 'debug_grid.png',
+}
+
+_PIPELINE_MODULES = ('main.py', 'image_loader.py', 'plate_detector.py', 'well_extractor.py',
+                     'circle_voting.py', 'lattice_fft.py', 'hist_stats.py',
+                     'color_classifier.py', 'mic_calculator.py', 'visualizer.py')
+_GEOMETRY_MODULES = ('main.py', 'image_loader.py', 'plate_detector.py', 'well_extractor.py',
+                     'circle_voting.py', 'lattice_fft.py', 'hist_stats.py')
+
+# config.py entries that do not affect results
+_IGNORED_PARAMS = ('STAGE_MEMORY_BUDGET_MB', 'RESULT_CACHE_MAX_MB', 'RESULT_CACHE_MAX_AGE_DAYS',
+                   'HOUGH_WORKERS')
+# config.py entries read by plate detection and well extraction
+_GEOMETRY_PARAMS = ('ROWS', 'COLS', 'WELL_MASK_RADIUS_FRACTION',
+                    'SPECULAR_V_THRESHOLD', 'MIN_SATURATION',
+                    'DECODE_REDUCED', 'DECODE_TARGET_WELL_PX', 'DECODE_PLATE_FRACTION',
+                    'DECODE_PLATE_PITCHES', 'DECODE_FULL_RES_COLORS',
+                    'PLATE_COARSE_TO_FINE', 'PLATE_COARSE_MAX_PX',
+                    'WELL_SAMPLING', 'SOURCE_DISC_VERTICES', 'HOUGH_EARLY_EXIT_COVERAGE',
+                    'CIRCLE_ENGINE', 'CIRCLE_WORK_RADIUS_PX', 'CIRCLE_WORK_MAX_RATIO',
+                    'GRID_ENGINE', 'GRID_FFT_MIN_PEAK_RATIO', 'GRID_FFT_MIN_EDGE_CONTRAST',
+                    'COLOR_ENGINE')
+
+_fingerprints = {}
+
+# Seconds between full eviction scans when the size limit is not reached
+EVICT_INTERVAL_S = 3600
+# Entry folders without results.json/geometry.json younger than this may
+# still be being written by another process
+_INCOMPLETE_GRACE_S = 3600
+# cache_dir -> [time of the last scan, bytes in the cache since then]
+_usage = {}
+
+
+def _fingerprint(kind: str, param_names, modules) -> str:
+    if kind not in _fingerprints:
+        import config
+        h = hashlib.sha256(f"{kind} v{CACHE_VERSION}".encode())
+        params = {k: v for k, v in vars(config).items()
+                  if k.isupper() and k not in _IGNORED_PARAMS
+                  and (param_names is None or k in param_names)}
+        h.update(json.dumps(params, sort_keys=True, default=repr).encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in modules:
+            with open(os.path.join(here, name), 'rb') as f:
+                h.update(f.read())
+        _fingerprints[kind] = h.hexdigest()
+    return _fingerprints[kind]
+
+
+def params_hash() -> str:
+    """Fingerprint of everything besides the image that shapes the results."""
+    return _fingerprint('results', None, _PIPELINE_MODULES)
+
+
+def geometry_params_hash() -> str:
+    """Fingerprint of what plate detection and well extraction depend on."""
+    return _fingerprint('geometry', _GEOMETRY_PARAMS, _GEOMETRY_MODULES)
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def result_key(digest: str) -> str:
+    return hashlib.sha256(f"{digest}:{params_hash()}".encode()).hexdigest()
+
+
+def geometry_key(digest: str) -> str:
+    return hashlib.sha256(f"{digest}:{geometry_params_hash()}".encode()).hexdigest()
+
+
+def key_for_bytes(data: bytes) -> str:
+    return result_key(hashlib.sha256(data).hexdigest())
+
+
+def key_for_file(path: str) -> str:
+    return result_key(file_digest(path))
+
+
+def _entry_dir(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, key[:2], key)
+
+
+def lookup(cache_dir: str, key: str, outputs=()) -> dict:
+    """
+    Return the cached entry for key, or None.
+    An entry that lacks one of the requested artifacts counts as a miss.
+    The returned dict has 'results', 'artifacts' (output type -> path) and
+    the 'info' dict given to store().
+    """
+    entry = _entry_dir(cache_dir, key)
+    meta_path = os.path.join(entry, 'results.json')
+    try:
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    artifacts = {}
+    for kind in outputs:
+        path = os.path.join(entry, ARTIFACT_FILES[kind])
+        if not os.path.exists(path):
+            return None
+        artifacts[kind] = path
+
+    try:
+        os.utime(meta_path)  # mark as recently used
+    except OSError:
+        pass
+    return {'results': meta['results'], 'artifacts': artifacts, 'info': meta.get('info', {})}
+
+
+def store(cache_dir: str, key: str, results: list, artifacts: dict = None,
+          info: dict = None, max_mb: float = None, max_age_days: float = None):
+    """Save results and copies of the given artifacts, then evict."""
+    entry = _entry_dir(cache_dir, key)
+    os.makedirs(entry, exist_ok=True)
+
+    for kind, path in (artifacts or {}).items():
+        if path and os.path.exists(path):
+            target = os.path.join(entry, ARTIFACT_FILES[kind])
+            tmp = f"{target}.{os.getpid()}.tmp"
+            shutil.copyfile(path, tmp)
+            os.replace(tmp, target)
+
+    # results.json goes last: its presence marks the entry as complete
+    meta_path = os.path.join(entry, 'results.json')
+    tmp = f"{meta_path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'created': time.time(),
+                   'results': results, 'info': info or {}}, f, default=float)
+    os.replace(tmp, meta_path)
+
+    _maybe_evict(cache_dir, _dir_size(entry), max_mb, max_age_days)
+
+
+def lookup_geometry(cache_dir: str, key: str) -> dict:
+    """
+    Return the cached steps 2-3 products for key, or None:
+    {'transform': 3x3 ndarray, 'plate_size': (w, h), 'grid', 'grid_params',
+     'med_radius', 'wells'}. Wells carry every field except 'crop'.
+    """
+    import numpy as np
+
+    path = os.path.join(_entry_dir(cache_dir, key), 'geometry.json')
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+    def cell(name):
+        return tuple(int(v) for v in name.split(','))
+
+    wells = {}
+    for name, w in data['wells'].items():
+        for field in ('hsv_median', 'hsv_mean', 'rgb_mean', 'center', 'cell_bounds'):
+            w[field] = tuple(w[field])
+        wells[cell(name)] = w
+    return {
+        'transform': np.array(data['transform'], dtype=np.float64),
+        'plate_size': tuple(data['plate_size']),
+        'grid': {cell(name): g for name, g in data['grid'].items()},
+        'grid_params': tuple(data['grid_params']),
+        'med_radius': data['med_radius'],
+        'wells': wells,
+    }
+
+
+def store_geometry(cache_dir: str, key: str, transform, plate_size: tuple,
+                   geometry: dict, wells: dict, max_mb: float = None,
+                   max_age_days: float = None):
+    """Save the plate homography, fitted grid and well features, then evict."""
+    entry = _entry_dir(cache_dir, key)
+    os.makedirs(entry, exist_ok=True)
+    data = {
+        'version': CACHE_VERSION,
+        'created': time.time(),
+        'transform': [[float(v) for v in row] for row in transform],
+        'plate_size': [int(v) for v in plate_size],
+        'grid': {f"{r},{c}": g for (r, c), g in geometry['grid'].items()},
+        'grid_params': [float(v) for v in geometry['grid_params']],
+        'med_radius': float(geometry['med_radius']),
+        'wells': {f"{r},{c}": {k: v for k, v in w.items() if k != 'crop'}
+                  for (r, c), w in wells.items()},
+    }
+    path = os.path.join(entry, 'geometry.json')
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        # numpy scalars (e.g. np.bool_, np.float32) -> Python
+        json.dump(data, f, default=lambda o: o.item())
+    os.replace(tmp, path)
+
+    _maybe_evict(cache_dir, os.path.getsize(path), max_mb, max_age_days)
+
+
+def _dir_size(path: str) -> int:
+    return sum(f.stat().st_size for f in os.scandir(path))
+
+
+def _maybe_evict(cache_dir: str, added: int, max_mb: float, max_age_days: float):
+    """Count added bytes; scan with evict() only when a scan is due."""
+    from config import RESULT_CACHE_MAX_MB
+    max_mb = RESULT_CACHE_MAX_MB if max_mb is None else max_mb
+    usage = _usage.get(cache_dir)
+    if usage is not None:
+        usage[1] += added
+        if (time.time() - usage[0] < EVICT_INTERVAL_S
+                and not (max_mb and usage[1] > max_mb * 2**20)):
+            return
+    evict(cache_dir, max_mb, max_age_days)
+
+
+def evict(cache_dir: str, max_mb: float = None, max_age_days: float = None) -> int:
+    """
+    Drop stale and incomplete entries, then least recently used ones over
+    the size limit. Scans the whole cache; returns the number removed.
+    """
+    from config import RESULT_CACHE_MAX_MB, RESULT_CACHE_MAX_AGE_DAYS
+    max_mb = RESULT_CACHE_MAX_MB if max_mb is None else max_mb
+    max_age_days = RESULT_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+
+    now = time.time()
+    entries = []  # (last_used, size, path, incomplete)
+    if not os.path.isdir(cache_dir):
+        _usage.pop(cache_dir, None)
+        return 0
+    for shard in os.scandir(cache_dir):
+        if not shard.is_dir():
+            continue
+        for entry in os.scandir(shard.path):
+            if not entry.is_dir():
+                continue
+            try:
+                stats = {f.name: f.stat() for f in os.scandir(entry.path)}
+                size = sum(st.st_size for st in stats.values())
+                used = [st.st_mtime for name, st in stats.items()
+                        if name in ('results.json', 'geometry.json')]
+                # Incomplete: aged by its newest file (or the folder itself)
+                last_used = max(used or [st.st_mtime for st in stats.values()]
+                                or [entry.stat().st_mtime])
+            except OSError:
+                continue  # concurrently removed
+            entries.append((last_used, size, entry.path, not used))
+
+    entries.sort()
+    total = sum(size for _, size, _, _ in entries)
+    removed = 0
+    for last_used, size, path, incomplete in entries:
+        too_old = max_age_days and now - last_used > max_age_days * 86400
+        too_big = max_mb and total > max_mb * 2**20
+        if incomplete:
+            if now - last_used <= _INCOMPLETE_GRACE_S:
+                continue  # may still be being written
+        elif not (too_old or too_big):
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(path))  # drop the shard once it is empty
+        except OSError:
+            pass
+        total -= size
+        removed += 1
+    _usage[cache_dir] = [now, total]
+    return removed
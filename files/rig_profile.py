@@ -0,0 +1,145 @@
+"""
+Rig Profiles - Saved plate position and well grid for fixed camera mounts.
+
+On a station with a fixed camera and a plate jig, the plate homography and
+the fitted grid barely change between shots. A profile saves them once
+(main.py --save-rig <name>, after a full detection); later images
+(--rig <name>) are warped with the saved homography, and a few wells
+(RIG_VERIFY_WELLS) are searched with Hough in small windows around where
+the saved grid puts them. When enough of them are found the saved grid is
+used as-is and only color sampling runs; otherwise the full plate and
+circle detection runs as usual.
+
+A profile is <RIG_PROFILE_DIR>/<name>.json:
+    image_size   full (width, height) of the calibration image
+    factor       decode reduction it was analysed at (image_loader.py)
+    corners      plate corners in the decoded image (TL, TR, BR, BL)
+    transform    3x3 homography decoded image -> plate
+    plate_size   (width, height) of the upright plate
+    grid_params  (ox, oy, sx, sy) from fit_grid_robust
+    med_radius   median well radius on the plate
+A profile only applies to images of the same size.
+"""
+
+import os
+import json
+import time
+import hashlib
+
+import cv2
+import numpy as np
+
+from config import (
+    RIG_PROFILE_DIR, RIG_VERIFY_WELLS, RIG_VERIFY_MIN_MATCHES, RIG_VERIFY_TOLERANCE
+)
+
+PROFILE_VERSION = 1
+
+
+def profile_path(name: str) -> str:
+    """A name ending in .json is a path; anything else is looked up in RIG_PROFILE_DIR."""
+    if name.endswith('.json'):
+        return name
+    base = RIG_PROFILE_DIR
+    if not os.path.isabs(base):
+        base = os.path.join(os.path.dirname(os.path.abspath(__file__)), base)
+    return os.path.join(base, f"{name}.json")
+
+
+def save_profile(name: str, transform, plate_size: tuple, geometry: dict,
+                 factor: int, full_size: tuple) -> str:
+    """Write a profile from a full detection; returns its path."""
+    w, h = plate_size
+    plate_corners = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]],
+                             dtype=np.float64).reshape(-1, 1, 2)
+    corners = cv2.perspectiveTransform(plate_corners, np.linalg.inv(transform)).reshape(4, 2)
+    data = {
+        'version': PROFILE_VERSION,
+        'name': os.path.splitext(os.path.basename(name))[0],
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'image_size': [int(v) for v in full_size],
+        'factor': int(factor),
+        'corners': [[round(float(x), 2), round(float(y), 2)] for x, y in corners],
+        'transform': [[float(v) for v in row] for row in transform],
+        'plate_size': [int(w), int(h)],
+        'grid_params': [float(v) for v in geometry['grid_params']],
+        'med_radius': float(geometry['med_radius']),
+    }
+    path = profile_path(name)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp, path)
+    return path
+
+
+def load_profile(name: str) -> dict:
+    """Read a profile; raises ValueError with a printable message if unusable."""
+    path = profile_path(name)
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except OSError:
+        raise ValueError(f"Rig profili bulunamadı: {path}")
+    except ValueError:
+        raise ValueError(f"Rig profili okunamadı: {path}")
+    if data.get('version') != PROFILE_VERSION:
+        raise ValueError(f"Rig profili sürümü desteklenmiyor: {path}")
+    data['transform'] = np.array(data['transform'], dtype=np.float64)
+    data['plate_size'] = tuple(data['plate_size'])
+    data['grid_params'] = tuple(data['grid_params'])
+    return data
+
+
+def profile_digest(profile: dict) -> str:
+    """Hash of what a profile contributes to the results (for cache keys)."""
+    fields = {k: profile[k] for k in ('image_size', 'factor', 'plate_size',
+                                      'grid_params', 'med_radius')}
+    fields['transform'] = [[float(v) for v in row] for row in profile['transform']]
+    return hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+
+
+def applies_to(profile: dict, factor: int, full_size: tuple) -> bool:
+    """A profile is only valid for images of its own size and decode factor."""
+    return tuple(profile['image_size']) == tuple(full_size) and profile['factor'] == factor
+
+
+def warp_plate(image: np.ndarray, profile: dict) -> tuple:
+    """Upright plate from the saved homography; returns (plate, transform)."""
+    plate = cv2.warpPerspective(image, profile['transform'], profile['plate_size'])
+    return plate, profile['transform']
+
+
+def verify_grid(plate: np.ndarray, grid_params: tuple, med_radius: float) -> tuple:
+    """
+    Look for each of RIG_VERIFY_WELLS with HoughCircles in a window of about
+    1.5 pitches around its grid position. Returns (matched, checked, ok).
+    """
+    ox, oy, sx, sy = grid_params
+    h, w = plate.shape[:2]
+    half = int(max(sx, sy) * 0.75)
+    tolerance = max(sx, sy) * RIG_VERIFY_TOLERANCE
+    min_r, max_r = int(med_radius * 0.7), int(np.ceil(med_radius * 1.3))
+
+    matched = 0
+    for row, col in RIG_VERIFY_WELLS:
+        cx, cy = ox + col * sx, oy + row * sy
+        x1, y1 = max(0, int(cx) - half), max(0, int(cy) - half)
+        x2, y2 = min(w, int(cx) + half + 1), min(h, int(cy) + half + 1)
+        if x2 - x1 < 2 * min_r or y2 - y1 < 2 * min_r:
+            continue  # well outside the plate: the saved grid does not fit
+
+        gray = cv2.cvtColor(plate[y1:y2, x1:x2], cv2.COLOR_BGR2GRAY)
+        blurred = cv2.GaussianBlur(gray, (7, 7), 2)
+        circles = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, dp=1.0,
+                                   minDist=max(1, 2 * half), param1=50, param2=22,
+                                   minRadius=min_r, maxRadius=max_r)
+        if circles is None:
+            continue
+        dists = np.hypot(circles[0][:, 0] + x1 - cx, circles[0][:, 1] + y1 - cy)
+        if dists.min() <= tolerance:
+            matched += 1
+
+    checked = len(RIG_VERIFY_WELLS)
+    return matched, checked, matched >= RIG_VERIFY_MIN_MATCHES
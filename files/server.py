@@ -0,0 +1,291 @@
+"""
+MIC YST Plate Reader - Local HTTP Inference Service
+Keeps warm worker processes so each request only pays for the analysis.
+
+Usage:
+    python server.py [--host 127.0.0.1] [--port 8765] [--workers <n>] [--timeout <seconds>]
+                     [--cache-dir <dir>]
+
+Endpoints:
+    GET  /health    service status, worker count and request counters
+    POST /analyze   request body = raw image bytes (JPEG/PNG/...);
+                    response = {"results": [...calculate_mic output...],
+                                "analysis_ms": ..., "latency_ms": ...}
+
+Only the standard library and the pipeline's own dependencies are used.
+A request that exceeds --timeout gets HTTP 504. The timeout runs from
+submission, so it includes time spent waiting for a free worker. A timed
+out request still waiting in the executor's queue is cancelled and never
+runs (counted as "shed" in /health); one that is running, or was already
+handed to the pool's call queue (at most one request beyond the workers),
+cannot be cancelled: it finishes in the background, its result is dropped
+and its worker is then reused. Images that cannot be decoded get HTTP 422, pipeline errors
+HTTP 500. If a worker dies (segfault, OOM kill) the request gets HTTP 500
+and the pool is restarted for the following requests.
+
+With --cache-dir, an image whose bytes were analysed before (under the same
+config.py and pipeline code) is answered from the result cache
+(result_cache.py) without reaching a worker; the response has "cached": true.
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import threading
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+class InvalidImage(ValueError):
+    """The request body is not an image the pipeline can read (HTTP 422)."""
+
+
+def _init_service_worker():
+    """Import the pipeline and warm OpenCV up once per worker process."""
+    import cv2
+    import plate_detector  # noqa: F401
+    import well_extractor  # noqa: F401
+    import color_classifier  # noqa: F401
+    import mic_calculator  # noqa: F401
+    import main
+
+    cv2.setNumThreads(1)
+    # First calls into these kernels are noticeably slower than later ones
+    main.warm_up()
+
+
+def analyze_bytes(data: bytes) -> dict:
+    """Decode an encoded image and run steps 2-5 in a worker process."""
+    import cv2
+    import numpy as np
+    from config import DECODE_FULL_RES_COLORS
+    from image_loader import decode_bytes
+    from main import locate_wells, score_wells, full_resolution_colors
+
+    start = time.perf_counter()
+    image, factor, full_size = decode_bytes(data)
+    if image is None:
+        raise InvalidImage("Görüntü çözümlenemedi (desteklenmeyen veya bozuk dosya)")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        plate, transform, wells, geometry = locate_wells(image)
+        if factor > 1 and DECODE_FULL_RES_COLORS:
+            full_image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            wells = full_resolution_colors(full_image, factor, transform, plate.shape,
+                                           geometry, wells)
+        _, results = score_wells(wells)
+
+    return {
+        'results': results,
+        'image_size': [int(full_size[0]), int(full_size[1])],
+        'analysis_ms': round((time.perf_counter() - start) * 1000, 1),
+    }
+
+
+class InferenceService:
+    """Shared state for the request handlers: the worker pool and counters."""
+
+    def __init__(self, workers: int, timeout: float, cache_dir: str = None):
+        self.workers = workers
+        self.timeout = timeout
+        self.cache_dir = cache_dir
+        self.pool = self._new_pool()
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.served = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self.shed = 0
+        self.started = time.time()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_service_worker)
+
+    def _restart_pool(self, broken):
+        """Replace a pool broken by a dead worker (once, however many requests saw it)."""
+        with self.lock:
+            if self.pool is not broken:
+                return
+            print("[WARN] Bir işçi süreç çöktü, havuz yeniden başlatılıyor")
+            self.pool = self._new_pool()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def warm_up(self):
+        """Start every worker now instead of on the first requests."""
+        futures = [self.pool.submit(time.sleep, 0.1) for _ in range(self.workers)]
+        for f in futures:
+            f.result()
+
+    def health(self) -> dict:
+        with self.lock:
+            return {
+                'status': 'ok',
+                'workers': self.workers,
+                'in_flight': self.in_flight,
+                'served': self.served,
+                'failed': self.failed,
+                'cache_hits': self.cache_hits,
+                'shed': self.shed,
+                'uptime_s': round(time.time() - self.started, 1),
+            }
+
+    def analyze(self, data: bytes) -> dict:
+        cache_key = None
+        if self.cache_dir:
+            import result_cache
+            cache_key = result_cache.key_for_bytes(data)
+            hit = result_cache.lookup(self.cache_dir, cache_key)
+            if hit:
+                with self.lock:
+                    self.served += 1
+                    self.cache_hits += 1
+                return {'results': hit['results'], **hit['info'], 'cached': True}
+
+        with self.lock:
+            self.in_flight += 1
+            pool = self.pool
+        try:
+            future = pool.submit(analyze_bytes, data)
+            result = future.result(timeout=self.timeout)
+        except BaseException as e:
+            if isinstance(e, FutureTimeout):
+                # Only a request still waiting in the executor's queue can be
+                # shed; one already running or in the call queue runs to the end
+                if future.cancel():
+                    with self.lock:
+                        self.shed += 1
+            elif isinstance(e, BrokenProcessPool):
+                self._restart_pool(pool)
+            with self.lock:
+                self.failed += 1
+            raise
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+        with self.lock:
+            self.served += 1
+        if cache_key:
+            result_cache.store(self.cache_dir, cache_key, result['results'],
+                               info={'image_size': result['image_size']})
+        return result
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    service = None  # set by serve()
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/health':
+            self._send_json(200, self.service.health())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/analyze':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        start = time.perf_counter()
+        length = int(self.headers.get('Content-Length') or 0)
+        if length <= 0:
+            self._send_json(400, {'error': 'empty request body'})
+            return
+        if length > MAX_BODY_BYTES:
+            self._send_json(413, {'error': f'image larger than {MAX_BODY_BYTES} bytes'})
+            return
+        data = self.rfile.read(length)
+
+        try:
+            payload = self.service.analyze(data)
+            status = 200
+        except FutureTimeout:
+            payload = {'error': f'analysis exceeded {self.service.timeout:.0f} s timeout'}
+            status = 504
+        except InvalidImage as e:
+            payload = {'error': str(e)}
+            status = 422
+        except Exception as e:
+            payload = {'error': f"{type(e).__name__}: {e}"}
+            status = 500
+
+        self.latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        payload['latency_ms'] = self.latency_ms
+        self._send_json(status, payload)
+
+    def log_message(self, format, *args):
+        print(f"[HTTP] {self.address_string()} - {format % args}")
+
+    def log_request(self, code='-', size='-'):
+        latency = getattr(self, 'latency_ms', None)
+        suffix = f" {latency:.1f} ms" if latency is not None else ''
+        self.log_message('"%s" %s%s', self.requestline, str(code), suffix)
+
+
+def serve(host: str = '127.0.0.1', port: int = 8765, workers: int = 2, timeout: float = 60.0,
+          cache_dir: str = None):
+    service = InferenceService(workers, timeout, cache_dir)
+    print(f"[INFO] {workers} işçi süreç başlatılıyor...")
+    service.warm_up()
+
+    RequestHandler.service = service
+    httpd = ThreadingHTTPServer((host, port), RequestHandler)
+    httpd.daemon_threads = True
+    print(f"[INFO] Dinleniyor: http://{host}:{port} (POST /analyze, GET /health)")
+
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n[INFO] Durduruluyor...")
+    finally:
+        httpd.server_close()
+        service.pool.shutdown(wait=False, cancel_futures=True)
+
+
+if __name__ == '__main__':
+    host = '127.0.0.1'
+    port = 8765
+    workers = 2
+    timeout = 60.0
+    cache_dir = None
+
+    if '--host' in sys.argv:
+        idx = sys.argv.index('--host')
+        if idx + 1 < len(sys.argv):
+            host = sys.argv[idx + 1]
+
+    if '--port' in sys.argv:
+        idx = sys.argv.index('--port')
+        if idx + 1 < len(sys.argv):
+            port = int(sys.argv[idx + 1])
+
+    if '--workers' in sys.argv:
+        idx = sys.argv.index('--workers')
+        if idx + 1 < len(sys.argv):
+            workers = int(sys.argv[idx + 1])
+
+    if '--timeout' in sys.argv:
+        idx = sys.argv.index('--timeout')
+        if idx + 1 < len(sys.argv):
+            timeout = float(sys.argv[idx + 1])
+
+    if '--cache-dir' in sys.argv:
+        idx = sys.argv.index('--cache-dir')
+        if idx + 1 < len(sys.argv):
+            cache_dir = sys.argv[idx + 1]
+
+    serve(host, port, workers, timeout, cache_dir)
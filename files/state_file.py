@@ -0,0 +1,27 @@
+"""
+State File - JSON manifests of processed images (batch.py checkpoints,
+watcher.py state), read leniently and written atomically.
+"""
+
+import os
+import json
+
+
+def load(path: str) -> dict:
+    """The manifest at path; empty when missing or unreadable (start over)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"[WARN] Durum dosyası okunamadı, sıfırdan başlanıyor: {path}")
+        return {}
+
+
+def save(state: dict, path: str):
+    """Write the manifest atomically so a crash never leaves it truncated."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
@@ -0,0 +1,227 @@
+"""
+Synthetic Plate Generator - Renders 96-well plate photos with known ground truth.
+
+The layout comes from config.py (ROWS, COLS, CONCENTRATIONS, CONTROL_WELL):
+every row gets a random MIC column, wells left of it are pink (growth),
+wells from it on are purple (inhibition), and the control well is always
+pink. The plate is drawn top-down in plate coordinates, then warped into a
+camera frame with rotation and perspective skew and degraded with blur,
+sensor noise, specular highlights and JPEG compression.
+
+Usage:
+    python synthetic_plate.py <output_dir> [--count <n>] [--megapixels <mp>]
+                              [--rotation <deg>] [--skew <frac>] [--blur <sigma>]
+                              [--noise <sigma>] [--jpeg <quality>]
+                              [--highlights <prob>] [--seed <n>]
+
+Rotation, skew, blur and noise are maxima: each image draws its own value
+uniformly in [0, max] (rotation in [-max, max]). Every image is written as
+plate_NNNN.jpg next to plate_NNNN.json holding the ground truth.
+"""
+
+import sys
+import os
+import json
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import ROWS, COLS, ROW_LABELS, ANTIFUNGALS, CONCENTRATIONS, CONTROL_WELL
+
+# Plate geometry (mm), 9 mm well pitch. The outline is the frame around the
+# wells that detect_plate() locks onto in the reference photos (about 13.2 x 9.1
+# pitches, A1 ~0.8/1.0 pitch from the left/top edge), not the full SBS footprint.
+PLATE_W_MM = 118.8
+PLATE_H_MM = 81.9
+WELL_PITCH_MM = 9.0
+A1_X_MM = 7.3
+A1_Y_MM = 9.3
+WELL_RIM_R_MM = 4.4     # outer rim of the well as seen from above
+WELL_LIQUID_R_MM = 3.4  # colored liquid surface
+
+# BGR colors measured on real plates (see test_images/)
+GROWTH_BGR = (195, 185, 225)      # pink, resorufin
+INHIBITION_BGR = (130, 50, 125)   # purple, resazurin
+BACKGROUND_BGR = (218, 224, 225)
+PLATE_BGR = (226, 228, 230)
+RIM_BGR = (150, 152, 155)
+
+
+def random_ground_truth(rng: np.random.Generator) -> dict:
+    """Pick a MIC column per row and derive the growth state of every well."""
+    ctrl_row = ROW_LABELS.index(CONTROL_WELL[0]) if isinstance(CONTROL_WELL[0], str) else CONTROL_WELL[0]
+    wells = {}
+    rows = {}
+    for row_idx in range(ROWS):
+        row_label = ROW_LABELS[row_idx]
+        start_col = CONTROL_WELL[1] + 1 if row_idx == ctrl_row else 0
+        # COLS means no inhibition anywhere (MIC above the tested range)
+        mic_col = int(rng.integers(start_col, COLS + 1))
+        for col_idx in range(COLS):
+            wells[(row_idx, col_idx)] = col_idx < mic_col or (row_idx, col_idx) == (ctrl_row, CONTROL_WELL[1])
+        concs = CONCENTRATIONS[row_label]
+        rows[row_label] = {
+            'antifungal': ANTIFUNGALS[row_label],
+            'mic_column': mic_col if mic_col < COLS else None,
+            'mic_value': concs[mic_col] if mic_col < COLS else f'>{concs[-1]}',
+        }
+    return {'wells': wells, 'rows': rows}
+
+
+def _jitter_color(rng, bgr, amount):
+    return tuple(int(np.clip(c + rng.normal(0, amount), 0, 255)) for c in bgr)
+
+
+def render_plate(truth: dict, px_per_mm: float, rng: np.random.Generator,
+                 highlight_prob: float = 0.0) -> np.ndarray:
+    """Draw the plate top-down, PLATE_W_MM x PLATE_H_MM at px_per_mm."""
+    w = int(round(PLATE_W_MM * px_per_mm))
+    h = int(round(PLATE_H_MM * px_per_mm))
+    plate = np.empty((h, w, 3), dtype=np.uint8)
+    plate[:] = PLATE_BGR
+
+    shift = 4  # sub-pixel precision for cv2 drawing
+    scale = px_per_mm * (1 << shift)
+    border = max(1, int(px_per_mm * 0.6))
+    cv2.rectangle(plate, (0, 0), (w - 1, h - 1), RIM_BGR, border)
+
+    rim_r = int(WELL_RIM_R_MM * scale)
+    liquid_r = int(WELL_LIQUID_R_MM * scale)
+    rim_thickness = max(1, int(px_per_mm * 0.35))
+
+    for (row, col), growth in truth['wells'].items():
+        cx = (A1_X_MM + col * WELL_PITCH_MM) * scale
+        cy = (A1_Y_MM + row * WELL_PITCH_MM) * scale
+        center = (int(cx), int(cy))
+        color = _jitter_color(rng, GROWTH_BGR if growth else INHIBITION_BGR, 6)
+        cv2.circle(plate, center, rim_r, RIM_BGR, rim_thickness, cv2.LINE_AA, shift)
+        cv2.circle(plate, center, liquid_r, color, -1, cv2.LINE_AA, shift)
+
+        if rng.random() < highlight_prob:
+            # Small bright reflection, off-center like a ring light would give
+            hx = int(cx + rng.uniform(-0.5, 0.5) * liquid_r)
+            hy = int(cy + rng.uniform(-0.5, 0.5) * liquid_r)
+            axes = (int(liquid_r * rng.uniform(0.15, 0.35)), int(liquid_r * rng.uniform(0.08, 0.2)))
+            cv2.ellipse(plate, (hx, hy), axes, rng.uniform(0, 180), 0, 360,
+                        (252, 252, 252), -1, cv2.LINE_AA, shift)
+
+    return plate
+
+
+def generate(megapixels: float = 2.0, rotation_deg: float = 0.0, skew: float = 0.0,
+             blur_sigma: float = 0.0, noise_sigma: float = 0.0, jpeg_quality: int = 90,
+             highlight_prob: float = 0.0, seed: int = None) -> tuple:
+    """
+    Render one synthetic plate photo.
+    Returns (bgr_image, truth) where truth holds per-well growth flags,
+    per-row MIC, the plate corners in the image and the parameters used.
+    """
+    rng = np.random.default_rng(seed)
+    truth = random_ground_truth(rng)
+
+    # 4:3 camera frame with the plate covering ~80% of its width
+    img_w = int(round(np.sqrt(megapixels * 1e6 * 4 / 3)))
+    img_h = int(round(img_w * 3 / 4))
+    plate_w_px = img_w * 0.8
+    px_per_mm = plate_w_px / PLATE_W_MM
+
+    plate = render_plate(truth, px_per_mm, rng, highlight_prob)
+    ph, pw = plate.shape[:2]
+
+    # Place the plate: center, rotate, then push each corner by up to `skew`
+    src = np.float32([[0, 0], [pw - 1, 0], [pw - 1, ph - 1], [0, ph - 1]])
+    centered = src - np.float32([pw / 2, ph / 2])
+    a = np.deg2rad(rotation_deg)
+    rot = np.float32([[np.cos(a), -np.sin(a)], [np.sin(a), np.cos(a)]])
+    dst = centered @ rot.T + np.float32([img_w / 2, img_h / 2])
+    dst += rng.uniform(-skew, skew, size=(4, 2)).astype(np.float32) * np.float32([pw, ph])
+
+    M = cv2.getPerspectiveTransform(src, dst)
+    image = np.empty((img_h, img_w, 3), dtype=np.uint8)
+    image[:] = BACKGROUND_BGR
+    cv2.warpPerspective(plate, M, (img_w, img_h), dst=image,
+                        flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_TRANSPARENT)
+
+    # Soft lighting falloff across the frame
+    xx = ((np.arange(img_w, dtype=np.float32) - img_w / 2) / img_w) ** 2
+    yy = ((np.arange(img_h, dtype=np.float32) - img_h / 2) / img_h) ** 2
+    vignette = 1.0 - 0.48 * (yy[:, None] + xx[None, :])
+    image = np.clip(image.astype(np.float32) * vignette[..., None], 0, 255)
+
+    if noise_sigma > 0:
+        image += rng.normal(0, noise_sigma, size=image.shape).astype(np.float32)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+
+    if blur_sigma > 0:
+        image = cv2.GaussianBlur(image, (0, 0), blur_sigma)
+
+    if jpeg_quality < 100:
+        ok, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(jpeg_quality)])
+        image = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+
+    truth['corners'] = dst.tolist()
+    truth['params'] = {
+        'megapixels': megapixels, 'rotation_deg': rotation_deg, 'skew': skew,
+        'blur_sigma': blur_sigma, 'noise_sigma': noise_sigma,
+        'jpeg_quality': jpeg_quality, 'highlight_prob': highlight_prob, 'seed': seed,
+        'image_size': [img_w, img_h],
+    }
+    return image, truth
+
+
+def truth_to_json(truth: dict) -> dict:
+    """JSON-friendly copy of a truth dict (well keys become 'A1', 'B12', ...)."""
+    out = dict(truth)
+    out['wells'] = {f"{ROW_LABELS[r]}{c + 1}": ('growth' if g else 'inhibition')
+                    for (r, c), g in sorted(truth['wells'].items())}
+    return out
+
+
+def _flag_value(argv, flag, default=None):
+    if flag in argv:
+        idx = argv.index(flag)
+        if idx + 1 < len(argv):
+            return argv[idx + 1]
+    return default
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1].startswith('--'):
+        print("Kullanım: python synthetic_plate.py <çıktı_klasörü> [--count <n>] [--megapixels <mp>] "
+              "[--rotation <derece>] [--skew <oran>] [--blur <sigma>] [--noise <sigma>] "
+              "[--jpeg <kalite>] [--highlights <olasılık>] [--seed <n>]")
+        sys.exit(1)
+
+    output_dir = sys.argv[1]
+    count = int(_flag_value(sys.argv, '--count', 1))
+    megapixels = float(_flag_value(sys.argv, '--megapixels', 2.0))
+    max_rotation = float(_flag_value(sys.argv, '--rotation', 2.0))
+    max_skew = float(_flag_value(sys.argv, '--skew', 0.02))
+    max_blur = float(_flag_value(sys.argv, '--blur', 1.0))
+    max_noise = float(_flag_value(sys.argv, '--noise', 3.0))
+    jpeg_quality = int(_flag_value(sys.argv, '--jpeg', 85))
+    highlights = float(_flag_value(sys.argv, '--highlights', 0.3))
+    seed = int(_flag_value(sys.argv, '--seed', 0))
+
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    for i in range(count):
+        image, truth = generate(
+            megapixels=megapixels,
+            rotation_deg=float(rng.uniform(-max_rotation, max_rotation)),
+            skew=float(rng.uniform(0, max_skew)),
+            blur_sigma=float(rng.uniform(0, max_blur)),
+            noise_sigma=float(rng.uniform(0, max_noise)),
+            jpeg_quality=jpeg_quality,
+            highlight_prob=highlights,
+            seed=int(rng.integers(0, 2**31 - 1)),
+        )
+        base = os.path.join(output_dir, f"plate_{i:04d}")
+        # Already JPEG-degraded in generate(); store losslessly-enough on top
+        cv2.imwrite(base + '.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 98])
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(truth_to_json(truth), f, indent=1)
+        print(f"[{i + 1}/{count}] {base}.jpg ({image.shape[1]}x{image.shape[0]} px)")
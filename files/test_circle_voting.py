@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Parity test: CIRCLE_ENGINE = 'voting' (circle_voting.vote_circles) against
+one cv2.HoughCircles call per pass ('opencv').
+
+Plates: the reference photo and synthetic plates (synthetic_plate.py) of
+varying size, rotation, blur, noise and highlights. Every pass of
+HOUGH_PASSES, plus random extra thresholds, must return exactly the circles
+cv2.HoughCircles returns (same centers, radii and order), and
+detect_circles must give the same circles and median radius with either
+engine, with and without the early exit.
+
+    python test_circle_voting.py [cases]
+"""
+
+import os
+import sys
+import io
+import time
+import contextlib
+
+import cv2
+import numpy as np
+
+import well_extractor as we
+from circle_voting import vote_circles
+from plate_detector import detect_plate_with_transform
+from synthetic_plate import generate
+from config import ROWS, COLS
+
+REFERENCE_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test_images',
+                               'WhatsApp Image 2026-02-05 at 14.15.10.jpeg')
+
+
+def upright_plate(image):
+    with contextlib.redirect_stdout(io.StringIO()):
+        plate, _ = detect_plate_with_transform(image)
+    return plate
+
+
+def hough(blurred, min_r, max_r, min_dist, threshold):
+    circles = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, dp=1.0, minDist=min_dist,
+                               param1=50, param2=threshold, minRadius=min_r, maxRadius=max_r)
+    return circles[0] if circles is not None else np.empty((0, 3), np.float32)
+
+
+def compare_passes(name, plate, rng, failures):
+    """vote_circles against cv2.HoughCircles for every threshold of every blur level."""
+    gray = cv2.cvtColor(plate, cv2.COLOR_BGR2GRAY)
+    h, w = gray.shape
+    # Same band and spacing as well_extractor._detect_circles
+    expected_cell = min(w / COLS, h / ROWS)
+    expected_r = expected_cell * 0.42
+    min_r, max_r = int(expected_r * 0.5), int(expected_r * 1.3)
+    min_dist = int(expected_cell * 0.65)
+    for blur_size in dict.fromkeys(b for b, _ in we.HOUGH_PASSES):
+        blurred = cv2.GaussianBlur(gray, (blur_size, blur_size), 2)
+        thresholds = [t for b, t in we.HOUGH_PASSES if b == blur_size]
+        thresholds += [int(t) for t in rng.integers(10, 60, 2)]
+        for t, voted in zip(thresholds, vote_circles(blurred, min_r, max_r, min_dist, 50,
+                                                     thresholds)):
+            expected = hough(blurred, min_r, max_r, min_dist, t)
+            if not (voted.dtype == expected.dtype and np.array_equal(voted, expected)):
+                failures.setdefault('vote_circles', []).append(f"{name} blur {blur_size} t {t}")
+
+
+def compare_engines(name, plate, failures, timings):
+    """detect_circles with both engines, early exit on and off."""
+    coverage = we.HOUGH_EARLY_EXIT_COVERAGE
+    try:
+        for early_exit in (coverage, 0):
+            we.HOUGH_EARLY_EXIT_COVERAGE = early_exit
+            found, ms = {}, {}
+            for engine in ('opencv', 'voting'):
+                we.CIRCLE_ENGINE = engine
+                start = time.perf_counter()
+                found[engine] = we.detect_circles(plate)
+                ms[engine] = (time.perf_counter() - start) * 1000
+            (a, ra), (b, rb) = found['opencv'], found['voting']
+            label = 'detect_circles' if early_exit else 'detect_circles (all passes)'
+            if not (np.array_equal(a, b) and ra == rb):
+                failures.setdefault(label, []).append(name)
+            timings.setdefault(label, []).append((ms['opencv'], ms['voting']))
+    finally:
+        we.HOUGH_EARLY_EXIT_COVERAGE = coverage
+        we.CIRCLE_ENGINE = 'opencv'
+
+
+def main():
+    cases = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    rng = np.random.default_rng(0)
+    failures = {}
+    timings = {}
+
+    plates = []
+    if os.path.exists(REFERENCE_IMAGE):
+        plates.append(('reference', upright_plate(cv2.imread(REFERENCE_IMAGE))))
+    else:
+        print(f"  [WARN] reference photo not found: {REFERENCE_IMAGE}")
+    for seed in range(cases):
+        image, _ = generate(megapixels=float(rng.uniform(1, 4)),
+                            rotation_deg=float(rng.uniform(-4, 4)), skew=0.02,
+                            blur_sigma=float(rng.uniform(0.5, 2)),
+                            noise_sigma=float(rng.uniform(2, 10)),
+                            highlight_prob=0.3, seed=seed)
+        plates.append((f'synthetic{seed}', upright_plate(image)))
+
+    for name, plate in plates:
+        compare_passes(name, plate, rng, failures)
+        compare_engines(name, plate, failures, timings)
+
+    print(f"  {len(plates)} plates")
+    for check in ('vote_circles', 'detect_circles', 'detect_circles (all passes)'):
+        bad = failures.get(check, [])
+        status = 'OK' if not bad else f"FAIL ({len(bad)}, first: {bad[:3]})"
+        print(f"  {check:28s} {status}")
+
+    print("\n  median per plate        opencv (ms)   voting (ms)")
+    for label, values in timings.items():
+        opencv_ms, voting_ms = np.median(values, axis=0)
+        print(f"  {label:28s} {opencv_ms:8.0f}   {voting_ms:11.0f}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Parity test: COLOR_ENGINE = 'batched' (sample_well_colors_batched) against
+the per-well loop of sample_well_colors ('loop').
+
+Plates: the reference photo and synthetic plates (synthetic_plate.py) with
+specular highlights, each on its fitted grid and on randomly perturbed grids
+(jittered centers, per-well radii, wells cut by the plate edge or too small
+to sample). Part of the wells is painted grey or white so the low-saturation
+and specular rules and the whole-disc fallback are exercised. Every field of
+every well must be identical: hsv_median, hsv_mean, rgb_mean, pixel_count,
+center, cell_bounds, radius, detected and the crop.
+
+    python test_color_engines.py [cases]
+"""
+
+import os
+import sys
+import io
+import time
+import contextlib
+
+import cv2
+import numpy as np
+
+import well_extractor as we
+from plate_detector import detect_plate_with_transform
+from synthetic_plate import generate
+from config import SPECULAR_V_THRESHOLD, MIN_SATURATION
+
+REFERENCE_IMAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'test_images',
+                               'WhatsApp Image 2026-02-05 at 14.15.10.jpeg')
+FIELDS = ('hsv_median', 'hsv_mean', 'rgb_mean', 'pixel_count', 'center',
+          'cell_bounds', 'radius', 'detected', 'crop')
+
+
+def fitted_plate(image):
+    """Upright plate and its fitted grid, as the pipeline finds them."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        plate, _ = detect_plate_with_transform(image)
+        _, geometry = we.extract_wells_with_grid(plate)
+    return plate, geometry['grid'], geometry['med_radius']
+
+
+def perturbed_grid(rng, grid, med_radius, w, h):
+    """Jitter the wells, vary their radii and push some off the plate edge."""
+    out = {}
+    for key, gdata in grid.items():
+        g = dict(gdata)
+        g['cx'] = gdata['cx'] + rng.normal(0, med_radius * 0.3)
+        g['cy'] = gdata['cy'] + rng.normal(0, med_radius * 0.3)
+        roll = rng.random()
+        if roll < 0.3:
+            g['radius'] = float(med_radius * rng.uniform(0.5, 1.5))
+        elif roll < 0.4:
+            g.pop('radius', None)
+        elif roll < 0.45:
+            g['radius'] = float(rng.uniform(0, 3))   # too small to sample
+        if rng.random() < 0.05:
+            g['cx'] = rng.choice([rng.uniform(-med_radius, 0), rng.uniform(w, w + med_radius)])
+        if rng.random() < 0.05:
+            g['cy'] = rng.choice([rng.uniform(-med_radius, 0), rng.uniform(h, h + med_radius)])
+        g['detected'] = bool(rng.random() < 0.8)
+        out[key] = g
+    return out
+
+
+def paint_wells(rng, plate, grid, med_radius):
+    """Grey (low saturation) or white (specular) patches over part of the wells."""
+    plate = plate.copy()
+    for gdata in grid.values():
+        roll = rng.random()
+        if roll > 0.3:
+            continue
+        r = int(med_radius * rng.uniform(0.1, 0.6))
+        center = (int(gdata['cx'] + rng.normal(0, r)), int(gdata['cy'] + rng.normal(0, r)))
+        if roll < 0.1:
+            grey = int(rng.integers(40, 220))
+            color = (grey, grey + int(rng.integers(0, MIN_SATURATION // 8 + 1)), grey)
+        else:
+            v = int(rng.integers(SPECULAR_V_THRESHOLD, 256))
+            color = (v, v, v)
+        cv2.circle(plate, center, r, color, -1)
+    return plate
+
+
+def run_engine(engine, plate, grid, med_radius):
+    we.COLOR_ENGINE = engine
+    try:
+        return we.sample_well_colors(plate, grid, med_radius)
+    finally:
+        we.COLOR_ENGINE = 'batched'
+
+
+def same(a, b):
+    if isinstance(a, np.ndarray):
+        return a.dtype == b.dtype and a.shape == b.shape and np.array_equal(a, b)
+    if isinstance(a, tuple):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b and type(a) == type(b)
+
+
+def compare(name, plate, grid, med_radius, failures, timings):
+    start = time.perf_counter()
+    loop = run_engine('loop', plate, grid, med_radius)
+    mid = time.perf_counter()
+    batched = run_engine('batched', plate, grid, med_radius)
+    timings.append(((mid - start) * 1000, (time.perf_counter() - mid) * 1000))
+    if list(loop) != list(batched):
+        failures.setdefault('wells', []).append(name)
+        return
+    for key in loop:
+        for field in FIELDS:
+            if not same(loop[key][field], batched[key][field]):
+                failures.setdefault(field, []).append(f"{name} {key}")
+
+
+def main():
+    cases = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    rng = np.random.default_rng(0)
+    failures = {}
+    timings = []
+
+    plates = []
+    if os.path.exists(REFERENCE_IMAGE):
+        plates.append(('reference', fitted_plate(cv2.imread(REFERENCE_IMAGE))))
+    else:
+        print(f"  [WARN] reference photo not found: {REFERENCE_IMAGE}")
+    for seed in range(max(1, cases // 4)):
+        image, _ = generate(megapixels=float(rng.uniform(1, 4)), rotation_deg=2.0, skew=0.02,
+                            blur_sigma=1.0, noise_sigma=4.0, highlight_prob=0.3, seed=seed)
+        plates.append((f'synthetic{seed}', fitted_plate(image)))
+
+    for name, (plate, grid, med_radius) in plates:
+        h, w = plate.shape[:2]
+        compare(name, plate, grid, med_radius, failures, timings)
+        for case in range(max(1, cases // len(plates))):
+            painted = paint_wells(rng, plate, grid, med_radius)
+            compare(f"{name}/{case}", painted, perturbed_grid(rng, grid, med_radius, w, h),
+                    med_radius, failures, timings)
+
+    print(f"  {len(timings)} plates")
+    for field in ('wells',) + FIELDS:
+        bad = failures.get(field, [])
+        status = 'OK' if not bad else f"FAIL ({len(bad)} wells, first: {bad[:3]})"
+        print(f"  {field:12s} {status}")
+    loop_ms, batched_ms = np.median(timings, axis=0)
+    print(f"\n  median per plate: loop {loop_ms:.1f} ms, batched {batched_ms:.1f} ms")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
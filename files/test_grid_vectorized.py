@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Parity test: vectorized grid fitting helpers in well_extractor.py against
+the per-element loops they replaced (kept below as reference copies).
+
+Random plates: a jittered 8x12 lattice seen by several Hough passes (near
+duplicates), with dropped wells and spurious circles, as float32 like
+cv2.HoughCircles output. Grid parameters are given both as Python floats
+and as numpy float64, which changes the precision of the scalar code.
+Results must be identical, not just close; the origin search must pick
+the same (ox, oy) as the loop, including which of several equally good
+origins wins.
+
+    python test_grid_vectorized.py [cases]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import well_extractor as we
+from config import ROWS, COLS
+
+
+# --- Reference implementations (loops) ---
+
+def ref_deduplicate(circles, merge_dist):
+    if len(circles) == 0:
+        return circles
+    used = np.zeros(len(circles), dtype=bool)
+    merged = []
+    for i in range(len(circles)):
+        if used[i]:
+            continue
+        cluster = [circles[i]]
+        used[i] = True
+        for j in range(i + 1, len(circles)):
+            if used[j]:
+                continue
+            if np.sqrt((circles[i][0]-circles[j][0])**2 + (circles[i][1]-circles[j][1])**2) < merge_dist:
+                cluster.append(circles[j])
+                used[j] = True
+        merged.append(np.mean(cluster, axis=0))
+    return np.array(merged)
+
+
+def ref_estimate_step_from_pairs(centers, axis, other_axis, expected_step, max_other_dist):
+    n = len(centers)
+    unit_dists = []
+    for i in range(n):
+        for j in range(i+1, n):
+            other_diff = abs(centers[i][other_axis] - centers[j][other_axis])
+            if other_diff > max_other_dist:
+                continue
+            axis_diff = abs(centers[i][axis] - centers[j][axis])
+            if axis_diff < expected_step * 0.5:
+                continue
+            n_steps = round(axis_diff / expected_step)
+            if n_steps < 1 or n_steps > 12:
+                continue
+            unit_dist = axis_diff / n_steps
+            if 0.7 * expected_step < unit_dist < 1.3 * expected_step:
+                unit_dists.append(unit_dist)
+    if len(unit_dists) < 5:
+        return None
+    return float(np.median(unit_dists))
+
+
+def ref_refine_grid_lsq(circles, ox, oy, sx, sy):
+    threshold = max(sx, sy) * 0.35
+    for iteration in range(3):
+        rows_l, cols_l, cxs, cys = [], [], [], []
+        for c in circles:
+            cx, cy = c[0], c[1]
+            col = round((cx - ox) / sx)
+            row = round((cy - oy) / sy)
+            if 0 <= row < ROWS and 0 <= col < COLS:
+                pred_x = ox + col * sx
+                pred_y = oy + row * sy
+                err = np.sqrt((cx - pred_x)**2 + (cy - pred_y)**2)
+                if err < threshold:
+                    rows_l.append(row)
+                    cols_l.append(col)
+                    cxs.append(cx)
+                    cys.append(cy)
+        if len(cxs) < 20:
+            break
+        cols_arr = np.array(cols_l, dtype=float)
+        rows_arr = np.array(rows_l, dtype=float)
+        A_x = np.column_stack([np.ones_like(cols_arr), cols_arr])
+        ox, sx = np.linalg.lstsq(A_x, np.array(cxs), rcond=None)[0]
+        A_y = np.column_stack([np.ones_like(rows_arr), rows_arr])
+        oy, sy = np.linalg.lstsq(A_y, np.array(cys), rcond=None)[0]
+    return float(ox), float(oy), float(sx), float(sy)
+
+
+def ref_assign_circles(circles, ox, oy, sx, sy):
+    threshold = max(sx, sy) * 0.45
+    assignments = {}
+    for c in circles:
+        cx, cy, r = c
+        col = round((cx - ox) / sx)
+        row = round((cy - oy) / sy)
+        if 0 <= row < ROWS and 0 <= col < COLS:
+            pred_x = ox + col * sx
+            pred_y = oy + row * sy
+            err = np.sqrt((cx - pred_x)**2 + (cy - pred_y)**2)
+            if err < threshold:
+                key = (int(row), int(col))
+                if key not in assignments:
+                    assignments[key] = (float(cx), float(cy), float(r))
+                else:
+                    old_cx, old_cy, _ = assignments[key]
+                    old_err = np.sqrt((old_cx - pred_x)**2 + (old_cy - pred_y)**2)
+                    if err < old_err:
+                        assignments[key] = (float(cx), float(cy), float(r))
+    return assignments
+
+
+def ref_score_grid(centers, ox, oy, sx, sy):
+    score = 0
+    used_slots = set()
+    threshold = max(sx, sy) * 0.35
+    for cx, cy in centers:
+        col = round((cx - ox) / sx)
+        row = round((cy - oy) / sy)
+        if 0 <= row < ROWS and 0 <= col < COLS:
+            pred_x = ox + col * sx
+            pred_y = oy + row * sy
+            err = np.sqrt((cx - pred_x)**2 + (cy - pred_y)**2)
+            if err < threshold and (row, col) not in used_slots:
+                score += 1
+                used_slots.add((row, col))
+    return score
+
+
+def ref_search_origin(centers, step_x, step_y, expected_sx, expected_sy):
+    """Origin search of fit_grid_robust as a loop over the candidate sets."""
+    candidate_ox = set()
+    candidate_oy = set()
+    for cx, cy in centers:
+        for col_guess in range(COLS):
+            ox = cx - col_guess * step_x
+            if -step_x * 0.3 < ox < step_x * 1.5:
+                candidate_ox.add(round(ox, 1))
+        for row_guess in range(ROWS):
+            oy = cy - row_guess * step_y
+            if -step_y * 0.3 < oy < step_y * 1.5:
+                candidate_oy.add(round(oy, 1))
+    candidate_ox.add(round(expected_sx / 2, 1))
+    candidate_oy.add(round(expected_sy / 2, 1))
+
+    best_ox, best_oy, best_score = None, None, -1
+    n_best = 0  # candidates reaching the best score (ties)
+    for ox in candidate_ox:
+        for oy in candidate_oy:
+            score = ref_score_grid(centers, ox, oy, step_x, step_y)
+            if score > best_score:
+                best_score = score
+                best_ox, best_oy = ox, oy
+                n_best = 1
+            elif score == best_score:
+                n_best += 1
+    return (best_ox, best_oy), n_best > 1
+
+
+# --- Random plates ---
+
+def random_plate(rng, passes=9):
+    """Circles of several simulated Hough passes (float32) and the plate size."""
+    pitch = rng.uniform(60, 220)
+    ox, oy = pitch * rng.uniform(0.6, 1.0), pitch * rng.uniform(0.8, 1.3)
+    w, h = int(ox * 2 + pitch * 11), int(oy * 2 + pitch * 7)
+    rows, cols = np.mgrid[0:ROWS, 0:COLS]
+    base = np.column_stack([ox + cols.ravel() * pitch, oy + rows.ravel() * pitch])
+    base += rng.normal(0, pitch * 0.03, base.shape)
+    found = []
+    for _ in range(passes):
+        keep = rng.random(len(base)) < rng.uniform(0.5, 1.0)
+        pts = base[keep] + rng.normal(0, pitch * 0.02, (keep.sum(), 2))
+        r = rng.normal(pitch * 0.42, pitch * 0.02, len(pts))
+        found.append(np.column_stack([pts, r]))
+    n_false = rng.integers(0, 30)
+    found.append(np.column_stack([rng.uniform(0, w, n_false), rng.uniform(0, h, n_false),
+                                  rng.uniform(pitch * 0.2, pitch * 0.5, n_false)]))
+    circles = np.vstack(found).astype(np.float32)
+    return circles[rng.permutation(len(circles))], w, h, pitch
+
+
+def same(a, b):
+    if isinstance(a, np.ndarray):
+        return a.dtype == b.dtype and a.shape == b.shape and np.array_equal(a, b)
+    return a == b and type(a) == type(b)
+
+
+def main():
+    cases = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = np.random.default_rng(0)
+    failures = {}
+    origin_cases = min(cases, 40)
+    ties = 0
+    for case in range(cases):
+        circles, w, h, pitch = random_plate(rng, passes=int(rng.integers(1, 10)))
+        merge_dist = int(min(w / 12, h / 8) * 0.65) * 0.5
+
+        checks = [('deduplicate', ref_deduplicate(circles, merge_dist),
+                   we._deduplicate(circles, merge_dist))]
+        deduped = checks[0][1]
+        centers = deduped[:, :2].astype(float)
+        for axis, other, step, band in ((0, 1, w / 12, h / 8 * 0.4), (1, 0, h / 8, w / 12 * 0.4)):
+            checks.append((f'estimate_step[{axis}]',
+                           ref_estimate_step_from_pairs(centers, axis, other, step, band),
+                           we._estimate_step_from_pairs(centers, axis, other, step, band)))
+
+        # Parameters as the grid fitter passes them: rounded candidates
+        # (numpy float64 or Python float), then lstsq output
+        ox = round(np.float64(pitch * rng.uniform(0.6, 1.0)), 1)
+        oy = float(round(pitch * rng.uniform(0.8, 1.3), 1))
+        sx, sy = float(pitch * rng.uniform(0.97, 1.03)), float(pitch * rng.uniform(0.97, 1.03))
+        if case % 2:
+            ox, oy = float(ox), np.float64(oy)
+        checks.append(('refine_grid_lsq', ref_refine_grid_lsq(deduped, ox, oy, sx, sy),
+                       we._refine_grid_lsq(deduped, ox, oy, sx, sy)))
+        params = checks[-1][1]
+        checks.append(('assign_circles', ref_assign_circles(deduped, *params),
+                       we._assign_circles(deduped, *params)))
+
+        # Origin search with the steps fit_grid_robust would use; the first
+        # candidate in set order must win ties, as in the loop
+        # (on a subset of the centers after the first plate: the loop
+        # takes ~30 s on a full plate)
+        if case < origin_cases:
+            step_x = checks[1][1] or w / 12
+            step_y = checks[2][1] or h / 8
+            subset = centers
+            if case >= 1:
+                subset = centers[rng.permutation(len(centers))[:rng.integers(15, 40)]]
+            expected, tied = ref_search_origin(subset, step_x, step_y, w / 12, h / 8)
+            ties += tied
+            checks.append(('search_origin', expected,
+                           we._search_origin(subset, step_x, step_y, w / 12, h / 8)))
+
+        for name, expected, actual in checks:
+            if not same(expected, actual):
+                failures.setdefault(name, []).append(case)
+
+    for name in ('deduplicate', 'estimate_step[0]', 'estimate_step[1]',
+                 'refine_grid_lsq', 'assign_circles', 'search_origin'):
+        bad = failures.get(name, [])
+        status = 'OK' if not bad else f"FAIL ({len(bad)} cases, first: {bad[:5]})"
+        print(f"  {name:18s} {status}")
+    print(f"  ({ties} of {origin_cases} origin searches had tied best scores)")
+
+    # Scaling with the number of circles
+    print("\n  circles   loops (ms)   vectorized (ms)")
+    for passes in (1, 3, 9, 27):
+        circles, w, h, pitch = random_plate(np.random.default_rng(passes), passes=passes)
+        merge_dist = int(min(w / 12, h / 8) * 0.65) * 0.5
+        centers = circles[:, :2].astype(float)
+        timings = []
+        for dedup, step in ((ref_deduplicate, ref_estimate_step_from_pairs),
+                            (we._deduplicate, we._estimate_step_from_pairs)):
+            start = time.perf_counter()
+            dedup(circles, merge_dist)
+            step(centers, 0, 1, w / 12, h / 8 * 0.4)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"  {len(circles):7d}   {timings[0]:10.1f}   {timings[1]:15.1f}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
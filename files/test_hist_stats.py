@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Parity test: histogram statistics in hist_stats.py against the numpy calls
+and the per-pixel functions they replaced (kept below as reference copies;
+the trimmed mean as scipy.stats.trim_mean computes it).
+
+Random wells: uint8 values per label with odd, even and zero counts, hues
+on both sides of red (including sets symmetric around 0, where the sine sum
+cancels) and out-of-range hues. Medians, means and trimmed means must be
+identical; circular hue means must agree on the circle to HUE_WRAP_EPS.
+The single-array helpers are also checked on float and int32 input.
+
+    python test_hist_stats.py [cases]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+import hist_stats as hs
+
+
+# --- Reference implementations (per pixel) ---
+
+def ref_trim_mean(values, proportion):
+    values = np.sort(values)
+    cut = int(proportion * len(values))
+    return np.mean(values[cut:len(values) - cut])
+
+
+def ref_circular_mean_hue(hues):
+    a = hues.astype(np.float64) * (2*np.pi/180)
+    return float(np.arctan2(np.mean(np.sin(a)), np.mean(np.cos(a))) * (180/(2*np.pi)) % 180)
+
+
+def ref_circular_median_hue(hues):
+    if np.any(hues < 30) and np.any(hues > 150):
+        return float((np.median((hues.astype(np.int32)+90)%180) - 90) % 180)
+    return float(np.median(hues))
+
+
+# --- Random wells ---
+
+def random_hues(rng, n):
+    kind = rng.integers(0, 4)
+    if kind == 0:    # anywhere
+        return rng.integers(0, 180, n)
+    if kind == 1:    # around red, both sides
+        return (rng.integers(-25, 26, n) % 180)
+    if kind == 2:    # symmetric around red: the sine sum cancels
+        half = rng.integers(0, 30, n // 2)
+        extra = np.zeros(n % 2, dtype=half.dtype)
+        return np.concatenate([half, (180 - half) % 180, extra])
+    return rng.integers(0, 256, n)  # out-of-range hues too
+
+
+def random_wells(rng, n_labels):
+    sizes = rng.integers(0, 400, n_labels)
+    sizes[rng.random(n_labels) < 0.05] = 0
+    values = [rng.integers(0, 256, s).astype(np.uint8) for s in sizes]
+    hues = [random_hues(rng, s).astype(np.uint8) for s in sizes]
+    labels = np.repeat(np.arange(n_labels), sizes)
+    return labels, values, hues, sizes
+
+
+def hue_distance(a, b):
+    d = abs(a - b) % 180
+    return min(d, 180 - d)
+
+
+def main():
+    cases = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    rng = np.random.default_rng(0)
+    failures = {}
+
+    def check(name, ok, case):
+        if not ok:
+            failures.setdefault(name, []).append(case)
+
+    for case in range(cases):
+        n = int(rng.integers(1, 200))
+        labels, values, hues, sizes = random_wells(rng, n)
+        hist = hs.label_histograms(labels, np.concatenate(values), n)
+        hue_hist = hs.label_histograms(labels, np.concatenate(hues), n)
+        counts = hist.sum(axis=1)
+        proportion = float(rng.choice([0.0, 0.1, 0.25]))
+
+        med = hs.medians(hist, counts)
+        mean = hs.means(hist, counts)
+        trimmed = hs.trimmed_means(hist, proportion, counts)
+        hue_med = hs.circular_hue_medians(hue_hist, counts)
+        hue_mean = hs.circular_hue_means(hue_hist, counts)
+
+        for i in range(n):
+            if sizes[i] == 0:
+                check('empty -> nan', all(np.isnan(x[i]) for x in
+                                          (med, mean, trimmed, hue_med, hue_mean)), case)
+                continue
+            check('medians', med[i] == np.median(values[i]), case)
+            check('means', mean[i] == np.mean(values[i]), case)
+            check('trimmed_means', trimmed[i] == ref_trim_mean(values[i], proportion), case)
+            check('circular_hue_medians', hue_med[i] == ref_circular_median_hue(hues[i]), case)
+            expected = ref_circular_mean_hue(hues[i])
+            check('circular_hue_means',
+                  hue_distance(hue_mean[i], expected) <= hs.HUE_WRAP_EPS
+                  and 0 <= hue_mean[i] < 180, case)
+            # Single-array helpers on uint8, int32 and float input
+            for dtype in (np.uint8, np.int32, np.float64):
+                h = hues[i].astype(dtype)
+                check('median()', hs.median(values[i].astype(dtype)) == np.median(values[i]), case)
+                check('circular_hue_median()',
+                      hs.circular_hue_median(h) == ref_circular_median_hue(h), case)
+                check('circular_hue_mean()',
+                      hue_distance(hs.circular_hue_mean(h), ref_circular_mean_hue(h))
+                      <= hs.HUE_WRAP_EPS, case)
+
+        # Off-grid input falls back to the per-pixel formulas
+        odd = rng.uniform(-20, 300, 50)
+        check('float input', hs.median(odd) == np.median(odd)
+              and hs.circular_hue_median(odd) == ref_circular_median_hue(odd)
+              and hue_distance(hs.circular_hue_mean(odd), ref_circular_mean_hue(odd))
+              <= hs.HUE_WRAP_EPS, case)
+        wide = rng.integers(-50, 400, 50)
+        check('out-of-range input', hs.median(wide) == np.median(wide)
+              and hs.circular_hue_median(wide) == ref_circular_median_hue(wide), case)
+
+    try:
+        hs.histogram(np.array([1.5, 2.0]))
+        failures.setdefault('histogram() rejects floats', []).append(-1)
+    except ValueError:
+        pass
+
+    for name in ('medians', 'means', 'trimmed_means', 'circular_hue_medians',
+                 'circular_hue_means', 'empty -> nan', 'median()', 'circular_hue_median()',
+                 'circular_hue_mean()', 'float input', 'out-of-range input',
+                 'histogram() rejects floats'):
+        bad = failures.get(name, [])
+        status = 'OK' if not bad else f"FAIL ({len(bad)} checks, first cases: {bad[:5]})"
+        print(f"  {name:26s} {status}")
+
+    # Batch of plates: histogram statistics vs per-well numpy calls
+    print("\n  pixels     numpy (ms)   histogram (ms)")
+    for plates in (1, 10, 50):
+        n = plates * 96
+        sizes = np.full(n, 1500)
+        labels = np.repeat(np.arange(n), sizes)
+        values = np.random.default_rng(plates).integers(0, 256, len(labels)).astype(np.uint8)
+        bounds = np.concatenate([[0], np.cumsum(sizes)])
+        start = time.perf_counter()
+        for i in range(n):
+            np.median(values[bounds[i]:bounds[i + 1]])
+        numpy_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        hs.medians(hs.label_histograms(labels, values, n))
+        hist_ms = (time.perf_counter() - start) * 1000
+        print(f"  {len(labels):8d}   {numpy_ms:10.1f}   {hist_ms:14.1f}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Tracing - Wall and CPU time of pipeline stages and sub-steps.
+
+Stages wrap their work in `with span('name'):`. While no tracer is active
+span() returns a shared no-op context, so the instrumentation costs nothing
+in normal runs. An active Tracer records one complete event per span and
+exports them in the Chrome trace / Perfetto JSON format
+(chrome://tracing or https://ui.perfetto.dev).
+
+    tracer = tracing.start()
+    run_pipeline(...)
+    tracing.stop()
+    tracer.save('trace.json')
+    tracer.print_summary()
+
+With memory=True every span also records the tracemalloc peak above its
+starting allocation (numpy/OpenCV arrays) and the growth of the process'
+peak RSS (which also covers OpenCV's internal buffers). A span whose
+growth exceeds memory_budget_mb (default: config.STAGE_MEMORY_BUDGET_MB)
+prints a warning. Memory is only measured on the main thread.
+
+Spans recorded in a worker process travel back with its result: the worker
+returns tracer.export() and the parent calls merge() on it, which places
+them on the parent's timeline under the worker's pid.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+_active = None          # the running Tracer, or None
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class Tracer:
+    """Collects timed spans from every thread of the current process."""
+
+    def __init__(self, name: str = 'mic_reader', memory: bool = False,
+                 memory_budget_mb: float = None):
+        self.name = name
+        self.events = []
+        self.origin = time.perf_counter()
+        self.started_at = time.time()
+        self.processes = {}  # pid -> name of each process merged in
+        self._lock = threading.Lock()
+
+        self.memory = memory
+        self.memory_budget_mb = memory_budget_mb
+        self._mem_stack = []  # running tracemalloc peak of each open span
+        self._owns_tracemalloc = False
+        if memory:
+            if memory_budget_mb is None:
+                from config import STAGE_MEMORY_BUDGET_MB
+                self.memory_budget_mb = STAGE_MEMORY_BUDGET_MB
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._owns_tracemalloc = True
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args):
+        track_memory = self.memory and threading.current_thread() is threading.main_thread()
+        if track_memory:
+            mem_start = self._memory_enter()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall_end = time.perf_counter()
+            cpu_end = time.thread_time()
+            event = {
+                'name': name,
+                'start_ms': (wall_start - self.origin) * 1000,
+                'wall_ms': (wall_end - wall_start) * 1000,
+                'cpu_ms': (cpu_end - cpu_start) * 1000,
+                'tid': threading.get_ident(),
+                'args': args,
+            }
+            if track_memory:
+                event['memory'] = self._memory_exit(name, mem_start)
+            with self._lock:
+                self.events.append(event)
+
+    # --- memory ---
+
+    def _memory_enter(self):
+        current, peak = tracemalloc.get_traced_memory()
+        # Hand the peak reached so far to the enclosing span before resetting
+        if self._mem_stack:
+            self._mem_stack[-1] = max(self._mem_stack[-1], peak)
+        tracemalloc.reset_peak()
+        self._mem_stack.append(current)
+        return current, _peak_rss_bytes()
+
+    def _memory_exit(self, name, mem_start):
+        traced_start, rss_start = mem_start
+        current, peak = tracemalloc.get_traced_memory()
+        span_peak = max(self._mem_stack.pop(), peak)
+        if self._mem_stack:
+            self._mem_stack[-1] = max(self._mem_stack[-1], span_peak)
+
+        rss_peak = _peak_rss_bytes()
+        mem = {
+            'traced_peak_mb': (span_peak - traced_start) / 2**20,
+            'traced_delta_mb': (current - traced_start) / 2**20,
+            'rss_peak_mb': rss_peak / 2**20 if rss_peak is not None else None,
+            'rss_growth_mb': (rss_peak - rss_start) / 2**20 if rss_peak is not None else None,
+        }
+        used = max(mem['traced_peak_mb'], mem['rss_growth_mb'] or 0.0)
+        if self.memory_budget_mb and used > self.memory_budget_mb:
+            print(f"[WARN] '{name}' bellek bütçesini aştı: "
+                  f"{used:.0f} MB > {self.memory_budget_mb:.0f} MB")
+        return mem
+
+    def export(self) -> dict:
+        """This process' spans, picklable, for merge() in another process."""
+        with self._lock:
+            events = list(self.events)
+        return {'name': self.name, 'pid': os.getpid(),
+                'started_at': self.started_at, 'events': events}
+
+    def merge(self, exported: dict):
+        """Add spans exported by another process, shifted onto this timeline."""
+        shift_ms = (exported['started_at'] - self.started_at) * 1000
+        pid = exported['pid']
+        with self._lock:
+            self.processes[pid] = exported['name']
+            self.events.extend({**e, 'start_ms': e['start_ms'] + shift_ms, 'pid': pid}
+                               for e in exported['events'])
+
+    def summary(self) -> list:
+        """Per span name: call count, total wall and CPU time, in first-seen order."""
+        rows = {}
+        for e in sorted(self.events, key=lambda e: e['start_ms']):
+            row = rows.setdefault(e['name'], {'name': e['name'], 'count': 0,
+                                              'wall_ms': 0.0, 'cpu_ms': 0.0})
+            row['count'] += 1
+            row['wall_ms'] += e['wall_ms']
+            row['cpu_ms'] += e['cpu_ms']
+            if 'memory' in e:
+                mem = e['memory']
+                row['traced_peak_mb'] = max(row.get('traced_peak_mb', 0.0), mem['traced_peak_mb'])
+                if mem['rss_growth_mb'] is not None:
+                    row['rss_growth_mb'] = max(row.get('rss_growth_mb', 0.0), mem['rss_growth_mb'])
+                    row['rss_peak_mb'] = max(row.get('rss_peak_mb', 0.0), mem['rss_peak_mb'])
+        return list(rows.values())
+
+    def to_chrome_trace(self) -> dict:
+        pid = os.getpid()
+        trace_events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': p, 'tid': 0,
+            'args': {'name': name},
+        } for p, name in {pid: self.name, **self.processes}.items()]
+        for e in self.events:
+            args = {'cpu_ms': round(e['cpu_ms'], 3), **e['args']}
+            for key, value in e.get('memory', {}).items():
+                args[key] = round(value, 2) if value is not None else None
+            trace_events.append({
+                'name': e['name'],
+                'cat': 'pipeline',
+                'ph': 'X',
+                'ts': round(e['start_ms'] * 1000, 1),
+                'dur': round(e['wall_ms'] * 1000, 1),
+                'pid': e.get('pid', pid),
+                'tid': e['tid'],
+                'args': args,
+            })
+            if e.get('memory', {}).get('rss_peak_mb') is not None:
+                trace_events.append({
+                    'name': 'peak_rss_mb', 'ph': 'C', 'pid': e.get('pid', pid),
+                    'ts': round((e['start_ms'] + e['wall_ms']) * 1000, 1),
+                    'args': {'peak_rss_mb': round(e['memory']['rss_peak_mb'], 1)},
+                })
+        return {
+            'traceEvents': trace_events,
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'name': self.name,
+                'started_at': time.strftime('%Y-%m-%d %H:%M:%S',
+                                            time.localtime(self.started_at)),
+                'summary': self.summary(),
+            },
+        }
+
+    def save(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+    def print_summary(self):
+        header = f"{'Aşama':<28} {'Sayı':>5} {'Duvar (ms)':>12} {'CPU (ms)':>12}"
+        if self.memory:
+            header += f" {'Tepe (MB)':>10} {'RSS+ (MB)':>10}"
+        print(header)
+        print("-" * len(header))
+        for row in self.summary():
+            line = (f"{row['name']:<28} {row['count']:>5} "
+                    f"{row['wall_ms']:>12.1f} {row['cpu_ms']:>12.1f}")
+            if self.memory:
+                line += f" {row.get('traced_peak_mb', 0.0):>10.1f}"
+                line += (f" {row['rss_growth_mb']:>10.1f}" if 'rss_growth_mb' in row
+                         else f" {'-':>10}")
+            print(line)
+        if self.memory:
+            rss = _peak_rss_bytes()
+            if rss is not None:
+                print(f"Süreç tepe RSS: {rss / 2**20:.1f} MB")
+
+
+def _peak_rss_bytes():
+    """High-water resident set size of this process, or None if unavailable."""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def start(name: str = 'mic_reader', memory: bool = False,
+          memory_budget_mb: float = None) -> Tracer:
+    """Activate a new tracer for this process and return it."""
+    global _active
+    _active = Tracer(name, memory, memory_budget_mb)
+    return _active
+
+
+def stop() -> Tracer:
+    """Deactivate and return the current tracer (None if none was active)."""
+    global _active
+    tracer, _active = _active, None
+    if tracer is not None and tracer._owns_tracemalloc:
+        tracemalloc.stop()
+    return tracer
+
+
+def active() -> Tracer:
+    """The running tracer, or None."""
+    return _active
+
+
+def span(name: str, **args):
+    """Time a block under the active tracer; a no-op when tracing is off."""
+    if _active is None:
+        return _NULL_SPAN
+    return _active.span(name, **args)
@@ -0,0 +1,233 @@
+"""
+MIC YST Plate Reader - Watch-Folder Daemon
+Polls a directory and runs the pipeline on every new or changed image.
+
+Usage:
+    python watcher.py <directory> [--output-dir <dir>] [--workers <n>]
+                      [--interval <seconds>] [--state-file <path>]
+                      [--outputs annotated,heatmap,csv,debug | --only mic]
+                      [--rig <name>]
+
+Processed files are tracked in a JSON state file (default:
+<output-dir>/.watch_state.json) by size and modification time, so a restart
+only picks up images that arrived or changed while the daemon was down.
+A file is processed once its size and mtime are unchanged between two polls,
+which keeps half-written scanner output out of the pipeline.
+--rig applies a fixed-rig profile (see main.py), the usual setup for a
+station that drops every shot into the watched folder.
+Only files directly inside the directory are watched, and generated
+artifacts (*_annotated.png, *_heatmap.png, *_debug_grid.png) are ignored,
+so the output directory may be the watched one or a folder inside it.
+Output files are named as in batch.py (output_names): images sharing a stem
+(plate1.jpg, plate1.png) get a path digest appended, so one never
+overwrites the other's results.
+A worker that dies (segfault, OOM kill) fails only its image: the pool is
+restarted and the daemon keeps running.
+"""
+
+import sys
+import os
+import time
+import signal
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from batch import (collect_images, output_names, process_image, crash_record,
+                   _init_worker, _signature)
+from result_cache import ARTIFACT_FILES
+import state_file
+
+STATE_FILE_NAME = '.watch_state.json'
+# Files the pipeline writes; never picked up as input, even when the
+# output directory is the watched directory
+ARTIFACT_SUFFIXES = tuple('_' + name for name in ARTIFACT_FILES.values())
+
+
+def _init_daemon_worker():
+    # Ctrl+C is handled by the daemon, which lets running images finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker()
+
+
+def _record(state: dict, path: str, sig: list, record: dict):
+    state[path] = {
+        'signature': sig,
+        'status': record['status'],
+        'outputs': record.get('outputs'),
+        'error': record.get('error'),
+        'seconds': round(record['seconds'], 3),
+        'processed_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def scan(directory: str) -> list:
+    """Absolute paths of the input images in directory, without pipeline outputs."""
+    return [p for p in map(os.path.abspath, collect_images(directory))
+            if not p.endswith(ARTIFACT_SUFFIXES)]
+
+
+def watch(directory: str, output_dir: str = '.', workers: int = 2,
+          interval: float = 2.0, state_path: str = None, outputs=None, rig: str = None):
+    """Run until interrupted, processing new/changed images with bounded concurrency."""
+    os.makedirs(output_dir, exist_ok=True)
+    state_path = state_path or os.path.join(output_dir, STATE_FILE_NAME)
+    state = state_file.load(state_path)
+
+    print(f"[INFO] İzleniyor: {directory} (her {interval:.1f} s, {workers} işçi)")
+    print(f"[INFO] Durum dosyası: {state_path} ({len(state)} kayıt)")
+
+    last_seen = {}   # path -> signature from the previous poll
+    queue = []       # ready paths waiting for a free worker
+    in_flight = {}   # future -> (path, signature, submit time)
+    suspects = set() # paths that were running when a worker died; retried alone
+
+    def report(path, sig, record):
+        _record(state, path, sig, record)
+        name = os.path.basename(path)
+        if record['status'] == 'ok':
+            print(f"[OK] {name} ({record['seconds']:.2f} s)")
+        else:
+            print(f"[FAIL] {name}: {record['error']}")
+
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_daemon_worker)
+    try:
+        while True:
+            # --- Scan for new or changed files ---
+            queued = set(queue) | {p for p, _, _ in in_flight.values()}
+            for path in scan(directory):
+                sig = _signature(path)
+                if sig is None or path in queued:
+                    continue
+                previous = last_seen.get(path)
+                last_seen[path] = sig
+                if sig != previous:
+                    continue  # still being written, or first sighting
+                entry = state.get(path)
+                if entry is not None and entry['signature'] == sig:
+                    continue
+                queue.append(path)
+
+            # --- Keep at most `workers` images in flight (suspects alone) ---
+            # Stems over every image seen so far, processed ones included
+            names = output_names(sorted(set(last_seen) | set(state))) if queue else {}
+            while queue and len(in_flight) < workers:
+                if in_flight and (queue[0] in suspects or
+                                  any(p in suspects for p, _, _ in in_flight.values())):
+                    break
+                path = queue.pop(0)
+                future = pool.submit(process_image, path, output_dir, outputs, rig=rig,
+                                     base_name=names[path])
+                in_flight[future] = (path, last_seen[path], time.perf_counter())
+
+            # --- Collect finished work ---
+            if in_flight:
+                done, _ = wait(in_flight, timeout=interval, return_when=FIRST_COMPLETED)
+            else:
+                done = set()
+                time.sleep(interval)
+
+            changed = bool(done)
+            try:
+                for future in done:
+                    future.result()  # raises BrokenProcessPool before anything is recorded
+                for future in done:
+                    path, sig, _ = in_flight.pop(future)
+                    suspects.discard(path)
+                    report(path, sig, future.result())
+            except BrokenProcessPool:
+                crashed = []
+                for future, (path, sig, submitted) in in_flight.items():
+                    if future.done() and future.exception() is None:
+                        report(path, sig, future.result())
+                    else:
+                        crashed.append((path, sig, submitted))
+                in_flight = {}
+                if len(crashed) > 1 and not all(p in suspects for p, _, _ in crashed):
+                    print(f"[WARN] Bir işçi süreç çöktü, {len(crashed)} görüntü tek tek "
+                          f"yeniden denenecek")
+                    suspects.update(p for p, _, _ in crashed)
+                    queue[:0] = [p for p, _, _ in crashed]
+                else:
+                    print("[WARN] Bir işçi süreç çöktü, havuz yeniden başlatılıyor")
+                    for path, sig, submitted in crashed:
+                        suspects.discard(path)
+                        report(path, sig, crash_record(path, time.perf_counter() - submitted))
+                pool.shutdown(wait=False)
+                pool = ProcessPoolExecutor(max_workers=workers,
+                                           initializer=_init_daemon_worker)
+                changed = True
+            if changed:
+                state_file.save(state, state_path)
+
+    except KeyboardInterrupt:
+        print("\n[INFO] Durduruluyor, çalışan işler bekleniyor...")
+        for future, (path, sig, submitted) in in_flight.items():
+            try:
+                record = future.result()
+            except BrokenProcessPool:
+                record = crash_record(path, time.perf_counter() - submitted)
+            _record(state, path, sig, record)
+        state_file.save(state, state_path)
+    finally:
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Kullanım: python watcher.py <klasör> [--output-dir <klasör>] [--workers <n>] "
+              "[--interval <saniye>] [--state-file <yol>] "
+              "[--outputs annotated,heatmap,csv,debug | --only mic] [--rig <ad>]")
+        sys.exit(1)
+
+    directory = sys.argv[1]
+    output_dir = '.'
+    workers = 2
+    interval = 2.0
+    state_path = None
+    rig = None
+
+    if '--output-dir' in sys.argv:
+        idx = sys.argv.index('--output-dir')
+        if idx + 1 < len(sys.argv):
+            output_dir = sys.argv[idx + 1]
+
+    if '--workers' in sys.argv:
+        idx = sys.argv.index('--workers')
+        if idx + 1 < len(sys.argv):
+            workers = int(sys.argv[idx + 1])
+
+    if '--interval' in sys.argv:
+        idx = sys.argv.index('--interval')
+        if idx + 1 < len(sys.argv):
+            interval = float(sys.argv[idx + 1])
+
+    if '--state-file' in sys.argv:
+        idx = sys.argv.index('--state-file')
+        if idx + 1 < len(sys.argv):
+            state_path = sys.argv[idx + 1]
+
+    if '--rig' in sys.argv:
+        idx = sys.argv.index('--rig')
+        if idx + 1 < len(sys.argv):
+            rig = sys.argv[idx + 1]
+            from rig_profile import load_profile
+            try:
+                load_profile(rig)
+            except ValueError as e:
+                print(f"[ERROR] {e}")
+                sys.exit(1)
+
+    from main import parse_outputs
+    try:
+        outputs = parse_outputs(sys.argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+
+    if not os.path.isdir(directory):
+        print(f"[ERROR] Klasör bulunamadı: {directory}")
+        sys.exit(1)
+
+    watch(directory, output_dir, workers, interval, state_path, outputs, rig)
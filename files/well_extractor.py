@@ -8,25 +8,58 @@ Improvements over v3:
   - Debug visualization
 """
 
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
 from config import (
     ROWS, COLS, WELL_MASK_RADIUS_FRACTION,
-    SPECULAR_V_THRESHOLD, MIN_SATURATION
+    SPECULAR_V_THRESHOLD, MIN_SATURATION, SOURCE_DISC_VERTICES,
+    HOUGH_WORKERS, HOUGH_EARLY_EXIT_COVERAGE, CIRCLE_ENGINE,
+    CIRCLE_WORK_RADIUS_PX, CIRCLE_WORK_MAX_RATIO, GRID_ENGINE,
+    COLOR_ENGINE
 )
+import hist_stats
+from circle_voting import vote_circles
+from lattice_fft import fit_lattice_fft
+from tracing import span
+
+# (blur size, param2) of every Hough pass, in the order they are merged
+HOUGH_PASSES = [(blur_size, param2) for blur_size in (7, 9, 11) for param2 in (22, 28, 35)]
+
+
+def extract_wells(plate_image: np.ndarray, debug_path: str = None) -> dict:
+    wells, _ = extract_wells_with_grid(plate_image, debug_path)
+    return wells
 
 
-def extract_wells(plate_image: np.ndarray) -> dict:
+def extract_wells_with_grid(plate_image: np.ndarray, debug_path: str = None,
+                            source: tuple = None) -> tuple:
+    """
+    Same as extract_wells, but returns (wells, geometry) where geometry is
+    {'grid', 'grid_params', 'med_radius'} as fitted on this plate.
+    With source=(source_image, plate_to_source) the colors are sampled from
+    the source image through the homography (sample_well_colors_source).
+    """
     h, w = plate_image.shape[:2]
     
-    circles, med_radius = detect_circles(plate_image)
+    with span('detect_circles'):
+        circles, med_radius = detect_circles(plate_image)
     print(f"       {len(circles)} daire tespit edildi (medyan R={med_radius:.0f})")
     
-    if len(circles) < 20:
-        print("       [WARN] Yetersiz daire, naif grid kullanılacak")
-        grid, grid_params = _naive_grid(w, h, med_radius)
-    else:
-        grid, grid_params = fit_grid_robust(circles, w, h, med_radius)
+    with span('fit_grid'):
+        fitted = None
+        if GRID_ENGINE == 'fft':
+            fitted = fit_grid_fft(plate_image, circles, med_radius)
+            if fitted is None:
+                print("       [WARN] FFT ızgara tespiti belirsiz, standart grid uydurma kullanılacak")
+        if fitted is not None:
+            grid, grid_params = fitted
+        elif len(circles) < 20:
+            print("       [WARN] Yetersiz daire, naif grid kullanılacak")
+            grid, grid_params = _naive_grid(w, h, med_radius)
+        else:
+            grid, grid_params = fit_grid_robust(circles, w, h, med_radius)
     
     origin_x, origin_y, step_x, step_y = grid_params
     print(f"       Grid: başlangıç=({origin_x:.1f}, {origin_y:.1f}), "
@@ -35,19 +68,32 @@ def extract_wells(plate_image: np.ndarray) -> dict:
     matched = sum(1 for v in grid.values() if v['detected'])
     print(f"       {matched}/96 kuyucuk Hough ile eşleşti, {96-matched} interpolasyonla dolduruldu")
     
-    # Debug image
-    debug = plate_image.copy()
-    for (row, col), gdata in grid.items():
-        cx, cy = int(gdata['cx']), int(gdata['cy'])
-        r = int(gdata.get('radius', med_radius))
-        color = (0, 255, 0) if gdata['detected'] else (0, 165, 255)
-        cv2.circle(debug, (cx, cy), r, color, 2)
-        cv2.circle(debug, (cx, cy), 3, (0, 0, 255), -1)
-        label = f"{row},{col}"
-        cv2.putText(debug, label, (cx-12, cy-r-4), cv2.FONT_HERSHEY_SIMPLEX, 0.3, color, 1)
-    cv2.imwrite('/home/claude/mic_output/debug_grid_v4.png', debug)
+    # Debug image (only when requested: a full-plate copy plus a PNG encode)
+    if debug_path:
+        with span('debug_image'):
+            save_debug_grid(plate_image, grid, med_radius, debug_path)
+    
+    with span('color_extraction'):
+        if source is None:
+            wells = sample_well_colors(plate_image, grid, med_radius)
+        else:
+            wells = sample_well_colors_source(source[0], source[1], grid, med_radius,
+                                              plate_image.shape)
     
-    # Extract colors
+    return wells, {'grid': grid, 'grid_params': grid_params, 'med_radius': med_radius}
+
+
+def sample_well_colors(plate_image: np.ndarray, grid: dict, med_radius: float) -> dict:
+    """
+    Measure the color of every grid well on a central disc
+    (WELL_MASK_RADIUS_FRACTION of the well radius), ignoring specular
+    highlights and unsaturated pixels when enough valid pixels remain.
+    With COLOR_ENGINE = 'batched' all wells are measured in one pass
+    (sample_well_colors_batched) instead of the per-well loop below.
+    """
+    if COLOR_ENGINE == 'batched':
+        return sample_well_colors_batched(plate_image, grid, med_radius)
+    h, w = plate_image.shape[:2]
     hsv_image = cv2.cvtColor(plate_image, cv2.COLOR_BGR2HSV)
     wells = {}
     
@@ -86,8 +132,8 @@ def extract_wells(plate_image: np.ndarray) -> dict:
         if len(valid_hsv) > 0:
             wells[(row, col)] = {
                 'hsv_median': (circular_median_hue(valid_hsv[:, 0]),
-                               float(np.median(valid_hsv[:, 1])),
-                               float(np.median(valid_hsv[:, 2]))),
+                               hist_stats.median(valid_hsv[:, 1]),
+                               hist_stats.median(valid_hsv[:, 2])),
                 'hsv_mean': (circular_mean_hue(valid_hsv[:, 0]),
                              float(np.mean(valid_hsv[:, 1])),
                              float(np.mean(valid_hsv[:, 2]))),
@@ -107,37 +153,351 @@ def extract_wells(plate_image: np.ndarray) -> dict:
     return wells
 
 
+def sample_well_colors_batched(plate_image: np.ndarray, grid: dict, med_radius: float) -> dict:
+    """
+    sample_well_colors() for all wells in one pass: the sampling discs come
+    from cached pixel offsets per radius (_disc_offsets), the validity mask
+    is applied to all disc pixels at once, and counts, means and medians
+    come from per-well histograms (hist_stats.py). The results are identical
+    to the per-well loop of sample_well_colors().
+    """
+    h, w = plate_image.shape[:2]
+    hsv_image = cv2.cvtColor(plate_image, cv2.COLOR_BGR2HSV)
+    keys = list(grid)
+    n = len(keys)
+    
+    # Per-well geometry, as in sample_well_colors
+    cxs = np.empty(n, dtype=np.int64)
+    cys = np.empty(n, dtype=np.int64)
+    radii = np.empty(n, dtype=np.int64)
+    for k, key in enumerate(keys):
+        gdata = grid[key]
+        cxs[k], cys[k] = int(gdata['cx']), int(gdata['cy'])
+        radii[k] = int(gdata.get('radius', med_radius))
+    x1s, x2s = np.maximum(0, cxs - radii), np.minimum(w, cxs + radii)
+    y1s, y2s = np.maximum(0, cys - radii), np.minimum(h, cys + radii)
+    too_small = (y2s - y1s < 5) | (x2s - x1s < 5)
+    sample_rs = (radii * WELL_MASK_RADIUS_FRACTION).astype(np.int64)
+    
+    # Disc pixels of all wells, grouped by radius
+    labels, flat = [], []
+    for sample_r in np.unique(sample_rs[~too_small]):
+        members = np.flatnonzero((sample_rs == sample_r) & ~too_small)
+        dy, dx = _disc_offsets(int(sample_r))
+        ys = cys[members, None] + dy
+        xs = cxs[members, None] + dx
+        inside = ((ys >= y1s[members, None]) & (ys < y2s[members, None]) &
+                  (xs >= x1s[members, None]) & (xs < x2s[members, None]))
+        labels.append(np.broadcast_to(members[:, None], ys.shape)[inside])
+        flat.append((ys * w + xs)[inside])
+    labels = np.concatenate(labels) if labels else np.empty(0, dtype=np.int64)
+    flat = np.concatenate(flat) if flat else np.empty(0, dtype=np.int64)
+    
+    hsv_px = hsv_image.reshape(-1, 3)[flat]
+    bgr_px = plate_image.reshape(-1, 3)[flat]
+    
+    # Validity mask once; wells with fewer than 10 valid pixels use the whole
+    # disc. Pixels left out go to a spare label n.
+    valid = (hsv_px[:, 2] < SPECULAR_V_THRESHOLD) & (hsv_px[:, 1] > MIN_SATURATION)
+    use_all = np.bincount(labels[valid], minlength=n) < 10
+    selected = valid | use_all[labels]
+    labels = np.where(selected, labels, n)
+    counts = np.bincount(labels, minlength=n + 1)[:n]
+    
+    # Per-well histograms of every channel; means are exact integer sums
+    hsv_hists = [hist_stats.label_histograms(labels, hsv_px[:, c], n + 1)[:n] for c in range(3)]
+    bgr_hists = [hist_stats.label_histograms(labels, bgr_px[:, c], n + 1)[:n] for c in range(3)]
+    h_median = hist_stats.circular_hue_medians(hsv_hists[0], counts)
+    s_median, v_median = (hist_stats.medians(hist, counts) for hist in hsv_hists[1:])
+    h_mean = hist_stats.circular_hue_means(hsv_hists[0], counts)
+    s_mean, v_mean = (hist_stats.means(hist, counts) for hist in hsv_hists[1:])
+    b_mean, g_mean, r_mean = (hist_stats.means(hist, counts) for hist in bgr_hists)
+    
+    wells = {}
+    for k, key in enumerate(keys):
+        cx, cy = int(cxs[k]), int(cys[k])
+        x1, y1, x2, y2 = int(x1s[k]), int(y1s[k]), int(x2s[k]), int(y2s[k])
+        cell_bgr = plate_image[y1:y2, x1:x2]
+        if too_small[k] or counts[k] == 0:
+            wells[key] = _empty_well(cx, cy, cell_bgr)
+            continue
+        wells[key] = {
+            'hsv_median': (float(h_median[k]), float(s_median[k]), float(v_median[k])),
+            'hsv_mean': (float(h_mean[k]), float(s_mean[k]), float(v_mean[k])),
+            'rgb_mean': (float(r_mean[k]), float(g_mean[k]), float(b_mean[k])),
+            'pixel_count': int(counts[k]),
+            'center': (cx, cy),
+            'cell_bounds': (x1, y1, x2, y2),
+            'radius': int(radii[k]),
+            'detected': grid[key]['detected'],
+            'crop': cell_bgr.copy(),
+        }
+    
+    return wells
+
+
+_disc_cache = {}
+
+
+def _disc_offsets(sample_r: int) -> tuple:
+    """(dy, dx) of the pixels cv2.circle fills for a disc of radius sample_r, row-major."""
+    if sample_r not in _disc_cache:
+        size = 2 * sample_r + 1
+        mask = np.zeros((size, size), dtype=np.uint8)
+        cv2.circle(mask, (sample_r, sample_r), sample_r, 255, -1)
+        dy, dx = np.nonzero(mask)
+        _disc_cache[sample_r] = (dy - sample_r, dx - sample_r)
+    return _disc_cache[sample_r]
+
+
+def sample_well_colors_source(source_image: np.ndarray, plate_to_source: np.ndarray,
+                              grid: dict, med_radius: float, plate_shape: tuple) -> dict:
+    """
+    sample_well_colors() without the warped plate: each sampling disc is
+    mapped from plate to source coordinates through the homography, and only
+    the source pixels under the mapped disc are converted to HSV and measured.
+    Center, radius and cell_bounds stay in plate coordinates; 'crop' is the
+    source patch around the disc.
+    """
+    h, w = plate_shape[:2]
+    sh, sw = source_image.shape[:2]
+    keys = list(grid)
+    
+    # Sampling disc outlines of all wells, mapped in one call
+    angles = np.linspace(0, 2 * np.pi, SOURCE_DISC_VERTICES, endpoint=False)
+    unit = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    outlines = []
+    for key in keys:
+        gdata = grid[key]
+        cx, cy = int(gdata['cx']), int(gdata['cy'])
+        sample_r = int(int(gdata.get('radius', med_radius)) * WELL_MASK_RADIUS_FRACTION)
+        outlines.append(unit * sample_r + (cx, cy))
+    outlines = np.array(outlines, dtype=np.float64).reshape(-1, 1, 2)
+    mapped = cv2.perspectiveTransform(outlines, plate_to_source.astype(np.float64))
+    mapped = mapped.reshape(len(keys), SOURCE_DISC_VERTICES, 2)
+    
+    wells = {}
+    for key, polygon in zip(keys, mapped):
+        gdata = grid[key]
+        cx, cy = int(gdata['cx']), int(gdata['cy'])
+        r = int(gdata.get('radius', med_radius))
+        
+        # Same cell bounds and emptiness rule as on the warped plate
+        y1, y2 = max(0, cy - r), min(h, cy + r)
+        x1, x2 = max(0, cx - r), min(w, cx + r)
+        
+        sx1 = max(0, int(np.floor(polygon[:, 0].min())))
+        sy1 = max(0, int(np.floor(polygon[:, 1].min())))
+        sx2 = min(sw, int(np.ceil(polygon[:, 0].max())) + 1)
+        sy2 = min(sh, int(np.ceil(polygon[:, 1].max())) + 1)
+        if y2 - y1 < 5 or x2 - x1 < 5 or sx2 <= sx1 or sy2 <= sy1:
+            wells[key] = _empty_well(cx, cy, source_image[sy1:sy2, sx1:sx2].copy())
+            continue
+        
+        patch_bgr = source_image[sy1:sy2, sx1:sx2]
+        patch_hsv = cv2.cvtColor(patch_bgr, cv2.COLOR_BGR2HSV)
+        
+        mask = np.zeros(patch_bgr.shape[:2], dtype=np.uint8)
+        shift = 4  # sub-pixel polygon vertices
+        vertices = np.round((polygon - (sx1, sy1)) * (1 << shift)).astype(np.int32)
+        cv2.fillPoly(mask, [vertices], 255, cv2.LINE_8, shift)
+        
+        combined_mask = ((mask > 0) &
+                         (patch_hsv[:, :, 2] < SPECULAR_V_THRESHOLD) &
+                         (patch_hsv[:, :, 1] > MIN_SATURATION))
+        
+        valid_hsv = patch_hsv[combined_mask]
+        valid_bgr = patch_bgr[combined_mask]
+        
+        if len(valid_hsv) < 10:
+            valid_hsv = patch_hsv[mask > 0]
+            valid_bgr = patch_bgr[mask > 0]
+        
+        if len(valid_hsv) > 0:
+            wells[key] = {
+                'hsv_median': (circular_median_hue(valid_hsv[:, 0]),
+                               hist_stats.median(valid_hsv[:, 1]),
+                               hist_stats.median(valid_hsv[:, 2])),
+                'hsv_mean': (circular_mean_hue(valid_hsv[:, 0]),
+                             float(np.mean(valid_hsv[:, 1])),
+                             float(np.mean(valid_hsv[:, 2]))),
+                'rgb_mean': (float(np.mean(valid_bgr[:, 2])),
+                             float(np.mean(valid_bgr[:, 1])),
+                             float(np.mean(valid_bgr[:, 0]))),
+                'pixel_count': len(valid_hsv),
+                'center': (cx, cy),
+                'cell_bounds': (x1, y1, x2, y2),
+                'radius': r,
+                'detected': gdata['detected'],
+                'crop': patch_bgr.copy(),
+            }
+        else:
+            wells[key] = _empty_well(cx, cy, patch_bgr.copy())
+    
+    return wells
+
+
+def save_debug_grid(plate_image, grid, med_radius, debug_path):
+    debug = plate_image.copy()
+    for (row, col), gdata in grid.items():
+        cx, cy = int(gdata['cx']), int(gdata['cy'])
+        r = int(gdata.get('radius', med_radius))
+        color = (0, 255, 0) if gdata['detected'] else (0, 165, 255)
+        cv2.circle(debug, (cx, cy), r, color, 2)
+        cv2.circle(debug, (cx, cy), 3, (0, 0, 255), -1)
+        label = f"{row},{col}"
+        cv2.putText(debug, label, (cx-12, cy-r-4), cv2.FONT_HERSHEY_SIMPLEX, 0.3, color, 1)
+    cv2.imwrite(debug_path, debug)
+
+
 # =====================================================================
 # Circle Detection
 # =====================================================================
 
 def detect_circles(plate_image: np.ndarray) -> tuple:
+    """
+    Find the well circles on the upright plate; returns (circles, median radius)
+    in plate pixels.
+    Plates whose expected well radius exceeds CIRCLE_WORK_MAX_RATIO x
+    CIRCLE_WORK_RADIUS_PX (full-resolution decodes, PNG/TIFF scans) are
+    searched on a copy shrunk to a radius of CIRCLE_WORK_RADIUS_PX, so the
+    Hough cost no longer grows with the camera resolution; the circles are
+    scaled back to the plate.
+    """
     h, w = plate_image.shape[:2]
     gray = cv2.cvtColor(plate_image, cv2.COLOR_BGR2GRAY)
     
+    expected_r = min(w / COLS, h / ROWS) * 0.42
+    scale = 1.0
+    if CIRCLE_WORK_RADIUS_PX and expected_r > CIRCLE_WORK_RADIUS_PX * CIRCLE_WORK_MAX_RATIO:
+        scale = CIRCLE_WORK_RADIUS_PX / expected_r
+        with span('circle_rescale', scale=round(scale, 3)):
+            gray = cv2.resize(gray, (max(1, round(w * scale)), max(1, round(h * scale))),
+                              interpolation=cv2.INTER_AREA)
+    
+    circles, med_r = _detect_circles(gray)
+    if scale == 1.0:
+        return circles, med_r
+    # Pixel centers: work x + 0.5 = (plate x + 0.5) * scale
+    sx, sy = w / gray.shape[1], h / gray.shape[0]
+    circles = circles.copy()
+    circles[:, 0] = (circles[:, 0] + 0.5) * sx - 0.5
+    circles[:, 1] = (circles[:, 1] + 0.5) * sy - 0.5
+    circles[:, 2] = circles[:, 2] / scale
+    return circles, med_r / scale
+
+
+def _detect_circles(gray: np.ndarray) -> tuple:
+    """
+    Merge the circles of the HOUGH_PASSES. Up to HOUGH_WORKERS passes run
+    ahead on a thread pool (HoughCircles releases the GIL), but results are
+    taken in pass order: after each pass the merged circles so far are
+    filtered, and the remaining passes are skipped once they cover at least
+    HOUGH_EARLY_EXIT_COVERAGE of the wells of a grid fitted to them without
+    outnumbering the wells (extra circles mean false detections that later
+    passes help outvote; see _covers_grid). The result is the same for any
+    number of workers; extra workers only run later passes speculatively,
+    and an early exit does not wait for those.
+    With CIRCLE_ENGINE = 'voting' the passes of a blur level come from one
+    accumulator (circle_voting.py) and form a single job; its passes are
+    still merged and checked one by one.
+    """
+    h, w = gray.shape[:2]
+    
     expected_cell = min(w / 12, h / 8)
     expected_r = expected_cell * 0.42
     min_r = int(expected_r * 0.5)
     max_r = int(expected_r * 1.3)
     min_dist = int(expected_cell * 0.65)
     
-    all_circles = []
-    for blur_size in [7, 9, 11]:
-        blurred = cv2.GaussianBlur(gray, (blur_size, blur_size), 2)
-        for param2 in [22, 28, 35]:
+    blurred = {}
+    if CIRCLE_ENGINE == 'voting':
+        # One job per blur level: a single accumulator serves all its thresholds
+        blur_sizes = list(dict.fromkeys(blur_size for blur_size, _ in HOUGH_PASSES))
+        jobs = [(blur_size, [p2 for b, p2 in HOUGH_PASSES if b == blur_size])
+                for blur_size in blur_sizes]
+    else:
+        jobs = [(blur_size, [param2]) for blur_size, param2 in HOUGH_PASSES]
+    
+    def run_job(job):
+        blur_size, thresholds = job
+        if CIRCLE_ENGINE == 'voting':
+            with span('voting_pass', blur=blur_size, thresholds=len(thresholds)):
+                return vote_circles(blurred[blur_size], min_r, max_r, min_dist, 50, thresholds)
+        with span('hough_pass', blur=blur_size, param2=thresholds[0]):
             circles = cv2.HoughCircles(
-                blurred, cv2.HOUGH_GRADIENT, dp=1.0,
-                minDist=min_dist, param1=50, param2=param2,
+                blurred[blur_size], cv2.HOUGH_GRADIENT, dp=1.0,
+                minDist=min_dist, param1=50, param2=thresholds[0],
                 minRadius=min_r, maxRadius=max_r
             )
-            if circles is not None:
-                all_circles.append(circles[0])
+        return [circles[0] if circles is not None else np.empty((0, 3), np.float32)]
+    
+    workers = max(1, HOUGH_WORKERS or min(3, cv2.getNumThreads()))
+    pool = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+    pending = []   # futures of the next jobs, in pass order
+    all_circles = []
+    passes_done = 0
+    
+    def submit(job):
+        blur_size = job[0]
+        if blur_size not in blurred:
+            blurred[blur_size] = cv2.GaussianBlur(gray, (blur_size, blur_size), 2)
+        if pool is None:
+            return run_job(job)
+        return pool.submit(run_job, job)
+    
+    try:
+        next_job = 0
+        for done in range(len(jobs)):
+            # Keep up to `workers` passes running ahead of the one consumed
+            while next_job < len(jobs) and next_job < done + workers:
+                pending.append(submit(jobs[next_job]))
+                next_job += 1
+            found = pending.pop(0)
+            if pool is not None:
+                found = found.result()
+            
+            # Checked after every pass in pass order, so which passes are
+            # merged depends neither on the number of workers nor on the engine
+            for circles in found:
+                passes_done += 1
+                if len(circles):
+                    all_circles.append(circles)
+                if HOUGH_EARLY_EXIT_COVERAGE and all_circles and passes_done < len(HOUGH_PASSES):
+                    filtered, med_r = _merge_circles(all_circles, min_dist, w, h)
+                    if _covers_grid(filtered, med_r, w, h):
+                        return filtered, med_r  # trace shows how many passes ran
+    finally:
+        if pool is not None:
+            # Passes already running are left to finish in the background
+            # instead of holding up an early exit; their results are dropped
+            pool.shutdown(wait=False, cancel_futures=True)
     
     if not all_circles:
         return np.array([]).reshape(0, 3), expected_r
     
+    return _merge_circles(all_circles, min_dist, w, h)
+
+
+def _covers_grid(circles, med_r, w, h) -> bool:
+    """
+    Early-exit test: the circles sit on HOUGH_EARLY_EXIT_COVERAGE of the
+    wells of a grid fitted to them (duplicates and strays do not count) and
+    do not outnumber the wells.
+    """
+    target = ROWS * COLS * HOUGH_EARLY_EXIT_COVERAGE
+    if not target <= len(circles) <= ROWS * COLS:
+        return False
+    with span('coverage_check', n=len(circles)):
+        grid, _ = fit_grid_robust(circles, w, h, med_r)
+    return sum(g['detected'] for g in grid.values()) >= target
+
+
+def _merge_circles(all_circles, min_dist, w, h):
+    """Deduplicate the circles of several passes and drop radius/edge outliers."""
     combined = np.vstack(all_circles)
-    deduped = _deduplicate(combined, min_dist * 0.5)
+    with span('deduplicate', n=len(combined)):
+        deduped = _deduplicate(combined, min_dist * 0.5)
     
     # Filter by radius
     radii = deduped[:, 2]
@@ -157,23 +517,70 @@ def detect_circles(plate_image: np.ndarray) -> tuple:
 
 
 def _deduplicate(circles, merge_dist):
+    """
+    Greedy merge in detection order: each circle not merged yet takes the
+    later ones within merge_dist of it, and the cluster becomes its mean.
+    Neighbours come from _close_pairs; circles without any are kept as is.
+    """
     if len(circles) == 0:
         return circles
-    used = np.zeros(len(circles), dtype=bool)
-    merged = []
-    for i in range(len(circles)):
-        if used[i]:
-            continue
-        cluster = [circles[i]]
-        used[i] = True
-        for j in range(i + 1, len(circles)):
-            if used[j]:
+    n = len(circles)
+    i, j = _close_pairs(circles[:, 0], circles[:, 1], merge_dist)
+    d = np.sqrt((circles[i, 0] - circles[j, 0])**2 + (circles[i, 1] - circles[j, 1])**2)
+    i, j = i[d < merge_dist], j[d < merge_dist]
+    
+    merged = circles.copy()
+    keep = np.ones(n, dtype=bool)
+    if len(i):
+        order = np.lexsort((j, i))
+        i, j = i[order], j[order]
+        starts = np.searchsorted(i, np.arange(n + 1))
+        used = np.zeros(n, dtype=bool)
+        for head in np.unique(i):
+            if used[head]:
                 continue
-            if np.sqrt((circles[i][0]-circles[j][0])**2 + (circles[i][1]-circles[j][1])**2) < merge_dist:
-                cluster.append(circles[j])
-                used[j] = True
-        merged.append(np.mean(cluster, axis=0))
-    return np.array(merged)
+            later = j[starts[head]:starts[head + 1]]
+            later = later[~used[later]]
+            used[later] = True
+            keep[later] = False
+            merged[head] = np.mean(circles[np.concatenate(([head], later))], axis=0)
+    return merged[keep]
+
+
+def _close_pairs(xs, ys, max_dist):
+    """
+    Candidate index pairs (i < j) for points closer than max_dist: points in
+    the same or adjacent cells of a grid hash with cells slightly larger
+    than max_dist. The caller applies the exact distance test.
+    """
+    cell = max(float(max_dist) * 1.01, 1e-6)
+    gx = np.floor(np.asarray(xs, dtype=np.float64) / cell).astype(np.int64)
+    gy = np.floor(np.asarray(ys, dtype=np.float64) / cell).astype(np.int64)
+    gx -= gx.min()
+    gy -= gy.min()
+    width = int(gx.max()) + 3  # room for gx - 1 and gx + 1 without aliasing
+    keys = gy * width + gx
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    
+    pairs_i, pairs_j = [], []
+    for dy in (-1, 0, 1):
+        for dx in (-1, 0, 1):
+            target = keys + dy * width + dx
+            lo = np.searchsorted(sorted_keys, target, 'left')
+            hi = np.searchsorted(sorted_keys, target, 'right')
+            i, j = _ragged_pairs(lo, hi - lo)
+            pairs_i.append(i)
+            pairs_j.append(order[j])
+    i, j = np.concatenate(pairs_i), np.concatenate(pairs_j)
+    return i[i < j], j[i < j]
+
+
+def _ragged_pairs(starts, counts):
+    """(owner, position) for position in starts[k]:starts[k]+counts[k], for every k."""
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offset = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, np.repeat(starts, counts) + offset
 
 
 # =====================================================================
@@ -196,10 +603,11 @@ def fit_grid_robust(circles: np.ndarray, img_w: int, img_h: int,
     # --- Step 1: Estimate step size from pairwise distances ---
     # For each pair of circles that are roughly in the same row (similar Y),
     # their X distance should be a multiple of step_x
-    step_x = _estimate_step_from_pairs(centers, axis=0, other_axis=1,
-                                        expected_step=expected_sx, max_other_dist=expected_sy*0.4)
-    step_y = _estimate_step_from_pairs(centers, axis=1, other_axis=0,
-                                        expected_step=expected_sy, max_other_dist=expected_sx*0.4)
+    with span('estimate_step', n=len(centers)):
+        step_x = _estimate_step_from_pairs(centers, axis=0, other_axis=1,
+                                            expected_step=expected_sx, max_other_dist=expected_sy*0.4)
+        step_y = _estimate_step_from_pairs(centers, axis=1, other_axis=0,
+                                            expected_step=expected_sy, max_other_dist=expected_sx*0.4)
     
     if step_x is None:
         step_x = expected_sx
@@ -207,8 +615,21 @@ def fit_grid_robust(circles: np.ndarray, img_w: int, img_h: int,
         step_y = expected_sy
     
     # --- Step 2: Find origin using brute-force search ---
-    best_ox, best_oy, best_score = None, None, -1
+    best_ox, best_oy = _search_origin(centers, step_x, step_y, expected_sx, expected_sy)
     
+    # --- Step 3: Refine grid parameters with least-squares ---
+    with span('refine_lsq'):
+        ox, oy, sx, sy = _refine_grid_lsq(circles, best_ox, best_oy, step_x, step_y)
+    
+    # --- Step 4: Final assignment ---
+    return _grid_from_params(circles, (ox, oy, sx, sy), med_radius)
+
+
+def _search_origin(centers, step_x, step_y, expected_sx, expected_sy):
+    """
+    Grid origin (ox, oy) with the most wells hit, among the origins implied
+    by each center sitting on some column/row, plus the expected origin.
+    """
     # Try origins based on detected circle positions modulo step
     candidate_ox = set()
     candidate_oy = set()
@@ -227,20 +648,47 @@ def fit_grid_robust(circles: np.ndarray, img_w: int, img_h: int,
     candidate_ox.add(round(expected_sx / 2, 1))
     candidate_oy.add(round(expected_sy / 2, 1))
     
-    for ox in candidate_ox:
-        for oy in candidate_oy:
-            score, _ = _score_grid(centers, ox, oy, step_x, step_y)
-            if score > best_score:
-                best_score = score
-                best_ox, best_oy = ox, oy
-    
-    # --- Step 3: Refine grid parameters with least-squares ---
-    ox, oy, sx, sy = _refine_grid_lsq(circles, best_ox, best_oy, step_x, step_y)
+    with span('origin_search', candidates=len(candidate_ox) * len(candidate_oy)):
+        # Same visiting order as a loop over the sets (ox outer, oy inner):
+        # argmax keeps the first of equal scores
+        candidate_ox, candidate_oy = list(candidate_ox), list(candidate_oy)
+        scores = _score_origins(centers, candidate_ox, candidate_oy, step_x, step_y)
+        best = int(np.argmax(scores))
+        best_ox = candidate_ox[best // len(candidate_oy)]
+        best_oy = candidate_oy[best % len(candidate_oy)]
+    return best_ox, best_oy
+
+
+def fit_grid_fft(plate_image: np.ndarray, circles: np.ndarray, med_radius: float) -> tuple:
+    """
+    Grid from the lattice period and phase of the plate spectrum
+    (lattice_fft.py) in place of steps 1-2 of fit_grid_robust; with enough
+    circles the lattice is refined and the circles are assigned as there.
+    Returns (grid, grid_params), or None when the spectrum is ambiguous or
+    fewer than half of the circles lie on the lattice.
+    """
+    with span('fft_lattice'):
+        lattice = fit_lattice_fft(plate_image)
+    if lattice is None:
+        return None
+    if len(circles) < 20:
+        return lattice_grid(lattice, med_radius), lattice
     
-    # --- Step 4: Final assignment ---
-    assignments = _assign_circles(circles, ox, oy, sx, sy)
+    ox, oy, sx, sy = lattice
+    score, _ = _score_grid(circles[:, :2].astype(float), ox, oy, sx, sy)
+    if score < len(circles) / 2:
+        return None
+    with span('refine_lsq'):
+        params = _refine_grid_lsq(circles, ox, oy, sx, sy)
+    return _grid_from_params(circles, params, med_radius)
+
+
+def _grid_from_params(circles, grid_params, med_radius):
+    """Assign circles to the lattice; unmatched wells sit on their lattice position."""
+    ox, oy, sx, sy = grid_params
+    with span('assign_circles'):
+        assignments = _assign_circles(circles, ox, oy, sx, sy)
     
-    # Build grid
     grid = {}
     for row in range(ROWS):
         for col in range(COLS):
@@ -263,29 +711,29 @@ def _estimate_step_from_pairs(centers, axis, other_axis, expected_step, max_othe
     """
     Estimate grid step by looking at distances between circles that share
     roughly the same row (for X step) or column (for Y step).
+    Candidate pairs come from a sweep over the centers sorted on the other
+    axis, so only circles within max_other_dist of each other are compared.
     """
-    n = len(centers)
-    unit_dists = []
-    
-    for i in range(n):
-        for j in range(i+1, n):
-            # Check if they're in the same row/column (small diff on other axis)
-            other_diff = abs(centers[i][other_axis] - centers[j][other_axis])
-            if other_diff > max_other_dist:
-                continue
-            
-            axis_diff = abs(centers[i][axis] - centers[j][axis])
-            if axis_diff < expected_step * 0.5:
-                continue
-            
-            # How many steps apart?
-            n_steps = round(axis_diff / expected_step)
-            if n_steps < 1 or n_steps > 12:
-                continue
-            
-            unit_dist = axis_diff / n_steps
-            if 0.7 * expected_step < unit_dist < 1.3 * expected_step:
-                unit_dists.append(unit_dist)
+    other = centers[:, other_axis]
+    order = np.argsort(other, kind='stable')
+    sorted_other = other[order]
+    # Slightly wider window; the exact test follows
+    reach = max_other_dist * (1 + 1e-9) + 1e-9
+    hi = np.searchsorted(sorted_other, sorted_other + reach, 'right')
+    first = np.arange(1, len(centers) + 1)
+    a, b = _ragged_pairs(first, np.maximum(hi - first, 0))
+    i, j = order[a], order[b]
+    
+    # Same row/column (small diff on the other axis), at least half a step apart
+    other_diff = np.abs(centers[i, other_axis] - centers[j, other_axis])
+    axis_diff = np.abs(centers[i, axis] - centers[j, axis])
+    axis_diff = axis_diff[(other_diff <= max_other_dist) & (axis_diff >= expected_step * 0.5)]
+    
+    # How many steps apart?
+    n_steps = np.rint(axis_diff / expected_step)
+    ok = (n_steps >= 1) & (n_steps <= 12)
+    unit_dists = axis_diff[ok] / n_steps[ok]
+    unit_dists = unit_dists[(0.7 * expected_step < unit_dists) & (unit_dists < 1.3 * expected_step)]
     
     if len(unit_dists) < 5:
         return None
@@ -315,69 +763,95 @@ def _score_grid(centers, ox, oy, sx, sy):
     return score, used_slots
 
 
+def _score_origins(centers, candidate_ox, candidate_oy, sx, sy):
+    """
+    _score_grid for every (ox, oy) pair at once: the number of wells with a
+    center within the threshold. Returns scores[len(candidate_ox), len(candidate_oy)].
+    """
+    cx, cy = centers[:, 0], centers[:, 1]
+    oys = np.asarray(candidate_oy, dtype=float)[:, None]
+    threshold = max(sx, sy) * 0.35
+    n_slots = ROWS * COLS
+    scores = np.empty((len(candidate_ox), len(oys)), dtype=np.int64)
+    
+    # The y terms do not depend on ox
+    row = np.rint((cy - oys) / sy)
+    dy2 = (cy - (oys + row * sy)) ** 2
+    row_ok = (row >= 0) & (row < ROWS)
+    
+    for i, ox in enumerate(candidate_ox):
+        col = np.rint((cx - ox) / sx)
+        dx2 = (cx - (ox + col * sx)) ** 2
+        hit = (row_ok & (col >= 0) & (col < COLS)) & (np.sqrt(dx2 + dy2) < threshold)
+        # A well counts once however many centers fall on it
+        slots = np.where(hit, row * COLS + col, n_slots).astype(np.int64)
+        slots += np.arange(len(oys))[:, None] * (n_slots + 1)
+        seen = np.zeros(len(oys) * (n_slots + 1), dtype=bool)
+        seen[slots.ravel()] = True
+        scores[i] = seen.reshape(len(oys), n_slots + 1)[:, :n_slots].sum(axis=1)
+    return scores
+
+
 def _refine_grid_lsq(circles, ox, oy, sx, sy):
     """Refine grid parameters using least-squares on good assignments."""
     threshold = max(sx, sy) * 0.35
+    cx, cy = circles[:, 0], circles[:, 1]
     
     for iteration in range(3):  # iterative refinement
-        rows_l, cols_l, cxs, cys = [], [], [], []
-        
-        for c in circles:
-            cx, cy = c[0], c[1]
-            col = round((cx - ox) / sx)
-            row = round((cy - oy) / sy)
-            
-            if 0 <= row < ROWS and 0 <= col < COLS:
-                pred_x = ox + col * sx
-                pred_y = oy + row * sy
-                err = np.sqrt((cx - pred_x)**2 + (cy - pred_y)**2)
-                
-                if err < threshold:
-                    rows_l.append(row)
-                    cols_l.append(col)
-                    cxs.append(cx)
-                    cys.append(cy)
+        rows, cols, err = _lattice_offsets(cx, cy, ox, oy, sx, sy)
+        good = (rows >= 0) & (rows < ROWS) & (cols >= 0) & (cols < COLS) & (err < threshold)
         
-        if len(cxs) < 20:
+        if np.count_nonzero(good) < 20:
             break
         
-        cols_arr = np.array(cols_l, dtype=float)
-        rows_arr = np.array(rows_l, dtype=float)
+        cols_arr = cols[good].astype(float)
+        rows_arr = rows[good].astype(float)
         
         A_x = np.column_stack([np.ones_like(cols_arr), cols_arr])
-        ox, sx = np.linalg.lstsq(A_x, np.array(cxs), rcond=None)[0]
+        ox, sx = np.linalg.lstsq(A_x, cx[good], rcond=None)[0]
         
         A_y = np.column_stack([np.ones_like(rows_arr), rows_arr])
-        oy, sy = np.linalg.lstsq(A_y, np.array(cys), rcond=None)[0]
+        oy, sy = np.linalg.lstsq(A_y, cy[good], rcond=None)[0]
     
     return float(ox), float(oy), float(sx), float(sy)
 
 
+def _lattice_offsets(cx, cy, ox, oy, sx, sy):
+    """
+    Nearest lattice (row, col) of each center and its distance from it, in
+    the precision of per-center scalar code: float32 centers against Python
+    float parameters stay float32, numpy float64 parameters make that axis
+    float64.
+    """
+    cols = np.rint((cx - ox) / sx).astype(np.int64)
+    rows = np.rint((cy - oy) / sy).astype(np.int64)
+    pred_x = (ox + cols * sx).astype(np.result_type(cx, ox, sx))
+    pred_y = (oy + rows * sy).astype(np.result_type(cy, oy, sy))
+    err = np.sqrt((cx - pred_x)**2 + (cy - pred_y)**2)
+    return rows, cols, err
+
+
 def _assign_circles(circles, ox, oy, sx, sy):
     """Assign circles to grid positions, keeping best match per slot."""
     threshold = max(sx, sy) * 0.45
-    assignments = {}
+    rows, cols, err = _lattice_offsets(circles[:, 0], circles[:, 1], ox, oy, sx, sy)
+    hits = np.flatnonzero((rows >= 0) & (rows < ROWS) & (cols >= 0) & (cols < COLS)
+                          & (err < threshold))
     
-    for c in circles:
-        cx, cy, r = c
-        col = round((cx - ox) / sx)
-        row = round((cy - oy) / sy)
-        
-        if 0 <= row < ROWS and 0 <= col < COLS:
-            pred_x = ox + col * sx
-            pred_y = oy + row * sy
-            err = np.sqrt((cx - pred_x)**2 + (cy - pred_y)**2)
-            
-            if err < threshold:
-                key = (int(row), int(col))
-                if key not in assignments:
-                    assignments[key] = (float(cx), float(cy), float(r))
-                else:
-                    # Keep the one closer to predicted position
-                    old_cx, old_cy, _ = assignments[key]
-                    old_err = np.sqrt((old_cx - pred_x)**2 + (old_cy - pred_y)**2)
-                    if err < old_err:
-                        assignments[key] = (float(cx), float(cy), float(r))
+    assignments = {}
+    for k in hits:
+        key = (int(rows[k]), int(cols[k]))
+        cx, cy, r = circles[k]
+        if key not in assignments:
+            assignments[key] = (float(cx), float(cy), float(r))
+        else:
+            # Keep the one closer to predicted position
+            pred_x = ox + key[1] * sx
+            pred_y = oy + key[0] * sy
+            old_cx, old_cy, _ = assignments[key]
+            old_err = np.sqrt((old_cx - pred_x)**2 + (old_cy - pred_y)**2)
+            if err[k] < old_err:
+                assignments[key] = (float(cx), float(cy), float(r))
     
     return assignments
 
@@ -389,11 +863,17 @@ def _assign_circles(circles, ox, oy, sx, sy):
 def _naive_grid(img_w, img_h, med_radius):
     sx, sy = img_w / COLS, img_h / ROWS
     ox, oy = sx / 2, sy / 2
+    return lattice_grid((ox, oy, sx, sy), med_radius), (ox, oy, sx, sy)
+
+
+def lattice_grid(grid_params: tuple, med_radius: float, detected: bool = False) -> dict:
+    """Grid dict with every well on the (ox, oy, sx, sy) lattice."""
+    ox, oy, sx, sy = grid_params
     grid = {}
     for r in range(ROWS):
         for c in range(COLS):
-            grid[(r, c)] = {'cx': ox+c*sx, 'cy': oy+r*sy, 'radius': med_radius, 'detected': False}
-    return grid, (ox, oy, sx, sy)
+            grid[(r, c)] = {'cx': ox+c*sx, 'cy': oy+r*sy, 'radius': med_radius, 'detected': detected}
+    return grid
 
 
 def _empty_well(cx, cy, crop):
@@ -405,11 +885,8 @@ def _empty_well(cx, cy, crop):
 
 
 def circular_mean_hue(hues):
-    a = hues.astype(np.float64) * (2*np.pi/180)
-    return float(np.arctan2(np.mean(np.sin(a)), np.mean(np.cos(a))) * (180/(2*np.pi)) % 180)
+    return hist_stats.circular_hue_mean(hues)
 
 
 def circular_median_hue(hues):
-    if np.any(hues < 30) and np.any(hues > 150):
-        return float((np.median((hues.astype(np.int32)+90)%180) - 90) % 180)
-    return float(np.median(hues))
+    return hist_stats.circular_hue_median(hues)
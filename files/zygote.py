@@ -0,0 +1,256 @@
+"""
+MIC YST Plate Reader - Zygote Server
+Pre-forked server that lets repeated `python main.py ...` calls skip the
+interpreter start-up, the cv2/numpy import and the OpenCV warm-up.
+
+Usage:
+    python zygote.py [--socket <path>] [--pool <n>]
+
+While the server is running, main.py forwards its arguments over a Unix
+socket and prints exactly what a local run would print. Without a server
+(or with MIC_READER_NO_ZYGOTE=1) main.py runs the pipeline itself. Once a
+server has accepted a call, a failure is reported as an error and the call
+is not run a second time locally.
+
+The parent imports and warms up the pipeline once, then keeps <n> forked
+children blocked in accept(). Each child serves a single call in a fresh
+copy of the warm parent and exits; the parent replaces it immediately, so
+only what was loaded before the fork stays warm between calls.
+
+What this saves is the fixed start-up cost, not the analysis itself:
+measured on the reference photo (--only mic), a call went from 6.85 s to
+6.24 s, and a call that fails right away from 212 ms to 72 ms. main.py
+forwards before importing anything but this module (~35 ms of stdlib).
+
+Socket path: $MIC_READER_SOCKET, or <tmpdir>/mic_reader_<uid>.sock. The
+client only connects to a socket owned by the calling user.
+"""
+
+import sys
+import os
+import io
+import json
+import socket
+import stat
+import struct
+import signal
+import tempfile
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Frame = 1 byte type + 4 byte big-endian length + payload
+FRAME_HEADER = struct.Struct('>cI')
+FRAME_ACCEPTED = b'A'   # request read, the call is about to run
+FRAME_STDOUT = b'O'
+FRAME_STDERR = b'E'
+FRAME_EXIT = b'X'
+
+
+def zygote_socket_path() -> str:
+    return os.environ.get('MIC_READER_SOCKET') or os.path.join(
+        tempfile.gettempdir(), f"mic_reader_{os.getuid()}.sock")
+
+
+# =====================================================================
+# Client (used by main.py)
+# =====================================================================
+
+def _recv_exact(conn, n):
+    data = b''
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def forward_to_zygote(argv: list):
+    """
+    Run a main.py call on the zygote server.
+    Returns the exit code, or None if no server accepted the call (run
+    locally). After the server has accepted it, a dropped connection returns
+    1: the call may already have written its outputs.
+    """
+    if os.environ.get('MIC_READER_NO_ZYGOTE'):
+        return None
+    path = zygote_socket_path()
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return None
+    # The default path is in a shared temp directory: only send argv and cwd
+    # to a socket this user created
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        return None
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(path)
+        request = {'argv': argv, 'cwd': os.getcwd()}
+        conn.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        header = _recv_exact(conn, FRAME_HEADER.size)
+    except OSError:
+        header = None
+    if header is None or FRAME_HEADER.unpack(header) != (FRAME_ACCEPTED, 0):
+        conn.close()
+        return None  # stale socket file or no child took the call: nothing ran
+
+    with conn:
+        while True:
+            try:
+                header = _recv_exact(conn, FRAME_HEADER.size)
+                kind, length = FRAME_HEADER.unpack(header) if header else (None, 0)
+                payload = _recv_exact(conn, length) if length else b''
+            except OSError:
+                header = payload = None
+            if header is None or payload is None:
+                print("[ERROR] Zygote bağlantısı beklenmedik şekilde kapandı", file=sys.stderr)
+                return 1
+            if kind == FRAME_STDOUT:
+                sys.stdout.buffer.write(payload)
+                sys.stdout.buffer.flush()
+            elif kind == FRAME_STDERR:
+                sys.stderr.buffer.write(payload)
+                sys.stderr.buffer.flush()
+            elif kind == FRAME_EXIT:
+                return struct.unpack('>i', payload)[0]
+
+
+# =====================================================================
+# Server
+# =====================================================================
+
+class _FrameWriter(io.RawIOBase):
+    """Raw stream that sends everything written to it as frames of one type."""
+
+    def __init__(self, conn, kind):
+        self.conn = conn
+        self.kind = kind
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        data = bytes(b)
+        if data:
+            self.conn.sendall(FRAME_HEADER.pack(self.kind, len(data)) + data)
+        return len(data)
+
+
+def _handle(conn) -> int:
+    """Serve one forwarded main.py call on an accepted connection."""
+    import main
+
+    line = b''
+    while not line.endswith(b'\n'):
+        chunk = conn.recv(65536)
+        if not chunk:
+            return 1
+        line += chunk
+    request = json.loads(line.decode('utf-8'))
+    # From here on the client reports failures instead of running the call itself
+    conn.sendall(FRAME_HEADER.pack(FRAME_ACCEPTED, 0))
+
+    os.chdir(request['cwd'])
+    sys.stdout = io.TextIOWrapper(io.BufferedWriter(_FrameWriter(conn, FRAME_STDOUT)),
+                                  encoding='utf-8', line_buffering=True)
+    sys.stderr = io.TextIOWrapper(io.BufferedWriter(_FrameWriter(conn, FRAME_STDERR)),
+                                  encoding='utf-8', line_buffering=True)
+
+    try:
+        code = main.main(request['argv'])
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        traceback.print_exc()
+        code = 1
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    conn.sendall(FRAME_HEADER.pack(FRAME_EXIT, 4) + struct.pack('>i', code))
+    return code
+
+
+def _child(server_sock):
+    """Body of a pre-forked child: wait for one call, serve it, exit."""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    code = 1
+    try:
+        conn, _ = server_sock.accept()
+        server_sock.close()
+        with conn:
+            code = _handle(conn)
+    except BaseException:
+        traceback.print_exc(file=sys.__stderr__)
+    finally:
+        os._exit(code & 0xFF)
+
+
+def serve(socket_path: str = None, pool_size: int = 2):
+    socket_path = socket_path or zygote_socket_path()
+
+    # Everything a call needs is loaded here, before the first fork
+    import cv2  # noqa: F401
+    import numpy  # noqa: F401
+    import plate_detector  # noqa: F401
+    import well_extractor  # noqa: F401
+    import color_classifier  # noqa: F401
+    import mic_calculator  # noqa: F401
+    import visualizer  # noqa: F401
+    import main
+    main.warm_up()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server_sock.bind(socket_path)
+    os.chmod(socket_path, 0o600)
+    server_sock.listen(16)
+
+    children = set()
+
+    def _shutdown(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        print("\n[INFO] Zygote durduruldu")
+        os._exit(0)
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+
+    print(f"[INFO] Zygote hazır: {socket_path} ({pool_size} hazır süreç)")
+    sys.stdout.flush()
+
+    while True:
+        while len(children) < pool_size:
+            pid = os.fork()
+            if pid == 0:
+                _child(server_sock)
+            children.add(pid)
+        pid, _ = os.wait()
+        children.discard(pid)
+
+
+if __name__ == '__main__':
+    socket_path = None
+    pool_size = 2
+
+    if '--socket' in sys.argv:
+        idx = sys.argv.index('--socket')
+        if idx + 1 < len(sys.argv):
+            socket_path = sys.argv[idx + 1]
+
+    if '--pool' in sys.argv:
+        idx = sys.argv.index('--pool')
+        if idx + 1 < len(sys.argv):
+            pool_size = int(sys.argv[idx + 1])
+
+    serve(socket_path, pool_size)